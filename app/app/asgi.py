@@ -9,8 +9,10 @@ https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+# django's own handler cannot stream the recipe export under asgi
+from core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+os.environ.setdefault('ASYNC_READ_VIEWS', '1')
 
 application = get_asgi_application()
@@ -46,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,16 +80,113 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
+# Connections are kept open for DB_CONN_MAX_AGE seconds and reused by later
+# requests on the same thread. For threaded or ASGI servers set DB_POOL=1 to
+# share a bounded pool of connections between threads instead.
+DB_POOL = os.environ.get('DB_POOL', '0') == '1'
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.backends.postgresql_pool' if DB_POOL
+        else 'django.db.backends.postgresql',
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        # pooled connections go back to the pool at the end of each request
+        'CONN_MAX_AGE': 0 if DB_POOL
+        else int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'POOL': {
+            'MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+            'HEALTH_CHECKS': True,
+        },
+    }
+}
+
+# Ping persistent connections idle for DB_CONN_HEALTH_CHECK_IDLE seconds at
+# the start of a request and reconnect if the server has dropped them
+DB_CONN_HEALTH_CHECKS = os.environ.get('DB_CONN_HEALTH_CHECKS', '1') == '1'
+DB_CONN_HEALTH_CHECK_IDLE = float(
+    os.environ.get('DB_CONN_HEALTH_CHECK_IDLE', 30)
+)
+
+
+REST_FRAMEWORK = {
+    # keyset pagination keeps deep pages as cheap as the first and never
+    # runs a COUNT(*) over the user's rows
+    'DEFAULT_PAGINATION_CLASS': 'recipe.pagination.KeysetPagination',
+    'PAGE_SIZE': int(os.environ.get('API_PAGE_SIZE', 100)),
+}
+
+# In-process cache of token key -> user lookups made by
+# user.authentication.CachedTokenAuthentication. Entries are checked against
+# the user's data version (see DATA_VERSION_STORE) on every request, so
+# deleted tokens and deactivated users are refused by every process.
+# Changes that skip the model signals, such as QuerySet.update() on users or
+# raw SQL, do not bump that version: a revoked token can then keep working
+# for up to TOKEN_CACHE_TTL seconds. Lower it to shrink that window at the
+# cost of more token queries, 0 disables the cache.
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 10000))
+TOKEN_CACHE_TTL = int(os.environ.get('TOKEN_CACHE_TTL', 300))
+
+# Largest batch accepted by the recipe bulk write endpoint
+RECIPE_BULK_MAX_ITEMS = int(os.environ.get('RECIPE_BULK_MAX_ITEMS', 5000))
+
+# Largest recipes x tags (or ingredients) product a bulk assign or unassign
+# may touch, each pair can become a link row in one transaction
+RECIPE_BULK_MAX_LINKS = int(os.environ.get('RECIPE_BULK_MAX_LINKS', 100000))
+
+# Resized recipe image variants are generated on a background thread pool
+RECIPE_IMAGE_ASYNC = True
+RECIPE_IMAGE_WORKERS = int(os.environ.get('RECIPE_IMAGE_WORKERS', 2))
+
+# Per-user data versions (recipe.versions) live in the default cache when
+# it is shared between processes, such as memcached. With the process local
+# LocMemCache they are kept in the database instead, so every process sees
+# every write. DATA_VERSION_STORE ('cache' or 'database') forces either.
+DATA_VERSION_STORE = os.environ.get('DATA_VERSION_STORE') or None
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
     }
 }
 
+# In-process cache of rendered list responses (recipe.mixins.CachedListMixin)
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 1000))
+RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 600))
+RESPONSE_CACHE_MAX_BYTES = int(
+    os.environ.get('RESPONSE_CACHE_MAX_BYTES', 1024 * 1024)
+)
+# bodies kept per process in total, the oldest are evicted past it
+RESPONSE_CACHE_MAX_TOTAL_BYTES = int(
+    os.environ.get('RESPONSE_CACHE_MAX_TOTAL_BYTES', 64 * 1024 * 1024)
+)
+
+
+# Logins check passwords on a dedicated pool of LOGIN_HASH_WORKERS threads.
+# Once LOGIN_HASH_MAX_PENDING checks are queued or running, further login
+# attempts are answered with 429 straight away
+AUTHENTICATION_BACKENDS = ['user.backends.HashingModelBackend']
+LOGIN_HASH_WORKERS = int(os.environ.get('LOGIN_HASH_WORKERS', 2))
+LOGIN_HASH_MAX_PENDING = int(os.environ.get('LOGIN_HASH_MAX_PENDING', 16))
+
+# Serve the recipe list and detail routes from async views that run the
+# request on a pool of ASYNC_VIEW_WORKERS threads. app/asgi.py turns this on;
+# under wsgi it only adds overhead
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS', '0') == '1'
+ASYNC_VIEW_WORKERS = int(os.environ.get('ASYNC_VIEW_WORKERS', 8))
+
+# Per-request timings are aggregated for the metrics endpoint and, unless
+# SERVER_TIMING_HEADER is off, sent back in a Server-Timing header.
+# /metrics/ requires "Authorization: Bearer <METRICS_TOKEN>"; without a
+# token it is only served while DEBUG is on.
+SERVER_TIMING_HEADER = os.environ.get('SERVER_TIMING_HEADER', '1') == '1'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
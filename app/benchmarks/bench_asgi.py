@@ -0,0 +1,185 @@
+'''
+compare latency of the recipe read endpoints served over wsgi and asgi
+
+each server runs in its own process. wsgi requests are handled by a pool
+of --threads worker threads, as a threaded wsgi server would; asgi
+requests are driven straight into the asgi application with async read
+views enabled. every client sends its requests back to back and latency
+includes any time spent queued.
+
+usage: python -m benchmarks.bench_asgi [--clients 32] [--requests 50]
+'''
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.util import setup_testing_defaults
+
+from benchmarks import utils
+
+
+PATHS = (
+    '/api/recipe/recipes/',
+    '/api/recipe/tags/',
+    '/api/recipe/ingredients/',
+)
+QUERY_STRING = 'page_size=20'
+
+
+def percentile(timings, fraction):
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+
+def summary(timings, elapsed):
+    '''return throughput and latency percentiles in milliseconds'''
+    timings.sort()
+    return {
+        'requests_per_second': len(timings) / elapsed,
+        'p50': percentile(timings, 0.5),
+        'p99': percentile(timings, 0.99),
+        'max': timings[-1],
+    }
+
+
+def serve_wsgi(args, token):
+    from django.core.handlers.wsgi import WSGIHandler
+
+    handler = WSGIHandler()
+    workers = ThreadPoolExecutor(max_workers=args.threads)
+
+    def request(path):
+        environ = {
+            'PATH_INFO': path,
+            'QUERY_STRING': QUERY_STRING,
+            'HTTP_AUTHORIZATION': f'Token {token}',
+            'HTTP_HOST': 'testserver',
+        }
+        setup_testing_defaults(environ)
+        response = handler(environ, lambda status, headers: None)
+        b''.join(response)
+        response.close()
+
+    def client(number):
+        timings = []
+        for i in range(args.requests):
+            path = PATHS[(number + i) % len(PATHS)]
+            start = time.perf_counter()
+            workers.submit(request, path).result()
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    with ThreadPoolExecutor(max_workers=args.clients) as clients:
+        start = time.perf_counter()
+        results = list(clients.map(client, range(args.clients)))
+        elapsed = time.perf_counter() - start
+    workers.shutdown()
+    return [t for timings in results for t in timings], elapsed
+
+
+def serve_asgi(args, token):
+    from django.core.asgi import get_asgi_application
+
+    application = get_asgi_application()
+
+    async def request(path):
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'root_path': '',
+            'query_string': QUERY_STRING.encode(),
+            'headers': [
+                (b'host', b'testserver'),
+                (b'authorization', f'Token {token}'.encode()),
+            ],
+            'client': ('127.0.0.1', 50000),
+            'server': ('testserver', 80),
+        }
+        messages = [{'type': 'http.request', 'body': b''}]
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await asyncio.Event().wait()
+
+        async def send(message):
+            pass
+
+        await application(scope, receive, send)
+
+    async def client(number):
+        timings = []
+        for i in range(args.requests):
+            path = PATHS[(number + i) % len(PATHS)]
+            start = time.perf_counter()
+            await request(path)
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    async def run():
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(client(number) for number in range(args.clients))
+        )
+        return results, time.perf_counter() - start
+
+    results, elapsed = asyncio.run(run())
+    return [t for timings in results for t in timings], elapsed
+
+
+def run_server(args):
+    '''seed a test database and print the results of one server as json'''
+    utils.setup()
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from rest_framework.authtoken.models import Token
+
+    with utils.test_database():
+        user = get_user_model().objects.create_user('bench@example.com')
+        utils.seed_recipes(user, args.recipes, 50, 50, 3)
+        token = Token.objects.create(user=user).key
+        connection.close()
+
+        serve = serve_asgi if args.child == 'asgi' else serve_wsgi
+        timings, elapsed = serve(args, token)
+    print(json.dumps(summary(timings, elapsed)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--recipes', type=int, default=1000)
+    parser.add_argument('--child', choices=('wsgi', 'asgi'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_server(args)
+
+    print(f'{args.clients} clients x {args.requests} requests, '
+          f'{args.threads} wsgi threads')
+    for server, async_views in (('wsgi', '0'), ('asgi', '1')):
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_asgi',
+             '--child', server] + sys.argv[1:],
+            env={**os.environ, 'ASYNC_READ_VIEWS': async_views},
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.splitlines()[-1])
+        print(f'{server:<6} {result["requests_per_second"]:9.1f} requests/s  '
+              f'p50 {result["p50"]:8.2f} ms  p99 {result["p99"]:8.2f} ms  '
+              f'max {result["max"]:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+'''
+compare request throughput with new, persistent and pooled connections
+
+each mode runs in its own process because the database settings are read
+at startup. requests go through the wsgi handler from several threads so
+the request_started/request_finished connection handling runs as it would
+under a threaded server. needs postgresql, the pool backend is postgres only.
+
+usage: python -m benchmarks.bench_connections [--threads 8] [--requests 200]
+'''
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+from wsgiref.util import setup_testing_defaults
+
+from benchmarks import utils
+
+
+MODES = {
+    'new connection per request': {'DB_POOL': '0', 'DB_CONN_MAX_AGE': '0'},
+    'persistent connections': {'DB_POOL': '0', 'DB_CONN_MAX_AGE': '60'},
+    'connection pool': {'DB_POOL': '1'},
+}
+
+
+def run_mode(args):
+    '''serve requests with the database settings from the environment'''
+    utils.setup()
+    from django.contrib.auth import get_user_model
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.db import connections
+    from rest_framework.authtoken.models import Token
+
+    with utils.test_database() as connection:
+        user = get_user_model().objects.create_user('bench@example.com')
+        utils.seed_recipes(user, 200, 20, 20, 3)
+        token = Token.objects.create(user=user).key
+        connection.close()
+        handler = WSGIHandler()
+
+        def request():
+            environ = {
+                'PATH_INFO': '/api/recipe/recipes/',
+                'QUERY_STRING': 'page_size=20',
+                'HTTP_AUTHORIZATION': f'Token {token}',
+                'HTTP_HOST': 'testserver',
+            }
+            setup_testing_defaults(environ)
+            response = handler(environ, lambda status, headers: None)
+            b''.join(response)
+            response.close()
+
+        def worker():
+            for _ in range(args.requests):
+                request()
+            connections.close_all()
+
+        request()
+        threads = [threading.Thread(target=worker)
+                   for _ in range(args.threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        if connection.vendor == 'postgresql':
+            from core.backends.postgresql_pool.base import close_idle
+            close_idle()
+    print(args.threads * args.requests / elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_mode(args)
+
+    print(f'{args.threads} threads x {args.requests} requests')
+    for name, env in MODES.items():
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_connections', '--child',
+             '--threads', str(args.threads),
+             '--requests', str(args.requests)],
+            env={**os.environ, **env}, check=True, capture_output=True,
+            text=True,
+        ).stdout
+        rate = float(output.split()[-1])
+        print(f'{name:<40} {rate:9.1f} requests/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+'''
+compare recipe filtering through m2m joins with recipe.filters
+
+usage: python -m benchmarks.bench_filters [--recipes 10000] [--ids 20]
+'''
+import argparse
+import random
+
+from benchmarks import utils
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--recipes', type=int, default=10000)
+    parser.add_argument('--tags', type=int, default=200)
+    parser.add_argument('--per-recipe', type=int, default=5)
+    parser.add_argument('--ids', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    utils.setup()
+    from django.contrib.auth import get_user_model
+    from core.models import Recipe
+    from recipe import filters
+
+    with utils.test_database():
+        user = get_user_model().objects.create_user('bench@example.com')
+        tag_ids, ingredient_ids = utils.seed_recipes(
+            user, args.recipes, args.tags, args.tags, args.per_recipe
+        )
+        rng = random.Random(1)
+        tags = sorted(rng.sample(tag_ids, args.ids))
+        ingredients = sorted(rng.sample(ingredient_ids, args.ids))
+        recipes = Recipe.objects.filter(user=user)
+
+        def run(queryset):
+            return lambda: list(queryset.values_list('id', flat=True))
+
+        print(f'{args.recipes} recipes, {args.ids} ids per filter')
+        cases = [
+            ('join, any tag (duplicates)',
+             recipes.filter(tags__id__in=tags)),
+            ('join, any tag + distinct',
+             recipes.filter(tags__id__in=tags).distinct()),
+            ('join, any tag and ingredient + distinct',
+             recipes.filter(tags__id__in=tags)
+                    .filter(ingredients__id__in=ingredients).distinct()),
+            ('engine, any tag',
+             filters.match_any(recipes, 'tags', tags)),
+            ('engine, any tag and ingredient',
+             filters.filter_recipes(recipes, {
+                 'tags': ','.join(map(str, tags)),
+                 'ingredients': ','.join(map(str, ingredients)),
+             })),
+            ('engine, all of 2 tags',
+             filters.match_all(recipes, 'tags', tags[:2])),
+            ('engine, exclude tags',
+             filters.match_none(recipes, 'tags', tags)),
+        ]
+        for name, queryset in cases:
+            utils.report(name, utils.measure(run(queryset), args.repeat))
+
+
+if __name__ == '__main__':
+    main()
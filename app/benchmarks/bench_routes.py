@@ -0,0 +1,389 @@
+'''
+load test every route of the user and recipe apis
+
+seeds thousands of users owning about a million recipes with
+core.seeding (use --keepdb to
+keep the seeded test database between runs), then sends --requests
+requests per scenario from --clients concurrent client threads straight
+into the wsgi handler. results are written as json: throughput, latency
+percentiles and queries per request (read from the Server-Timing header)
+for each scenario, tagged with the current git commit so runs can be
+compared.
+
+usage: python -m benchmarks.bench_routes [--users 2000] [--recipes 1000000]
+           [--clients 16] [--requests 500] [--only recipe-list]
+           [--keepdb] [--output results.json]
+'''
+import argparse
+import io
+import json
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.util import setup_testing_defaults
+
+from benchmarks import utils
+
+
+QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+EMAIL_PREFIX = 'bench'
+PASSWORD = 'benchmark-password'
+
+
+class Request:
+    '''one http request of a scenario and the status it should get'''
+
+    def __init__(self, method, path, data=None, expect=200,
+                 content_type='application/json', query=''):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.expect = expect
+        if data is None:
+            self.body, self.content_type = b'', ''
+        elif content_type == 'application/json':
+            self.body = json.dumps(data).encode()
+            self.content_type = content_type
+        else:
+            self.body, self.content_type = data, content_type
+
+
+class Dataset:
+    '''ids of the seeded rows, shared read only by every client'''
+
+    def __init__(self, tokens):
+        from core.models import Ingredient, Recipe, Tag
+
+        self.tokens = tokens
+        self.user_ids = sorted(tokens)
+        self.recipes = self._group(Recipe)
+        self.tags = self._group(Tag)
+        self.ingredients = self._group(Ingredient)
+        self.lock = threading.Lock()
+        self.counter = 0
+
+    @staticmethod
+    def _group(model):
+        grouped = {}
+        rows = model.objects.values_list('user_id', 'id').iterator()
+        for user_id, row_id in rows:
+            grouped.setdefault(user_id, []).append(row_id)
+        return grouped
+
+    def unique(self):
+        '''return a number no other request in this run has used'''
+        with self.lock:
+            self.counter += 1
+            return self.counter
+
+
+class Client:
+    '''state of one client thread, acting as a random seeded user'''
+
+    def __init__(self, dataset, seed):
+        self.dataset = dataset
+        self.rng = random.Random(seed)
+
+    def pick_user(self):
+        self.user_id = self.rng.choice(self.dataset.user_ids)
+        self.token = self.dataset.tokens[self.user_id]
+
+    def recipe_id(self):
+        return self.rng.choice(self.dataset.recipes[self.user_id])
+
+    def recipe_ids(self, count):
+        ids = self.dataset.recipes[self.user_id]
+        return self.rng.sample(ids, min(count, len(ids)))
+
+    def sample(self, relation, count):
+        ids = getattr(self.dataset, relation).get(self.user_id, [])
+        return self.rng.sample(ids, min(count, len(ids)))
+
+    def title(self):
+        from core.seeding import random_title
+
+        return random_title(self.rng)
+
+    def word(self):
+        from core.seeding import WORDS
+
+        return self.rng.choice(WORDS)
+
+    def recipe_payload(self):
+        return {
+            'title': self.title(),
+            'time_minutes': self.rng.randint(5, 120),
+            'price': '%.2f' % self.rng.uniform(1, 50),
+            'tags': self.sample('tags', 2),
+            'ingredients': self.sample('ingredients', 3),
+        }
+
+    def new_recipe(self):
+        '''create a recipe outside the timed request and return its id'''
+        from core.models import Recipe
+
+        return Recipe.objects.create(
+            user_id=self.user_id, title='benchmark scratch recipe',
+            time_minutes=5, price=1,
+        ).id
+
+
+def _jpeg():
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (800, 600), (200, 120, 40)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def upload_image(client):
+    '''return a multipart request uploading a jpeg to one of the recipes'''
+    from django.test.client import BOUNDARY, MULTIPART_CONTENT, \
+        encode_multipart
+
+    image = io.BytesIO(client.dataset.jpeg)
+    image.name = 'image.jpg'
+    return Request(
+        'POST', f'{RECIPES}{client.recipe_id()}/upload-image/',
+        encode_multipart(BOUNDARY, {'image': image}),
+        content_type=MULTIPART_CONTENT,
+    )
+
+
+RECIPES = '/api/recipe/recipes/'
+
+# scenario name -> (route name, function building the request for a client)
+SCENARIOS = {
+    'recipe-api-root': ('recipe:api-root', lambda c: Request(
+        'GET', '/api/recipe/')),
+    'tag-list': ('recipe:tag-list', lambda c: Request(
+        'GET', '/api/recipe/tags/')),
+    'tag-list assigned': ('recipe:tag-list', lambda c: Request(
+        'GET', '/api/recipe/tags/', query='assigned_only=1')),
+    'tag-create': ('recipe:tag-list', lambda c: Request(
+        'POST', '/api/recipe/tags/',
+        {'name': 'tag %d' % c.dataset.unique()}, expect=201)),
+    'ingredient-list': ('recipe:ingredient-list', lambda c: Request(
+        'GET', '/api/recipe/ingredients/')),
+    'ingredient-list prefix': ('recipe:ingredient-list', lambda c: Request(
+        'GET', '/api/recipe/ingredients/',
+        query='q=ingredient+%d' % c.rng.randint(1, 9))),
+    'ingredient-create': ('recipe:ingredient-list', lambda c: Request(
+        'POST', '/api/recipe/ingredients/',
+        {'name': 'ingredient %d' % c.dataset.unique()}, expect=201)),
+    'recipe-list': ('recipe:recipe-list', lambda c: Request(
+        'GET', RECIPES)),
+    'recipe-list filtered': ('recipe:recipe-list', lambda c: Request(
+        'GET', RECIPES, query='tags=%s' % ','.join(
+            map(str, c.sample('tags', 3))))),
+    'recipe-list search': ('recipe:recipe-list', lambda c: Request(
+        'GET', RECIPES, query='search=%s' % c.word()[:4])),
+    'recipe-create': ('recipe:recipe-list', lambda c: Request(
+        'POST', RECIPES, c.recipe_payload(), expect=201)),
+    'recipe-detail': ('recipe:recipe-detail', lambda c: Request(
+        'GET', f'{RECIPES}{c.recipe_id()}/')),
+    'recipe-update': ('recipe:recipe-detail', lambda c: Request(
+        'PUT', f'{RECIPES}{c.recipe_id()}/', c.recipe_payload())),
+    'recipe-partial-update': ('recipe:recipe-detail', lambda c: Request(
+        'PATCH', f'{RECIPES}{c.recipe_id()}/',
+        {'title': c.title()})),
+    'recipe-delete': ('recipe:recipe-detail', lambda c: Request(
+        'DELETE', f'{RECIPES}{c.new_recipe()}/', expect=204)),
+    'recipe-upload-image': ('recipe:recipe-upload-image', upload_image),
+    'recipe-bulk-write': ('recipe:recipe-bulk-write', lambda c: Request(
+        'POST', f'{RECIPES}bulk/',
+        [c.recipe_payload() for _ in range(50)], expect=201)),
+    'recipe-bulk-assign': ('recipe:recipe-bulk-assign', lambda c: Request(
+        'POST', f'{RECIPES}bulk/assign/',
+        {'recipes': c.recipe_ids(50), 'tags': c.sample('tags', 2)})),
+    'recipe-bulk-unassign': ('recipe:recipe-bulk-unassign', lambda c: Request(
+        'POST', f'{RECIPES}bulk/unassign/',
+        {'recipes': c.recipe_ids(50), 'tags': c.sample('tags', 2)})),
+    'recipe-bulk-delete': ('recipe:recipe-bulk-delete', lambda c: Request(
+        'POST', f'{RECIPES}bulk/delete/',
+        {'recipes': [c.new_recipe() for _ in range(10)]})),
+    'recipe-export': ('recipe:recipe-export', lambda c: Request(
+        'GET', f'{RECIPES}export/', query='format=ndjson')),
+    'recipe-stats': ('recipe:recipe-stats', lambda c: Request(
+        'GET', f'{RECIPES}stats/')),
+    'user-create': ('user:create', lambda c: Request(
+        'POST', '/api/user/create/',
+        {'email': 'new%d@example.com' % c.dataset.unique(),
+         'password': 'password', 'name': 'New'}, expect=201)),
+    'user-token': ('user:token', lambda c: Request(
+        'POST', '/api/user/token/',
+        {'email': '%s%d@example.com' % (EMAIL_PREFIX, c.user_id),
+         'password': PASSWORD})),
+    'user-me': ('user:me', lambda c: Request('GET', '/api/user/me/')),
+    'user-me-update': ('user:me', lambda c: Request(
+        'PATCH', '/api/user/me/', {'name': 'User %d' % c.dataset.unique()})),
+}
+
+
+def route_names():
+    '''return the names of every route in the recipe and user urls'''
+    from recipe.urls import urlpatterns as recipe_urls
+    from user.urls import urlpatterns as user_urls
+
+    names = {'user:%s' % url.name for url in user_urls}
+    for url in recipe_urls:
+        names.update('recipe:%s' % pattern.name
+                     for pattern in url.url_patterns)
+    return names
+
+
+def run_scenario(handler, dataset, build, clients, requests):
+    '''send requests from concurrent clients and summarise the results'''
+    def send(client):
+        client.pick_user()
+        request = build(client)
+        environ = {
+            'REQUEST_METHOD': request.method,
+            'PATH_INFO': request.path,
+            'QUERY_STRING': request.query,
+            'HTTP_HOST': 'testserver',
+            'HTTP_AUTHORIZATION': f'Token {client.token}',
+            'CONTENT_TYPE': request.content_type,
+            'CONTENT_LENGTH': str(len(request.body)),
+            'wsgi.input': io.BytesIO(request.body),
+        }
+        setup_testing_defaults(environ)
+        status = []
+        start = time.perf_counter()
+        response = handler(
+            environ, lambda line, headers: status.append((line, headers))
+        )
+        b''.join(response)
+        response.close()
+        elapsed = (time.perf_counter() - start) * 1000
+        line, headers = status[0]
+        match = QUERIES.search(dict(headers).get('Server-Timing', ''))
+        queries = int(match.group(1)) if match else 0
+        return elapsed, int(line.split()[0]) == request.expect, queries
+
+    def worker(number):
+        client = Client(dataset, seed=number)
+        results = [send(client) for _ in range(requests // clients)]
+        from django.db import connections
+        connections.close_all()
+        return results
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        batches = list(pool.map(worker, range(clients)))
+    wall = time.perf_counter() - started
+
+    results = [result for batch in batches for result in batch]
+    timings = sorted(elapsed for elapsed, _ok, _queries in results)
+
+    def percentile(fraction):
+        return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+    return {
+        'requests': len(results),
+        'errors': sum(not ok for _elapsed, ok, _queries in results),
+        'requests_per_second': len(results) / wall,
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'max_ms': timings[-1],
+        'queries_per_request': sum(
+            queries for _elapsed, _ok, queries in results
+        ) / len(results),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--recipes', type=int, default=1000000)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--only', action='append', default=[],
+                        help='run the scenarios containing this text')
+    parser.add_argument('--keepdb', action='store_true')
+    parser.add_argument('--output', help='write json here, not stdout')
+    args = parser.parse_args()
+
+    utils.setup()
+    from django.contrib.auth import get_user_model
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.core.management import call_command
+    from rest_framework.authtoken.models import Token
+    from core.seeding import Seeder
+
+    scenarios = {
+        name: scenario for name, scenario in SCENARIOS.items()
+        if not args.only or any(text in name for text in args.only)
+    }
+    missing = route_names() - {route for route, _build in SCENARIOS.values()}
+    if missing:
+        print('routes without a scenario: %s' % ', '.join(sorted(missing)),
+              file=sys.stderr)
+
+    with utils.test_database(keepdb=args.keepdb) as connection:
+        if not get_user_model().objects.filter(
+                email__startswith=EMAIL_PREFIX).exists():
+            Seeder(
+                users=args.users, recipes=args.recipes, tags=50,
+                ingredients=50, distribution='pareto', password=PASSWORD,
+                email_prefix=EMAIL_PREFIX,
+                log=lambda message: print(message, file=sys.stderr),
+            ).run()
+            for command in ('rebuild_recipe_documents',
+                            'rebuild_recipe_stats'):
+                call_command(command, missing=True, stdout=sys.stderr)
+        tokens = dict(Token.objects.filter(
+            user__email__startswith=EMAIL_PREFIX
+        ).values_list('user_id', 'key'))
+        dataset = Dataset(tokens)
+        dataset.jpeg = _jpeg()
+        connection.close()
+        handler = WSGIHandler()
+
+        results = {}
+        for name, (route, build) in scenarios.items():
+            print(f'running {name}...', file=sys.stderr)
+            results[name] = dict(
+                route=route,
+                **run_scenario(handler, dataset, build,
+                               args.clients, args.requests),
+            )
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'database': connection.vendor,
+        'dataset': {
+            'users': len(dataset.user_ids),
+            'recipes': sum(map(len, dataset.recipes.values())),
+        },
+        'clients': args.clients,
+        'scenarios': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
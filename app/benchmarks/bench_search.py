@@ -0,0 +1,49 @@
+'''
+compare title search through recipe.search with a LIKE scan
+
+usage: python -m benchmarks.bench_search [--recipes 100000]
+'''
+import argparse
+
+from benchmarks import utils
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--recipes', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    utils.setup()
+    from django.contrib.auth import get_user_model
+    from core.models import Recipe
+    from recipe.search import search_recipes
+
+    with utils.test_database():
+        user = get_user_model().objects.create_user('bench@example.com')
+        utils.seed_recipes(user, args.recipes, 10, 10, 1)
+        recipes = Recipe.objects.filter(user=user)
+
+        def run(queryset):
+            return lambda: list(queryset.values_list('id', flat=True)[:100])
+
+        print(f'{args.recipes} recipes, first 100 matches')
+        cases = [
+            ('icontains, one word',
+             recipes.filter(title__icontains='curry').order_by('-id')),
+            ('icontains, two words',
+             recipes.filter(title__icontains='curry')
+                    .filter(title__icontains='rice').order_by('-id')),
+            ('full text, one word ranked',
+             search_recipes(recipes, 'curry').order_by('-rank', '-id')),
+            ('full text, two words ranked',
+             search_recipes(recipes, 'curry rice').order_by('-rank', '-id')),
+            ('full text, prefix ranked',
+             search_recipes(recipes, 'mush').order_by('-rank', '-id')),
+        ]
+        for name, queryset in cases:
+            utils.report(name, utils.measure(run(queryset), args.repeat))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+'''
+compare RecipeSerializer with the values() row path in recipe.rows
+
+usage: python -m benchmarks.bench_serialization [--recipes 5000]
+'''
+import argparse
+
+from benchmarks import utils
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--recipes', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    utils.setup()
+    from django.contrib.auth import get_user_model
+    from core.models import Recipe, Tag
+    from recipe import rows
+    from recipe.serializers import RecipeSerializer, TagSerializer
+
+    with utils.test_database():
+        user = get_user_model().objects.create_user('bench@example.com')
+        utils.seed_recipes(user, args.recipes, args.recipes // 5, 100, 3)
+        recipes = Recipe.objects.filter(user=user).order_by('-id')
+        tags = Tag.objects.filter(user=user).order_by('-name', '-id')
+
+        def serializer():
+            return RecipeSerializer(
+                recipes.prefetch_related('tags', 'ingredients'), many=True
+            ).data
+
+        def row_path():
+            return rows.recipe_rows(list(recipes.values(*rows.RECIPE_FIELDS)))
+
+        def tag_serializer():
+            return TagSerializer(tags, many=True).data
+
+        def tag_rows():
+            return rows.attribute_rows(
+                list(tags.values(*rows.ATTRIBUTE_FIELDS))
+            )
+
+        print(f'{args.recipes} recipes, {args.recipes // 5} tags')
+        for name, slow, fast in (
+                ('recipes', serializer, row_path),
+                ('tags', tag_serializer, tag_rows)):
+            before = utils.measure(slow, args.repeat)
+            after = utils.measure(fast, args.repeat)
+            utils.report(f'{name}: serializer', before)
+            utils.report(f'{name}: rows', after)
+            print(f'{name}: {before["median"] / after["median"]:.1f}x faster')
+
+
+if __name__ == '__main__':
+    main()
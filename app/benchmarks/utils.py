@@ -0,0 +1,117 @@
+'''
+shared helpers for the scripts in this package
+
+each benchmark runs against a throwaway test database created from the
+configured settings, so run them from the app directory with the same
+environment as the server, e.g. `python -m benchmarks.bench_filters`.
+'''
+import contextlib
+import io
+import os
+import random
+import statistics
+import time
+
+import django
+
+
+def setup():
+    '''configure django for a standalone script'''
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+    django.setup()
+
+
+@contextlib.contextmanager
+def test_database(keepdb=False):
+    '''create a test database for the duration of the block'''
+    from django.db import connection
+    from django.test.utils import (
+        setup_test_environment, teardown_test_environment
+    )
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, keepdb=keepdb
+    )
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(
+            old_name, verbosity=0, keepdb=keepdb
+        )
+        teardown_test_environment()
+
+
+def measure(func, repeat=20, warmup=2):
+    '''call func repeatedly and return its timings in milliseconds'''
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'min': timings[0],
+        'median': statistics.median(timings),
+        'p95': timings[int(len(timings) * 0.95) - 1],
+    }
+
+
+def report(name, timings):
+    '''print one line of timings'''
+    print(f'{name:<40} min {timings["min"]:9.2f} ms  '
+          f'median {timings["median"]:9.2f} ms  '
+          f'p95 {timings["p95"]:9.2f} ms')
+
+
+def seed_recipes(user, recipes, tags, ingredients, per_recipe, seed=0):
+    '''
+    bulk create recipes for user linked to random tags and ingredients
+
+    returns the created tag and ingredient ids.
+    '''
+    from django.core.management import call_command
+    from core.models import Ingredient, Recipe, Tag
+    from core.seeding import random_title
+
+    rng = random.Random(seed)
+    Tag.objects.bulk_create(
+        Tag(user=user, name=f'tag {i}') for i in range(tags)
+    )
+    Ingredient.objects.bulk_create(
+        Ingredient(user=user, name=f'ingredient {i}')
+        for i in range(ingredients)
+    )
+    Recipe.objects.bulk_create(
+        (Recipe(user=user, title=random_title(rng), time_minutes=i % 120,
+                price=i % 100) for i in range(recipes)),
+        batch_size=2000,
+    )
+    tag_ids = list(Tag.objects.filter(user=user).values_list('id', flat=True))
+    ingredient_ids = list(
+        Ingredient.objects.filter(user=user).values_list('id', flat=True)
+    )
+    recipe_ids = Recipe.objects.filter(user=user).values_list('id', flat=True)
+
+    tag_links = []
+    ingredient_links = []
+    for recipe_id in recipe_ids:
+        for tag_id in rng.sample(tag_ids, per_recipe):
+            tag_links.append(
+                Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            )
+        for ingredient_id in rng.sample(ingredient_ids, per_recipe):
+            ingredient_links.append(Recipe.ingredients.through(
+                recipe_id=recipe_id, ingredient_id=ingredient_id
+            ))
+    Recipe.tags.through.objects.bulk_create(tag_links, batch_size=5000)
+    Recipe.ingredients.through.objects.bulk_create(
+        ingredient_links, batch_size=5000
+    )
+    call_command(
+        'rebuild_recipe_documents', missing=True, stdout=io.StringIO()
+    )
+    return tag_ids, ingredient_ids
@@ -1,5 +1,15 @@
 from django.apps import AppConfig
+from django.core.signals import request_finished, request_started
+from django.db.backends.signals import connection_created
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        '''check reused connections and time queries on new connections'''
+        from core.db import check_connections, mark_connections_used
+        from core.timing import install_query_timer
+        request_started.connect(check_connections)
+        request_finished.connect(mark_connections_used)
+        connection_created.connect(install_query_timer)
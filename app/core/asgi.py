@@ -0,0 +1,61 @@
+'''
+asgi handler that can stream responses built from the database
+
+django 3.1 iterates streaming responses on the event loop, so a streaming
+body that queries as it goes, like the recipe export, raises
+SynchronousOnlyOperation there. this handler pulls each part on the
+thread sync views run on instead, which also keeps a server side cursor
+on the connection that opened it.
+'''
+import django
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+
+
+class StreamingASGIHandler(ASGIHandler):
+    '''asgi handler that iterates streaming responses off the event loop'''
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        response_headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            response_headers.append((bytes(header), bytes(value)))
+        for cookie in response.cookies.values():
+            response_headers.append(
+                (b'Set-Cookie', cookie.output(header='').encode('ascii')
+                 .strip())
+            )
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': response_headers,
+        })
+
+        parts = iter(response)
+        next_part = sync_to_async(next, thread_sensitive=True)
+        try:
+            while True:
+                part = await next_part(parts, None)
+                if part is None:
+                    break
+                for chunk, _last in self.chunk_bytes(part):
+                    await send({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True,
+                    })
+            await send({'type': 'http.response.body'})
+        finally:
+            await sync_to_async(response.close, thread_sensitive=True)()
+
+
+def get_asgi_application():
+    '''set up django and return the streaming aware asgi handler'''
+    django.setup(set_prefix=False)
+    return StreamingASGIHandler()
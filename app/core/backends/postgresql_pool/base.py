@@ -0,0 +1,133 @@
+import threading
+
+import psycopg2.extensions
+import psycopg2.extras
+from django.db.backends.postgresql import base
+from django.utils.asyncio import async_unsafe
+
+from core.metrics import registry
+from core.pool import ConnectionPool, PoolTimeout
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def pool_stats():
+    '''return the stats of every pool keyed by database alias'''
+    with _pools_lock:
+        pools = dict(_pools)
+    return {alias: pool.stats() for alias, pool in pools.items()}
+
+
+@registry.register
+def collect_pool_stats():
+    '''export the stats of every pool labelled with its alias'''
+    counters = ('created', 'reused', 'waits', 'timeouts', 'discarded')
+    samples = {}
+    for alias, stats in pool_stats().items():
+        for key, value in stats.items():
+            samples.setdefault(key, []).append(({'alias': alias}, value))
+    for key, values in samples.items():
+        if key in counters:
+            name, kind = 'db_pool_%s_total' % key, 'counter'
+        else:
+            name, kind = 'db_pool_%s' % key, 'gauge'
+        yield name, kind, 'Database connection pool %s' % key, values
+
+
+def close_idle():
+    '''close the idle connections of every pool, e.g. before a drop'''
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_idle()
+
+
+def _connect(conn_params):
+    '''open a connection the way the stock postgresql backend does'''
+    connection = base.Database.connect(**conn_params)
+    psycopg2.extras.register_default_jsonb(
+        conn_or_curs=connection, loads=lambda x: x
+    )
+    return connection
+
+
+def _is_open(connection):
+    return not connection.closed
+
+
+def _is_alive(connection):
+    '''check a connection still answers before reusing it'''
+    if connection.closed:
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except psycopg2.Error:
+        return False
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    '''
+    postgresql backend that borrows connections from an in-process pool
+
+    closing a connection hands it back to the pool rather than ending the
+    session, so set CONN_MAX_AGE to 0 and every request returns its
+    connection when it finishes. the pool is configured by the POOL key of
+    the database settings: MAX_SIZE, TIMEOUT (seconds to wait for a free
+    connection) and HEALTH_CHECKS (ping idle connections before reuse).
+    '''
+
+    def get_pool(self, conn_params):
+        '''return the pool for this alias, creating it on first use'''
+        with _pools_lock:
+            pool = _pools.get(self.alias)
+            if pool is None:
+                options = self.settings_dict.get('POOL', {})
+                health_checks = options.get('HEALTH_CHECKS', True)
+                pool = _pools[self.alias] = ConnectionPool(
+                    connect=lambda: _connect(conn_params),
+                    max_size=options.get('MAX_SIZE', 10),
+                    timeout=options.get('TIMEOUT', 5),
+                    is_usable=_is_alive if health_checks else _is_open,
+                )
+        return pool
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        try:
+            connection = self.get_pool(conn_params).acquire()
+        except PoolTimeout as exc:
+            raise base.Database.OperationalError(str(exc)) from exc
+
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        pool = _pools.get(self.alias)
+        if pool is None:
+            return super()._close()
+
+        connection = self.connection
+        if connection.closed:
+            pool.discard(connection)
+            return
+        try:
+            status = connection.get_transaction_status()
+            if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+        except psycopg2.Error:
+            pool.discard(connection)
+            return
+        pool.release(connection)
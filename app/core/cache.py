@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    '''
+    thread safe in-process mapping bounded by size and entry age
+
+    the least recently used entry is evicted once max_size is reached and
+    entries older than ttl seconds are treated as missing. when max_bytes
+    is given, sizeof(value) is also kept under it in total, and a value
+    bigger than the whole budget is not stored at all.
+    '''
+
+    def __init__(self, max_size, ttl=None, timer=time.monotonic,
+                 max_bytes=None, sizeof=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof or (lambda value: 0)
+        self._timer = timer
+        # key -> (expiry, value, size)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _pop(self, key):
+        _expires, _value, size = self._data.pop(key)
+        self._bytes -= size
+
+    def _full(self):
+        if len(self._data) > self.max_size:
+            return True
+        return self.max_bytes is not None and self._bytes > self.max_bytes
+
+    def get(self, key, default=None):
+        '''return the value for key, refreshing its recency'''
+        with self._lock:
+            try:
+                expires, value, _size = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires <= self._timer():
+                self._pop(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        '''store value under key, evicting the oldest entries if full'''
+        expires = None
+        if self.ttl is not None:
+            expires = self._timer() + self.ttl
+        size = self._sizeof(value)
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._data[key] = (expires, value, size)
+            self._bytes += size
+            while self._full():
+                self._pop(next(iter(self._data)))
+                self.evictions += 1
+
+    def delete(self, key):
+        '''remove key if present'''
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+
+    def delete_where(self, predicate):
+        '''remove every entry for which predicate(key, value) is true'''
+        with self._lock:
+            stale = [
+                key for key, (_expires, value, _size) in self._data.items()
+                if predicate(key, value)
+            ]
+            for key in stale:
+                self._pop(key)
+        return len(stale)
+
+    def clear(self):
+        '''remove every entry and reset the counters'''
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        '''return the hit, miss and eviction counters with the size'''
+        with self._lock:
+            stats = {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._data),
+                'max_size': self.max_size,
+            }
+            if self.max_bytes is not None:
+                stats['bytes'] = self._bytes
+                stats['max_bytes'] = self.max_bytes
+            return stats
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,36 @@
+import time
+
+from django.conf import settings
+from django.db import connections
+
+
+def check_connections(**kwargs):
+    '''
+    close reused connections that stopped working before a request runs
+
+    persistent connections (CONN_MAX_AGE > 0) can be dropped by the server
+    or a proxy while idle. checking them up front turns that into a fresh
+    connection instead of a failed request. only connections idle for
+    DB_CONN_HEALTH_CHECK_IDLE seconds are pinged, so busy workers do not
+    pay a round trip on every request.
+    '''
+    if not settings.DB_CONN_HEALTH_CHECKS:
+        return
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        last_used = getattr(connection, 'last_used', None)
+        if last_used is not None and \
+                now - last_used < settings.DB_CONN_HEALTH_CHECK_IDLE:
+            continue
+        if not connection.is_usable():
+            connection.close()
+
+
+def mark_connections_used(**kwargs):
+    '''remember when the connections still open after a request were used'''
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is not None:
+            connection.last_used = now
@@ -0,0 +1,77 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Saturated(Exception):
+    '''raised when a bounded executor already holds its maximum backlog'''
+
+
+class BoundedExecutor:
+    '''
+    thread pool that refuses work instead of queueing without limit
+
+    at most max_pending calls are queued or running at once. submit() raises
+    Saturated straight away once that many are outstanding, so callers can
+    shed load instead of piling up behind a long queue.
+    '''
+
+    def __init__(self, max_workers, max_pending, thread_name_prefix=''):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=thread_name_prefix
+        )
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def submit(self, func, *args, **kwargs):
+        '''schedule func and return its future, or raise Saturated'''
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise Saturated(
+                '%s calls already pending' % self.max_pending
+            )
+        with self._lock:
+            self._pending += 1
+
+        def call():
+            with self._lock:
+                self._running += 1
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._pending -= 1
+                    self.completed += 1
+                self._slots.release()
+
+        try:
+            return self._executor.submit(call)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+            raise
+
+    def run(self, func, *args, **kwargs):
+        '''call func on the pool and wait for its result'''
+        return self.submit(func, *args, **kwargs).result()
+
+    def stats(self):
+        '''return the executor's gauges and counters'''
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'pending': self._pending,
+                'queued': self._pending - self._running,
+                'running': self._running,
+                'completed': self.completed,
+                'rejected': self.rejected,
+            }
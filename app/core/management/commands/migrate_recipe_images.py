@@ -0,0 +1,121 @@
+import posixpath
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+
+from core.models import RECIPE_IMAGE_DIRECTORY, Recipe, StoredFile, \
+    image_storage
+from recipe import documents, images
+from recipe.signals import recipes_changed
+
+
+CONTENT_NAME = r'^%s[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.[^/]+$' % \
+    RECIPE_IMAGE_DIRECTORY
+
+
+class Command(BaseCommand):
+    '''django command to move recipe images to content addressed names'''
+    help = (
+        'Move recipe images stored under random names to names derived from '
+        'their content, sharing one file between identical images, then '
+        'recount how many recipes use each image.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='only report the images that would move')
+        parser.add_argument('--keep-old', action='store_true',
+                            help='leave the old files in place')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='recipes migrated per batch')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        recipes = Recipe.objects.exclude(image__isnull=True).exclude(
+            image=''
+        ).exclude(image__regex=CONTENT_NAME).order_by('id')
+
+        moved = missing = 0
+        last = 0
+        while True:
+            batch = list(recipes.filter(id__gt=last).values_list(
+                'id', 'user_id', 'image', 'image_variants'
+            )[:options['batch_size']])
+            if not batch:
+                break
+            last = batch[-1][0]
+            if options['dry_run']:
+                for _id, _user_id, name, _variants in batch:
+                    self.stdout.write(name)
+                moved += len(batch)
+                continue
+
+            migrated = []
+            for recipe_id, user_id, name, variants in batch:
+                if not image_storage.exists(name):
+                    self.stderr.write('Missing image %s' % name)
+                    missing += 1
+                    continue
+                self._migrate(recipe_id, name, variants, options['keep_old'])
+                migrated.append((recipe_id, user_id))
+            documents.refresh(recipe_id for recipe_id, _user in migrated)
+            for user_id in {user_id for _recipe, user_id in migrated}:
+                recipes_changed.send(sender=Recipe, user_id=user_id)
+            moved += len(migrated)
+            if options['verbosity'] > 1:
+                self.stdout.write('%d images, up to recipe %d' % (
+                    moved, last
+                ))
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                'Would migrate %d recipe images' % moved
+            ))
+            return
+
+        counted = self._recount()
+        self.stdout.write(self.style.SUCCESS(
+            'Migrated %d recipe images, %d missing, %d stored files' % (
+                moved, missing, counted
+            )
+        ))
+
+    def _migrate(self, recipe_id, name, variants, keep_old):
+        '''store one recipe's image and variants under their new names'''
+        with image_storage.open(name, 'rb') as image_file:
+            new_name = image_storage.save(posixpath.join(
+                RECIPE_IMAGE_DIRECTORY, posixpath.basename(name)
+            ), image_file)
+
+        new_variants = {}
+        for variant, old_variant in variants.items():
+            new_variant = images.variant_name(new_name, variant)
+            if not image_storage.exists(new_variant) and \
+                    image_storage.exists(old_variant):
+                with image_storage.open(old_variant, 'rb') as variant_file:
+                    image_storage.save_as(new_variant, variant_file)
+            if image_storage.exists(new_variant):
+                new_variants[variant] = new_variant
+
+        Recipe.objects.filter(pk=recipe_id, image=name).update(
+            image=new_name, image_variants=new_variants
+        )
+        if not keep_old:
+            image_storage.delete(name)
+            images.discard_variants(variants)
+
+    def _recount(self):
+        '''count the recipes using each stored image from scratch'''
+        counts = Recipe.objects.exclude(image__isnull=True).exclude(
+            image=''
+        ).values_list('image').annotate(count=Count('id')).order_by()
+        with transaction.atomic():
+            StoredFile.objects.all().delete()
+            StoredFile.objects.bulk_create(
+                StoredFile(name=name, references=count)
+                for name, count in counts
+            )
+        return StoredFile.objects.count()
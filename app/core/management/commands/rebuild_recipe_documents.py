@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Recipe
+from recipe import documents
+
+
+class Command(BaseCommand):
+    '''django command to rebuild the precomputed recipe documents'''
+    help = (
+        'Rebuild the stored read document of every recipe, or only of the '
+        'recipes without one.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true',
+                            help='only build documents that do not exist')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='recipes rebuilt per transaction')
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        using = options['database']
+        recipes = Recipe.objects.using(using).order_by('id')
+        if options['missing']:
+            recipes = recipes.filter(document__isnull=True)
+
+        rebuilt = 0
+        last = 0
+        while True:
+            batch = list(recipes.filter(id__gt=last).values_list(
+                'id', flat=True
+            )[:options['batch_size']])
+            if not batch:
+                break
+            rebuilt += documents.refresh(batch, using=using)
+            last = batch[-1]
+            if options['verbosity'] > 1:
+                self.stdout.write('%d documents, up to recipe %d' % (
+                    rebuilt, last
+                ))
+
+        self.stdout.write(self.style.SUCCESS(
+            'Rebuilt %d recipe documents' % rebuilt
+        ))
@@ -0,0 +1,50 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import RecipeStats
+from recipe import stats
+
+
+class Command(BaseCommand):
+    '''django command to recount the recipe stats counters'''
+    help = (
+        'Recount the recipe, tag and ingredient counters of every user, or '
+        'only of the users who have not been counted yet.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true',
+                            help='only count users without counters')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='users recounted per transaction')
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        using = options['database']
+        users = get_user_model().objects.using(using).order_by('id')
+        if options['missing']:
+            users = users.exclude(id__in=RecipeStats.objects.using(
+                using
+            ).values('user_id'))
+
+        rebuilt = 0
+        last = 0
+        while True:
+            batch = list(users.filter(id__gt=last).values_list(
+                'id', flat=True
+            )[:options['batch_size']])
+            if not batch:
+                break
+            rebuilt += stats.rebuild(batch, using=using)
+            last = batch[-1]
+            if options['verbosity'] > 1:
+                self.stdout.write('%d users, up to user %d' % (
+                    rebuilt, last
+                ))
+
+        self.stdout.write(self.style.SUCCESS(
+            'Recounted the recipe stats of %d users' % rebuilt
+        ))
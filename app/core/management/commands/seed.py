@@ -0,0 +1,78 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from core.seeding import DISTRIBUTIONS, METHODS, Seeder
+
+
+class Command(BaseCommand):
+    '''django command to fill the database with synthetic data'''
+    help = (
+        'Bulk create users with tags, ingredients, recipes and the links '
+        'between them. Every user logs in with --password.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=100000,
+                            help='total recipes across all users')
+        parser.add_argument('--tags', type=int, default=20,
+                            help='tags per user')
+        parser.add_argument('--ingredients', type=int, default=30,
+                            help='ingredients per user')
+        parser.add_argument('--tags-per-recipe', type=int, default=3)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=5)
+        parser.add_argument('--distribution', choices=DISTRIBUTIONS,
+                            default='uniform',
+                            help='how recipes are split between users')
+        parser.add_argument('--skew', type=float, default=1.5,
+                            help='pareto shape, lower is more skewed')
+        parser.add_argument('--password', default='password')
+        parser.add_argument('--no-tokens', action='store_false',
+                            dest='tokens', help='skip creating auth tokens')
+        parser.add_argument('--email-prefix', default='seed')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='random seed, for repeatable data')
+        parser.add_argument('--block-size', type=int, default=1000,
+                            help='users written per transaction')
+        parser.add_argument('--method', choices=METHODS, default='auto',
+                            help='COPY (postgresql only), executemany() '
+                                 'INSERTs or bulk_create')
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        if options['users'] < 0 or options['recipes'] < 0:
+            raise CommandError('--users and --recipes must not be negative')
+
+        seeder = Seeder(
+            users=options['users'],
+            recipes=options['recipes'],
+            tags=options['tags'],
+            ingredients=options['ingredients'],
+            tags_per_recipe=options['tags_per_recipe'],
+            ingredients_per_recipe=options['ingredients_per_recipe'],
+            distribution=options['distribution'],
+            skew=options['skew'],
+            password=options['password'],
+            tokens=options['tokens'],
+            email_prefix=options['email_prefix'],
+            seed=options['seed'],
+            block_size=options['block_size'],
+            method=options['method'],
+            using=options['database'],
+            log=self.stdout.write if options['verbosity'] > 1 else None,
+        )
+        if seeder.method == 'copy' and \
+                seeder.connection.vendor != 'postgresql':
+            raise CommandError('--method copy needs postgresql')
+
+        written = seeder.run()
+        for table, count in sorted(written.items()):
+            self.stdout.write('%-30s %d rows' % (table, count))
+        # the seeder writes recipes without their read documents and
+        # stats counters
+        for command in ('rebuild_recipe_documents', 'rebuild_recipe_stats'):
+            call_command(
+                command, missing=True, database=options['database'],
+                verbosity=options['verbosity'], stdout=self.stdout,
+            )
+        self.stdout.write(self.style.SUCCESS('Seeded database!'))
@@ -0,0 +1,155 @@
+'''
+in-process metrics rendered in the prometheus text format
+
+histograms are aggregated per process, so with several server processes
+each one is scraped separately. stats that already live elsewhere (cache
+and pool counters) are exported by registering a collector that reads them
+at scrape time.
+'''
+import threading
+from bisect import bisect_left
+
+
+DURATION_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n') \
+        .replace('"', r'\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, _escape(_format_value(value)))
+        for name, value in labels
+    )
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    '''thread safe histogram with fixed buckets and a fixed set of labels'''
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        '''record one observation for the given label values'''
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                # one count per bucket plus +Inf, then the running sum
+                series = self._series[labelvalues] = \
+                    [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self):
+        '''yield (suffix, labels, value) for every series'''
+        with self._lock:
+            series = {labels: list(counts)
+                      for labels, counts in self._series.items()}
+        for labelvalues, counts in sorted(series.items()):
+            labels = list(zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield '_bucket', labels + [('le', bound)], cumulative
+            yield '_sum', labels, counts[-1]
+            yield '_count', labels, cumulative
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Registry:
+    '''the metrics and collectors rendered by the metrics endpoint'''
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def histogram(self, name, documentation, labelnames=(),
+                  buckets=DURATION_BUCKETS):
+        '''create and register a histogram'''
+        histogram = Histogram(name, documentation, labelnames, buckets)
+        with self._lock:
+            self._metrics.append(histogram)
+        return histogram
+
+    def register(self, collector):
+        '''
+        add a callable run at every scrape
+
+        it returns an iterable of (name, type, documentation, samples)
+        where samples is a list of (labels dict, value).
+        '''
+        with self._lock:
+            self._collectors.append(collector)
+        return collector
+
+    def render(self):
+        '''return every metric in the prometheus text format'''
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+
+        lines = []
+        for metric in metrics:
+            lines.append('# HELP %s %s' % (metric.name, metric.documentation))
+            lines.append('# TYPE %s %s' % (metric.name, metric.type))
+            for suffix, labels, value in metric.samples():
+                lines.append('%s%s%s %s' % (
+                    metric.name, suffix, _format_labels(labels),
+                    _format_value(value),
+                ))
+        for collector in collectors:
+            for name, kind, documentation, samples in collector():
+                lines.append('# HELP %s %s' % (name, documentation))
+                lines.append('# TYPE %s %s' % (name, kind))
+                for labels, value in samples:
+                    lines.append('%s%s %s' % (
+                        name, _format_labels(sorted(labels.items())),
+                        _format_value(value),
+                    ))
+        return '\n'.join(lines) + '\n'
+
+
+def stats_collector(prefix, documentation, stats, counters=()):
+    '''
+    return a collector exporting the flat dict returned by stats()
+
+    keys named in counters are exported as counters, the rest as gauges.
+    '''
+    def collect():
+        for key, value in stats().items():
+            if key in counters:
+                name, kind = '%s_%s_total' % (prefix, key), 'counter'
+            else:
+                name, kind = '%s_%s' % (prefix, key), 'gauge'
+            yield name, kind, '%s %s' % (documentation, key), [({}, value)]
+    return collect
+
+
+registry = Registry()
@@ -0,0 +1,109 @@
+import asyncio
+
+from django.conf import settings
+
+from core import timing
+from core.metrics import COUNT_BUCKETS, registry
+
+
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+# phases reported in Server-Timing and their histograms
+PHASES = ('db', 'serialize', 'render')
+
+request_duration = registry.histogram(
+    'http_request_duration_seconds',
+    'Time to handle a request, by view, method and status class',
+    ('view', 'method', 'status'),
+)
+query_count = registry.histogram(
+    'http_request_db_queries',
+    'Database queries run by a request, by view',
+    ('view',), buckets=COUNT_BUCKETS,
+)
+phase_durations = {
+    phase: registry.histogram(
+        'http_request_%s_duration_seconds' % phase,
+        'Time a request spent in %s, by view' % phase,
+        ('view',),
+    )
+    for phase in PHASES
+}
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unmatched'
+
+
+def _server_timing(timings, total):
+    entries = []
+    for phase in PHASES:
+        if phase in timings.durations:
+            entry = '%s;dur=%.2f' % (phase, timings.durations[phase] * 1000)
+            if phase == 'db':
+                entry += ';desc="%d queries"' % timings.queries
+            entries.append(entry)
+    entries.append('total;dur=%.2f' % (total * 1000))
+    return ', '.join(entries)
+
+
+class ServerTimingMiddleware:
+    '''
+    record query count, sql, serializer, render and total time per request
+
+    the timings are added to the response as a Server-Timing header (unless
+    SERVER_TIMING_HEADER is off) and aggregated into per view histograms
+    served by the metrics endpoint. list this first in MIDDLEWARE so the
+    total covers the other middleware too.
+    '''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # lets django call this instance as a coroutine under asgi
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        timings, token = timing.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            timing.stop(token)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings, token = timing.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            timing.stop(token)
+        return self.finish(request, response, timings)
+
+    def process_template_response(self, request, response):
+        '''time the render django runs once the view has returned'''
+        timings = timing.current()
+        if timings is None or response.is_rendered:
+            return response
+        with timing.timed('render'):
+            response.render()
+        return response
+
+    def finish(self, request, response, timings):
+        total = timings.elapsed()
+        view = _view_name(request)
+        method = request.method if request.method in METHODS else 'other'
+        request_duration.observe(
+            total, view, method, '%dxx' % (response.status_code // 100)
+        )
+        query_count.observe(timings.queries, view)
+        for phase in PHASES:
+            phase_durations[phase].observe(
+                timings.durations.get(phase, 0.0), view
+            )
+        if settings.SERVER_TIMING_HEADER:
+            response['Server-Timing'] = _server_timing(timings, total)
+        return response
@@ -0,0 +1,39 @@
+from django.db import migrations, models
+
+import core.operations
+
+
+class Migration(migrations.Migration):
+    # postgresql cannot create indexes concurrently inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0005_recipe_image'),
+    ]
+
+    operations = [
+        core.operations.AddIndexOnline(
+            model_name='tag',
+            index=models.Index(fields=['user', 'name', 'id'], name='core_tag_user_name_idx'),
+        ),
+        core.operations.AddIndexOnline(
+            model_name='ingredient',
+            index=models.Index(fields=['user', 'name', 'id'], name='core_ingredient_user_name_idx'),
+        ),
+        core.operations.AddIndexOnline(
+            model_name='recipe',
+            index=models.Index(fields=['user', 'id'], name='core_recipe_user_id_idx'),
+        ),
+        # the through tables' unique constraints already cover
+        # (recipe_id, tag_id); these serve lookups from the tag side
+        core.operations.CreateIndexOnline(
+            table='core_recipe_tags',
+            name='core_recipe_tags_tag_recipe_idx',
+            columns=['tag_id', 'recipe_id'],
+        ),
+        core.operations.CreateIndexOnline(
+            table='core_recipe_ingredients',
+            name='core_recipe_ingr_ingr_recipe_idx',
+            columns=['ingredient_id', 'recipe_id'],
+        ),
+    ]
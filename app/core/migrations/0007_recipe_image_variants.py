@@ -0,0 +1,18 @@
+# Generated by Django 3.1.4 on 2026-10-18 06:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_access_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,72 @@
+from django.db import migrations
+
+import core.operations
+
+
+POSTGRESQL_FORWARDS = [
+    'ALTER TABLE core_recipe ADD COLUMN search_vector tsvector',
+    "UPDATE core_recipe SET search_vector = to_tsvector('pg_catalog.english', title)",
+    'CREATE TRIGGER core_recipe_search_vector_trigger '
+    'BEFORE INSERT OR UPDATE OF title ON core_recipe FOR EACH ROW '
+    "EXECUTE PROCEDURE tsvector_update_trigger(search_vector, 'pg_catalog.english', title)",
+]
+
+POSTGRESQL_BACKWARDS = [
+    'DROP TRIGGER IF EXISTS core_recipe_search_vector_trigger ON core_recipe',
+    'ALTER TABLE core_recipe DROP COLUMN IF EXISTS search_vector',
+]
+
+# an external content fts5 table over core_recipe kept in sync by triggers
+SQLITE_FORWARDS = [
+    'CREATE VIRTUAL TABLE core_recipe_fts USING fts5('
+    "title, content='core_recipe', content_rowid='id', "
+    "tokenize='porter unicode61')",
+    "INSERT INTO core_recipe_fts(core_recipe_fts) VALUES ('rebuild')",
+    'CREATE TRIGGER core_recipe_fts_insert AFTER INSERT ON core_recipe BEGIN '
+    'INSERT INTO core_recipe_fts(rowid, title) VALUES (new.id, new.title); '
+    'END',
+    'CREATE TRIGGER core_recipe_fts_delete AFTER DELETE ON core_recipe BEGIN '
+    "INSERT INTO core_recipe_fts(core_recipe_fts, rowid, title) VALUES ('delete', old.id, old.title); "
+    'END',
+    'CREATE TRIGGER core_recipe_fts_update AFTER UPDATE OF title ON core_recipe BEGIN '
+    "INSERT INTO core_recipe_fts(core_recipe_fts, rowid, title) VALUES ('delete', old.id, old.title); "
+    'INSERT INTO core_recipe_fts(rowid, title) VALUES (new.id, new.title); '
+    'END',
+]
+
+SQLITE_BACKWARDS = [
+    'DROP TRIGGER IF EXISTS core_recipe_fts_insert',
+    'DROP TRIGGER IF EXISTS core_recipe_fts_delete',
+    'DROP TRIGGER IF EXISTS core_recipe_fts_update',
+    'DROP TABLE IF EXISTS core_recipe_fts',
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+    # postgresql cannot create indexes concurrently inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0007_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'postgresql': POSTGRESQL_FORWARDS, 'sqlite': SQLITE_FORWARDS}),
+            _run({'postgresql': POSTGRESQL_BACKWARDS, 'sqlite': SQLITE_BACKWARDS}),
+        ),
+        core.operations.CreateIndexOnline(
+            table='core_recipe',
+            name='core_recipe_search_vector_idx',
+            columns=['search_vector'],
+            using='gin',
+            vendor='postgresql',
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.4 on 2026-10-18 06:37
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_recipe_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeDocument',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='document', serialize=False, to='core.recipe')),
+                ('data', models.JSONField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.1.4 on 2026-10-18 06:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_recipedocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recipe_stats', serialize=False, to='core.user')),
+                ('recipes', models.IntegerField(default=0)),
+                ('price_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('time_minutes_total', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TagStats',
+            fields=[
+                ('tag', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='core.tag')),
+                ('recipes', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='IngredientStats',
+            fields=[
+                ('ingredient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='core.ingredient')),
+                ('recipes', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+import core.operations
+
+
+class Migration(migrations.Migration):
+    # postgresql cannot create indexes concurrently inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0010_recipe_stats'),
+    ]
+
+    # match name__istartswith, which compiles to UPPER("name"::text) LIKE
+    # on postgresql; other databases narrow by the user_id, name index
+    operations = [
+        core.operations.CreateIndexOnline(
+            table='core_tag',
+            name='core_tag_user_name_prefix_idx',
+            columns=['"user_id"', '(UPPER("name"::text)) text_pattern_ops'],
+            vendor='postgresql',
+        ),
+        core.operations.CreateIndexOnline(
+            table='core_ingredient',
+            name='core_ingredient_user_name_prefix_idx',
+            columns=['"user_id"', '(UPPER("name"::text)) text_pattern_ops'],
+            vendor='postgresql',
+        ),
+    ]
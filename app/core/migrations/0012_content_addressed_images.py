@@ -0,0 +1,32 @@
+# Generated by Django 3.1.4 on 2026-10-18 06:49
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_attribute_prefix_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('references', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        # storage and upload_to live in python only, and altering the
+        # field on sqlite would remake core_recipe and drop its fts triggers
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='recipe',
+                    name='image',
+                    field=models.ImageField(null=True, storage=core.storage.ContentAddressedStorage(), upload_to='upload/recipe/'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.1.4 on 2026-10-18 07:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='data_version', serialize=False, to='core.user')),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
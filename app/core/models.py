@@ -1,17 +1,26 @@
-import uuid
-import os
+import posixpath
+
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
                                         PermissionsMixin
 from django.conf import settings
 
+from core.storage import ContentAddressedStorage
+
+
+# identical images are stored once, StoredFile counts the recipes using each
+image_storage = ContentAddressedStorage()
+RECIPE_IMAGE_DIRECTORY = 'upload/recipe/'
+
 
 def recipe_image_file_path(instance, filename):
-    '''generate file path for new recipe image'''
-    extension = filename.split('.')[-1]
-    filename = f'{uuid.uuid4()}.{extension}'
+    '''
+    generate the file path for new recipe image
 
-    return os.path.join('upload/recipe/', filename)
+    no longer used by the model, image_storage names files after their
+    content; kept for the migrations that refer to it.
+    '''
+    return posixpath.join(RECIPE_IMAGE_DIRECTORY, filename)
 
 
 class UserManager(BaseUserManager):
@@ -57,6 +66,13 @@ class Tag(models.Model):
         on_delete=models.CASCADE,
     )
 
+    class Meta:
+        # matches the per-user listing, ordered by name with id as tiebreak
+        indexes = [
+            models.Index(fields=['user', 'name', 'id'],
+                         name='core_tag_user_name_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -69,6 +85,12 @@ class Ingredient(models.Model):
         on_delete=models.CASCADE
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'name', 'id'],
+                         name='core_ingredient_user_name_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -85,7 +107,115 @@ class Recipe(models.Model):
     link = models.CharField(max_length=255, blank=True)
     ingredients = models.ManyToManyField('Ingredient')
     tags = models.ManyToManyField('Tag')
-    image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    image = models.ImageField(
+        null=True,
+        upload_to=RECIPE_IMAGE_DIRECTORY,
+        storage=image_storage
+    )
+    # variant name -> storage name of the resized copies of image
+    image_variants = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'],
+                         name='core_recipe_user_id_idx'),
+        ]
 
     def __str__(self):
         return self.title
+
+
+class RecipeDocument(models.Model):
+    '''precomputed read representation of a recipe'''
+    recipe = models.OneToOneField(
+        'Recipe',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='document'
+    )
+    # copied from the recipe so reads need no join
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    data = models.JSONField()
+
+    def __str__(self):
+        return str(self.recipe_id)
+
+
+class RecipeStats(models.Model):
+    '''running totals over all the recipes of a user'''
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='recipe_stats'
+    )
+    recipes = models.IntegerField(default=0)
+    price_total = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0
+    )
+    time_minutes_total = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return str(self.user_id)
+
+
+class TagStats(models.Model):
+    '''number of recipes linked to a tag'''
+    tag = models.OneToOneField(
+        'Tag',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    recipes = models.IntegerField(default=0)
+
+    def __str__(self):
+        return str(self.tag_id)
+
+
+class IngredientStats(models.Model):
+    '''number of recipes linked to an ingredient'''
+    ingredient = models.OneToOneField(
+        'Ingredient',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    recipes = models.IntegerField(default=0)
+
+    def __str__(self):
+        return str(self.ingredient_id)
+
+
+class DataVersion(models.Model):
+    '''a counter bumped whenever the recipe data of a user changes'''
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='data_version'
+    )
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return '%s:%s' % (self.user_id, self.version)
+
+
+class StoredFile(models.Model):
+    '''a content addressed file and how many records refer to it'''
+    name = models.CharField(max_length=255, primary_key=True)
+    references = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.name
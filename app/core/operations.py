@@ -0,0 +1,111 @@
+from django.db.migrations.operations import AddIndex
+from django.db.migrations.operations.base import Operation
+
+
+def _concurrently(schema_editor):
+    '''return whether indexes can be built without locking out writes'''
+    return schema_editor.connection.vendor == 'postgresql'
+
+
+class AddIndexOnline(AddIndex):
+    '''
+    add a model index with CREATE INDEX CONCURRENTLY on postgresql
+
+    other databases fall back to a plain CREATE INDEX. migrations using this
+    operation must set atomic = False as postgresql cannot build indexes
+    concurrently inside a transaction.
+    '''
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias,
+                                        model):
+            return
+        if _concurrently(schema_editor):
+            schema_editor.add_index(model, self.index, concurrently=True)
+        else:
+            schema_editor.add_index(model, self.index)
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias,
+                                        model):
+            return
+        if _concurrently(schema_editor):
+            schema_editor.remove_index(model, self.index, concurrently=True)
+        else:
+            schema_editor.remove_index(model, self.index)
+
+    def describe(self):
+        return 'Create index %s online on field(s) %s of model %s' % (
+            self.index.name,
+            ', '.join(self.index.fields),
+            self.model_name,
+        )
+
+
+class CreateIndexOnline(Operation):
+    '''
+    create an index on a table the migration state does not track
+
+    used for auto-created m2m through tables and for expression indexes.
+    columns are inserted into the sql verbatim, so they may hold
+    expressions and operator classes.
+    '''
+    reversible = True
+    reduces_to_sql = True
+
+    def __init__(self, table, name, columns, using=None, vendor=None):
+        self.table = table
+        self.name = name
+        self.columns = columns
+        self.using = using
+        self.vendor = vendor
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def _applies(self, schema_editor):
+        return self.vendor is None or \
+            schema_editor.connection.vendor == self.vendor
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if not self._applies(schema_editor):
+            return
+        quote = schema_editor.quote_name
+        schema_editor.execute(
+            'CREATE INDEX %sIF NOT EXISTS %s ON %s %s(%s)' % (
+                'CONCURRENTLY ' if _concurrently(schema_editor) else '',
+                quote(self.name),
+                quote(self.table),
+                'USING %s ' % self.using if self.using else '',
+                ', '.join(self.columns),
+            )
+        )
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if not self._applies(schema_editor):
+            return
+        schema_editor.execute('DROP INDEX %sIF EXISTS %s' % (
+            'CONCURRENTLY ' if _concurrently(schema_editor) else '',
+            schema_editor.quote_name(self.name),
+        ))
+
+    def deconstruct(self):
+        kwargs = {
+            'table': self.table,
+            'name': self.name,
+            'columns': self.columns,
+        }
+        if self.using:
+            kwargs['using'] = self.using
+        if self.vendor:
+            kwargs['vendor'] = self.vendor
+        return self.__class__.__name__, [], kwargs
+
+    def describe(self):
+        return 'Create index %s online on table %s' % (self.name, self.table)
@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    '''raised when no connection is freed within the wait timeout'''
+
+
+class ConnectionPool:
+    '''
+    thread safe pool of open database connections
+
+    connections are opened lazily up to max_size. once that many are in use
+    acquire() waits up to timeout seconds for one to be released. idle
+    connections are checked with is_usable before being handed out again.
+    '''
+
+    def __init__(self, connect, max_size, timeout, is_usable=None,
+                 close=None, timer=time.monotonic):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._connect = connect
+        self._is_usable = is_usable
+        self._close = close or (lambda connection: connection.close())
+        self._timer = timer
+        self._idle = deque()
+        self._size = 0
+        self._condition = threading.Condition()
+        self.created = 0
+        self.reused = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.discarded = 0
+
+    def acquire(self):
+        '''return an open connection, waiting for one if the pool is full'''
+        while True:
+            connection = self._take()
+            if connection is None:
+                return self._open()
+            if self._is_usable is None or self._is_usable(connection):
+                return connection
+            self.discard(connection)
+
+    def _take(self):
+        '''return an idle connection, or None once a slot is reserved'''
+        deadline = self._timer() + self.timeout
+        waited = False
+        with self._condition:
+            while True:
+                if self._idle:
+                    self.reused += 1
+                    return self._idle.pop()
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None
+                remaining = deadline - self._timer()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(
+                        'no database connection became available within '
+                        '%s seconds' % self.timeout
+                    )
+                if not waited:
+                    self.waits += 1
+                    waited = True
+                self._condition.wait(remaining)
+
+    def _open(self):
+        try:
+            connection = self._connect()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self.created += 1
+        return connection
+
+    def release(self, connection):
+        '''hand a connection back for reuse'''
+        with self._condition:
+            self._idle.append(connection)
+            self._condition.notify()
+
+    def discard(self, connection):
+        '''close a connection and free its slot'''
+        try:
+            self._close(connection)
+        except Exception:
+            pass
+        with self._condition:
+            self._size -= 1
+            self.discarded += 1
+            self._condition.notify()
+
+    def close_idle(self):
+        '''close every idle connection'''
+        with self._condition:
+            idle = list(self._idle)
+            self._idle.clear()
+        for connection in idle:
+            self.discard(connection)
+
+    def stats(self):
+        '''return the pool's gauges and counters'''
+        with self._condition:
+            return {
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'created': self.created,
+                'reused': self.reused,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'discarded': self.discarded,
+            }
@@ -0,0 +1,281 @@
+'''
+generate large amounts of synthetic data quickly
+
+rows are built as plain tuples of database values in blocks of users and
+written with COPY on postgresql or a plain executemany() INSERT elsewhere;
+going through bulk_create is also possible but spends most of its time
+building model instances and compiling sql. every user shares one
+precomputed password hash, ids are assigned up front so links can be
+written without reading anything back, and sequences are reset at the
+end. run it against a database nothing else is writing to.
+
+model signals are not sent, so caches keyed on them (token and response
+caches, data versions) only see the new rows once they expire. seeding
+only adds new users, so there is nothing stale to serve. recipe read
+documents and stats counters are not written either; the seed command
+builds them afterwards with rebuild_recipe_documents and
+rebuild_recipe_stats.
+'''
+import csv
+import io
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from core.models import Ingredient, Recipe, Tag
+
+
+WORDS = (
+    'apple', 'bean', 'beef', 'bread', 'cake', 'cheese', 'chicken', 'chilli',
+    'curry', 'egg', 'fish', 'garlic', 'ginger', 'lamb', 'lemon', 'mushroom',
+    'noodle', 'onion', 'pasta', 'pie', 'pork', 'potato', 'rice', 'salad',
+    'soup', 'spinach', 'stew', 'tart', 'tofu', 'tomato',
+)
+DISTRIBUTIONS = ('uniform', 'pareto')
+METHODS = ('auto', 'copy', 'insert', 'bulk')
+
+
+def random_title(rng):
+    '''return a recipe title of two to five words'''
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 5)))
+
+
+def recipe_counts(users, recipes, distribution='uniform', skew=1.5,
+                  rng=None):
+    '''
+    split recipes between users
+
+    uniform gives everyone the same share. pareto draws each user's share
+    from a pareto distribution with shape skew, so a few users own most of
+    the recipes; lower skew means a longer tail.
+    '''
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError('unknown distribution %r' % distribution)
+    if not users:
+        return []
+    if distribution == 'uniform':
+        share, remainder = divmod(recipes, users)
+        return [share + (i < remainder) for i in range(users)]
+
+    rng = rng or random.Random()
+    weights = [rng.paretovariate(skew) for _ in range(users)]
+    scale = recipes / sum(weights)
+    return [round(weight * scale) for weight in weights]
+
+
+class Seeder:
+    '''
+    write users with their tags, ingredients, recipes and links in bulk
+
+    users are generated block_size at a time, each block in its own
+    transaction, so memory stays flat however many rows are written.
+    '''
+
+    def __init__(self, users, recipes, tags=20, ingredients=30,
+                 tags_per_recipe=3, ingredients_per_recipe=5,
+                 distribution='uniform', skew=1.5, password='password',
+                 tokens=True, email_prefix='seed', seed=0, block_size=1000,
+                 batch_size=5000, method='auto', using='default',
+                 log=None):
+        self.users = users
+        self.recipes = recipes
+        self.tags = tags
+        self.ingredients = ingredients
+        self.tags_per_recipe = min(tags_per_recipe, tags)
+        self.ingredients_per_recipe = min(ingredients_per_recipe, ingredients)
+        self.distribution = distribution
+        self.skew = skew
+        self.password = password
+        self.tokens = tokens
+        self.email_prefix = email_prefix
+        self.rng = random.Random(seed)
+        self.block_size = block_size
+        self.batch_size = batch_size
+        self.connection = connections[using]
+        self.using = using
+        if method == 'auto':
+            method = 'copy' if self.connection.vendor == 'postgresql' \
+                else 'insert'
+        self.method = method
+        # bulk_create wants python values, the others database values
+        self.empty_json = {} if method == 'bulk' else '{}'
+        self.log = log or (lambda message: None)
+        self.written = {}
+
+    def _next_id(self, model):
+        last = model.objects.using(self.using).aggregate(
+            top=Max('id')
+        )['top']
+        return (last or 0) + 1
+
+    def run(self):
+        '''write everything and return the number of rows per table'''
+        user_model = get_user_model()
+        password = make_password(self.password)
+        now = timezone.now()
+        if self.method == 'insert':
+            now = self.connection.ops.adapt_datetimefield_value(now)
+        counts = recipe_counts(
+            self.users, self.recipes, self.distribution, self.skew, self.rng
+        )
+        next_user = self._next_id(user_model)
+        next_tag = self._next_id(Tag)
+        next_ingredient = self._next_id(Ingredient)
+        next_recipe = self._next_id(Recipe)
+
+        started = time.perf_counter()
+        for start in range(0, self.users, self.block_size):
+            block = counts[start:start + self.block_size]
+            rows = {
+                'users': [], 'tokens': [], 'tags': [], 'ingredients': [],
+                'recipes': [], 'recipe_tags': [], 'recipe_ingredients': [],
+            }
+            for recipe_count in block:
+                user_id = next_user
+                next_user += 1
+                rows['users'].append((
+                    user_id, password, None, False,
+                    '%s%d@example.com' % (self.email_prefix, user_id),
+                    'User %d' % user_id, True, False,
+                ))
+                if self.tokens:
+                    rows['tokens'].append(
+                        (Token.generate_key(), user_id, now)
+                    )
+
+                tag_ids = range(next_tag, next_tag + self.tags)
+                next_tag += self.tags
+                rows['tags'].extend(
+                    (tag_id, 'tag %d' % i, user_id)
+                    for i, tag_id in enumerate(tag_ids)
+                )
+                ingredient_ids = range(
+                    next_ingredient, next_ingredient + self.ingredients
+                )
+                next_ingredient += self.ingredients
+                rows['ingredients'].extend(
+                    (ingredient_id, 'ingredient %d' % i, user_id)
+                    for i, ingredient_id in enumerate(ingredient_ids)
+                )
+
+                for _ in range(recipe_count):
+                    recipe_id = next_recipe
+                    next_recipe += 1
+                    rows['recipes'].append(self._recipe(recipe_id, user_id))
+                    rows['recipe_tags'].extend(
+                        (recipe_id, tag_id) for tag_id in self.rng.sample(
+                            tag_ids, self.tags_per_recipe
+                        )
+                    )
+                    rows['recipe_ingredients'].extend(
+                        (recipe_id, ingredient_id)
+                        for ingredient_id in self.rng.sample(
+                            ingredient_ids, self.ingredients_per_recipe
+                        )
+                    )
+
+            with transaction.atomic(using=self.using):
+                self._write_block(rows)
+            done = min(start + self.block_size, self.users)
+            self.log('%d/%d users, %d rows, %.0f rows/s' % (
+                done, self.users, sum(self.written.values()),
+                sum(self.written.values()) /
+                (time.perf_counter() - started),
+            ))
+
+        self._reset_sequences()
+        return dict(self.written)
+
+    def _recipe(self, recipe_id, user_id):
+        rng = self.rng
+        return (
+            recipe_id, user_id, random_title(rng), rng.randint(5, 180),
+            '%d.%02d' % (rng.randint(1, 99), rng.randint(0, 99)),
+            '', None, self.empty_json,
+        )
+
+    def _write_block(self, rows):
+        user_model = get_user_model()
+        self._write(user_model, (
+            'id', 'password', 'last_login', 'is_superuser', 'email', 'name',
+            'is_active', 'is_staff',
+        ), rows['users'])
+        self._write(Token, ('key', 'user_id', 'created'), rows['tokens'])
+        self._write(Tag, ('id', 'name', 'user_id'), rows['tags'])
+        self._write(
+            Ingredient, ('id', 'name', 'user_id'), rows['ingredients']
+        )
+        self._write(Recipe, (
+            'id', 'user_id', 'title', 'time_minutes', 'price', 'link',
+            'image', 'image_variants',
+        ), rows['recipes'])
+        self._write(
+            Recipe.tags.through, ('recipe_id', 'tag_id'), rows['recipe_tags']
+        )
+        self._write(
+            Recipe.ingredients.through, ('recipe_id', 'ingredient_id'),
+            rows['recipe_ingredients'],
+        )
+
+    def _write(self, model, fields, rows):
+        '''insert rows, tuples of the given field attnames, into model'''
+        if not rows:
+            return
+        if self.method == 'copy':
+            self._copy(model, fields, rows)
+        elif self.method == 'insert':
+            self._insert(model, fields, rows)
+        else:
+            objects = (model(**dict(zip(fields, row))) for row in rows)
+            model.objects.using(self.using).bulk_create(
+                objects, batch_size=self.batch_size
+            )
+        table = model._meta.db_table
+        self.written[table] = self.written.get(table, 0) + len(rows)
+
+    def _columns(self, model, fields):
+        quote = self.connection.ops.quote_name
+        return quote(model._meta.db_table), ', '.join(
+            quote(model._meta.get_field(name).column) for name in fields
+        )
+
+    def _insert(self, model, fields, rows):
+        '''insert rows into model's table with one executemany() call'''
+        table, columns = self._columns(model, fields)
+        sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+            table, columns, ', '.join(['%s'] * len(fields))
+        )
+        with self.connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+
+    def _copy(self, model, fields, rows):
+        '''stream rows into model's table with postgresql COPY'''
+        table, columns = self._columns(model, fields)
+        buffer = io.StringIO()
+        # strings are quoted so only None is read back as NULL
+        csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC).writerows(rows)
+        buffer.seek(0)
+        with self.connection.cursor() as cursor:
+            cursor.copy_expert(
+                'COPY %s (%s) FROM STDIN WITH (FORMAT csv)' % (
+                    table, columns
+                ),
+                buffer,
+            )
+
+    def _reset_sequences(self):
+        '''move id sequences past the ids assigned here'''
+        models = [get_user_model(), Tag, Ingredient, Recipe]
+        statements = self.connection.ops.sequence_reset_sql(
+            no_style(), models
+        )
+        with self.connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
@@ -0,0 +1,81 @@
+'''
+content addressed file storage
+
+files are named after the sha256 of their bytes and sharded over two
+directory levels by the first four hex digits, so identical uploads share
+one file and no single directory grows to millions of entries.
+'''
+import hashlib
+import os
+import uuid
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+def content_digest(content):
+    '''return the sha256 hex digest of a file's bytes'''
+    digest = hashlib.sha256()
+    for chunk in content.chunks(CHUNK_SIZE):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def content_name(content, directory, extension):
+    '''return the sharded storage name of a file under directory'''
+    digest = content_digest(content)
+    return os.path.join(
+        directory, digest[:2], digest[2:4], f'{digest}.{extension.lower()}'
+    )
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    '''
+    file system storage that keeps a single copy of every name
+
+    saving to a name that already exists keeps the existing file, which is
+    only right when names are derived from the content.
+    '''
+
+    def save(self, name, content, max_length=None):
+        '''
+        store content under the hash of its bytes, in name's directory
+
+        only the directory and extension of name are kept, returns the name
+        the content was stored under.
+        '''
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        directory, filename = os.path.split(name)
+        _base, extension = os.path.splitext(filename)
+        return self.save_as(
+            content_name(content, directory, extension.lstrip('.')), content,
+            max_length=max_length
+        )
+
+    def save_as(self, name, content, max_length=None):
+        '''store content under name, which was derived from it elsewhere'''
+        return super().save(name, content, max_length=max_length)
+
+    def get_available_name(self, name, max_length=None):
+        '''names are never made unique, the same name means the same file'''
+        return name
+
+    def _save(self, name, content):
+        if self.exists(name):
+            return name
+        # write under a unique name and move it into place, so concurrent
+        # saves of the same content never expose a partially written file
+        temporary = super()._save(
+            '%s.%s.tmp' % (name, uuid.uuid4().hex), content
+        )
+        os.replace(self.path(temporary), self.path(name))
+        return name
@@ -0,0 +1,90 @@
+from django.test import SimpleTestCase
+
+from core.cache import LRUCache
+
+
+class FakeTimer:
+    '''a clock that only moves when told to'''
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class LRUCacheTests(SimpleTestCase):
+
+    def test_get_counts_hits_and_misses(self):
+        '''test that lookups are counted'''
+        cache = LRUCache(max_size=2)
+        cache.set('a', 1)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_least_recently_used_is_evicted(self):
+        '''test that the entry used longest ago is dropped when full'''
+        cache = LRUCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_entries_expire_after_ttl(self):
+        '''test that entries older than the ttl are not returned'''
+        timer = FakeTimer()
+        cache = LRUCache(max_size=2, ttl=10, timer=timer)
+        cache.set('a', 1)
+
+        timer.now = 9
+        self.assertEqual(cache.get('a'), 1)
+        timer.now = 10
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+    def test_delete_where(self):
+        '''test removing entries matching a predicate'''
+        cache = LRUCache(max_size=10)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('c', 3)
+
+        removed = cache.delete_where(lambda key, value: value % 2)
+
+        self.assertEqual(removed, 2)
+        self.assertEqual(cache.get('b'), 2)
+        self.assertIsNone(cache.get('a'))
+
+    def test_total_bytes_bounded(self):
+        '''test that the oldest entries go once the byte budget is spent'''
+        cache = LRUCache(max_size=10, max_bytes=10, sizeof=len)
+        cache.set('a', 'xxxx')
+        cache.set('b', 'xxxx')
+        cache.set('a', 'xxx')
+        cache.set('c', 'xxxx')
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'xxx')
+        self.assertEqual(cache.get('c'), 'xxxx')
+        self.assertEqual(cache.stats()['bytes'], 7)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+        cache.delete_where(lambda key, value: key == 'a')
+        self.assertEqual(cache.stats()['bytes'], 4)
+
+    def test_value_over_byte_budget_not_stored(self):
+        '''test that a value bigger than the whole budget is skipped'''
+        cache = LRUCache(max_size=10, max_bytes=3, sizeof=len)
+        cache.set('a', 'xx')
+        cache.set('a', 'xxxx')
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['bytes'], 0)
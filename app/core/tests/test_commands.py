@@ -1,7 +1,15 @@
+from io import StringIO
 from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
 from django.test import TestCase
 from django.core.management import call_command
 from django.db.utils import OperationalError
+from rest_framework.authtoken.models import Token
+
+from core.models import Recipe, RecipeDocument, RecipeStats, StoredFile, \
+    Tag, TagStats, image_storage
+from core.seeding import recipe_counts
 
 
 class CommandTests(TestCase):
@@ -20,3 +28,141 @@ class CommandTests(TestCase):
             gi.side_effect = [OperationalError] * 5 + [True]
             call_command('wait_for_db')
             self.assertEqual(gi.call_count, 6)
+
+    def _seed(self, **options):
+        call_command('seed', stdout=StringIO(), **options)
+
+    def test_seed(self):
+        '''test seeding users with their recipes, tags and links'''
+        self._seed(users=3, recipes=30, tags=4, ingredients=5,
+                   tags_per_recipe=2, ingredients_per_recipe=3)
+
+        users = get_user_model().objects.all()
+        self.assertEqual(users.count(), 3)
+        self.assertEqual(Token.objects.count(), 3)
+        self.assertEqual(len({user.password for user in users}), 1)
+        self.assertTrue(users[0].check_password('password'))
+        for user in users:
+            self.assertEqual(Recipe.objects.filter(user=user).count(), 10)
+            self.assertEqual(Tag.objects.filter(user=user).count(), 4)
+        recipe = Recipe.objects.first()
+        self.assertEqual(recipe.tags.count(), 2)
+        self.assertEqual(recipe.ingredients.count(), 3)
+        self.assertEqual(set(recipe.tags.values_list('user', flat=True)),
+                         {recipe.user_id})
+        self.assertEqual(recipe.image_variants, {})
+
+    def test_seed_with_bulk_create(self):
+        '''test that the bulk_create method writes the same rows'''
+        self._seed(users=2, recipes=6, tags=3, tags_per_recipe=2,
+                   method='bulk')
+
+        self.assertEqual(Recipe.objects.count(), 6)
+        self.assertEqual(Recipe.tags.through.objects.count(), 12)
+        self.assertEqual(Recipe.objects.first().image_variants, {})
+
+    def test_seed_twice_adds_rows(self):
+        '''test that seeding again continues after the existing ids'''
+        self._seed(users=2, recipes=4, tokens=False)
+        self._seed(users=2, recipes=4, email_prefix='more')
+        recipe = Recipe.objects.create(
+            user=get_user_model().objects.first(), title='new',
+            time_minutes=1, price=1
+        )
+
+        self.assertEqual(get_user_model().objects.count(), 4)
+        self.assertEqual(Token.objects.count(), 2)
+        self.assertEqual(Recipe.objects.count(), 9)
+        self.assertGreater(recipe.id, 8)
+
+    def test_seed_builds_documents(self):
+        '''test that seeded recipes get their read documents'''
+        self._seed(users=2, recipes=4)
+
+        self.assertEqual(RecipeDocument.objects.count(), 4)
+
+    def test_rebuild_recipe_documents(self):
+        '''test rebuilding every document or only the missing ones'''
+        self._seed(users=2, recipes=5)
+        recipe = Recipe.objects.first()
+        RecipeDocument.objects.filter(recipe=recipe).delete()
+        Recipe.objects.exclude(pk=recipe.pk).update(title='stale')
+
+        out = StringIO()
+        call_command('rebuild_recipe_documents', missing=True, stdout=out)
+        self.assertIn('Rebuilt 1 recipe documents', out.getvalue())
+        self.assertEqual(RecipeDocument.objects.count(), 5)
+        self.assertEqual(
+            RecipeDocument.objects.filter(data__title='stale').count(), 0
+        )
+
+        call_command('rebuild_recipe_documents', batch_size=2,
+                     stdout=StringIO())
+        self.assertEqual(
+            RecipeDocument.objects.filter(data__title='stale').count(), 4
+        )
+
+    def test_rebuild_recipe_stats(self):
+        '''test counting the stats of seeded users'''
+        self._seed(users=2, recipes=6, tags=3, tags_per_recipe=2)
+        self.assertEqual(RecipeStats.objects.count(), 2)
+        RecipeStats.objects.update(recipes=0)
+        TagStats.objects.all().delete()
+
+        call_command('rebuild_recipe_stats', batch_size=1,
+                     stdout=StringIO())
+
+        self.assertEqual(
+            sorted(RecipeStats.objects.values_list('recipes', flat=True)),
+            [3, 3]
+        )
+        self.assertEqual(
+            sum(TagStats.objects.values_list('recipes', flat=True)), 12
+        )
+
+    def test_migrate_recipe_images(self):
+        '''test moving random image names to shared content names'''
+        self._seed(users=1, recipes=2)
+        recipes = list(Recipe.objects.order_by('id'))
+        for i, recipe in enumerate(recipes):
+            name = image_storage.save_as(
+                'upload/recipe/old%d.jpg' % i, ContentFile(b'same image')
+            )
+            variant = image_storage.save_as(
+                'upload/recipe/old%d_thumbnail.jpg' % i, ContentFile(b'small')
+            )
+            Recipe.objects.filter(pk=recipe.pk).update(
+                image=name, image_variants={'thumbnail': variant}
+            )
+
+        out = StringIO()
+        call_command('migrate_recipe_images', dry_run=True, stdout=out)
+        self.assertIn('Would migrate 2 recipe images', out.getvalue())
+        self.assertTrue(image_storage.exists('upload/recipe/old0.jpg'))
+
+        call_command('migrate_recipe_images', batch_size=1, stdout=out)
+
+        names = set(Recipe.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertRegex(
+            name, r'^upload/recipe/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$'
+        )
+        self.assertEqual(StoredFile.objects.get(name=name).references, 2)
+        self.assertFalse(image_storage.exists('upload/recipe/old0.jpg'))
+        self.assertFalse(
+            image_storage.exists('upload/recipe/old1_thumbnail.jpg')
+        )
+        recipe = Recipe.objects.get(pk=recipes[0].pk)
+        thumbnail = recipe.image_variants['thumbnail']
+        self.assertTrue(image_storage.exists(thumbnail))
+        self.assertEqual(recipe.document.data['image'], name)
+        image_storage.delete(name)
+        image_storage.delete(thumbnail)
+
+    def test_recipe_counts(self):
+        '''test that recipes are split between users as configured'''
+        self.assertEqual(recipe_counts(3, 10), [4, 3, 3])
+        skewed = recipe_counts(1000, 100000, 'pareto')
+        self.assertAlmostEqual(sum(skewed), 100000, delta=1000)
+        self.assertGreater(max(skewed), 10 * (100000 // 1000))
@@ -0,0 +1,42 @@
+import threading
+
+from django.test import SimpleTestCase
+
+from core.executor import BoundedExecutor, Saturated
+
+
+class BoundedExecutorTests(SimpleTestCase):
+
+    def setUp(self):
+        self.executor = BoundedExecutor(max_workers=1, max_pending=2)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def test_run_returns_result(self):
+        '''test that run waits for and returns the call's result'''
+        self.assertEqual(self.executor.run(sum, [1, 2]), 3)
+        self.assertEqual(self.executor.stats()['completed'], 1)
+
+    def test_submit_rejected_when_saturated(self):
+        '''test that work beyond max_pending is refused immediately'''
+        first = self.executor.submit(self.release.wait)
+        second = self.executor.submit(self.release.wait)
+
+        with self.assertRaises(Saturated):
+            self.executor.submit(self.release.wait)
+        stats = self.executor.stats()
+        self.assertEqual(stats['pending'], 2)
+        self.assertEqual(stats['rejected'], 1)
+
+        self.release.set()
+        first.result()
+        second.result()
+        self.assertEqual(self.executor.stats()['pending'], 0)
+        self.assertEqual(self.executor.run(len, 'ab'), 2)
+
+    def test_slot_freed_when_call_raises(self):
+        '''test that a failing call still gives back its slot'''
+        for _ in range(3):
+            with self.assertRaises(ZeroDivisionError):
+                self.executor.run(divmod, 1, 0)
+        self.assertEqual(self.executor.stats()['pending'], 0)
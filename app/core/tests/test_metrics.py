@@ -0,0 +1,128 @@
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core import timing
+from core.metrics import Registry, stats_collector
+from recipe.mixins import response_cache
+
+
+METRICS_URL = reverse('metrics')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class RegistryTests(SimpleTestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_histogram_buckets_are_cumulative(self):
+        '''test that observations are rendered as cumulative buckets'''
+        histogram = self.registry.histogram(
+            'latency_seconds', 'Latency', ('view',), buckets=(0.1, 1)
+        )
+        histogram.observe(0.05, 'a')
+        histogram.observe(0.5, 'a')
+        histogram.observe(5, 'a')
+
+        text = self.registry.render()
+
+        self.assertIn('# TYPE latency_seconds histogram', text)
+        self.assertIn('latency_seconds_bucket{view="a",le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{view="a",le="1"} 2', text)
+        self.assertIn('latency_seconds_bucket{view="a",le="+Inf"} 3', text)
+        self.assertIn('latency_seconds_sum{view="a"} 5.55', text)
+        self.assertIn('latency_seconds_count{view="a"} 3', text)
+
+    def test_stats_collector(self):
+        '''test that stats dicts are exported as counters and gauges'''
+        self.registry.register(stats_collector(
+            'cache', 'Cache', lambda: {'hits': 3, 'size': 2},
+            counters=('hits',),
+        ))
+
+        text = self.registry.render()
+
+        self.assertIn('# TYPE cache_hits_total counter', text)
+        self.assertIn('cache_hits_total 3', text)
+        self.assertIn('# TYPE cache_size gauge', text)
+        self.assertIn('cache_size 2', text)
+
+    def test_label_values_escaped(self):
+        '''test that quotes in label values are escaped'''
+        self.registry.histogram('h', 'H', ('view',)).observe(1, 'a"b')
+
+        self.assertIn('h_count{view="a\\"b"} 1', self.registry.render())
+
+    def test_timed_outside_request(self):
+        '''test that timed blocks do nothing when no request is timed'''
+        with timing.timed('serialize'):
+            pass
+        self.assertIsNone(timing.current())
+
+
+class ServerTimingTests(TestCase):
+
+    def setUp(self):
+        response_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com', 'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_server_timing_header(self):
+        '''test that responses report their query and phase timings'''
+        response = self.client.get(RECIPES_URL)
+
+        entries = [e.strip() for e in response['Server-Timing'].split(',')]
+        names = [entry.split(';')[0] for entry in entries]
+        self.assertIn('db', names)
+        self.assertIn('serialize', names)
+        self.assertIn('render', names)
+        self.assertEqual(names[-1], 'total')
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+
+    @override_settings(SERVER_TIMING_HEADER=False)
+    def test_server_timing_header_disabled(self):
+        '''test that the header can be turned off'''
+        response = self.client.get(RECIPES_URL)
+
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_endpoint(self):
+        '''test that request histograms are served in prometheus format'''
+        self.client.get(RECIPES_URL)
+        response = self.client.get(
+            METRICS_URL, HTTP_AUTHORIZATION='Bearer secret'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        text = response.content.decode()
+        self.assertIn(
+            'http_request_duration_seconds_count{view="recipe:recipe-list",'
+            'method="GET",status="2xx"}', text
+        )
+        self.assertIn('http_request_db_queries_bucket', text)
+        self.assertIn('recipe_response_cache_hits_total', text)
+
+    @override_settings(METRICS_TOKEN='', DEBUG=False)
+    def test_metrics_endpoint_closed_without_token(self):
+        '''test that metrics need a token unless DEBUG is on'''
+        client = APIClient()
+        self.assertEqual(client.get(METRICS_URL).status_code, 403)
+
+        with override_settings(DEBUG=True):
+            self.assertEqual(client.get(METRICS_URL).status_code, 200)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_endpoint_token(self):
+        '''test that a configured token is required'''
+        client = APIClient()
+        self.assertEqual(client.get(METRICS_URL).status_code, 403)
+
+        client.credentials(HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(client.get(METRICS_URL).status_code, 200)
@@ -1,9 +1,18 @@
-from unittest.mock import patch
+import hashlib
+
+from django.core.files.base import ContentFile
+from django.db import connection
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from core import models
 
 
+def content_path(content, extension):
+    '''return the sharded content addressed path of an image'''
+    digest = hashlib.sha256(content).hexdigest()
+    return f'upload/recipe/{digest[:2]}/{digest[2:4]}/{digest}.{extension}'
+
+
 def sample_user(email="test@gmail.com", password="testpassword"):
     '''create a sample user'''
     return get_user_model().objects.create_user(email, password)
@@ -74,12 +83,45 @@ class ModelTests(TestCase):
 
         self.assertEqual(str(recipe), recipe.title)
 
-    @patch('uuid.uuid4')
-    def test_recipe_filename_uuid(self, mock_uuid):
-        '''test that img is saved in correct location'''
-        uuid = 'test-uuid'
-        mock_uuid.return_value = uuid
-        file_path = models.recipe_image_file_path(None, 'myimage.jpg')
+    def test_recipe_image_named_after_content(self):
+        '''test that img is saved under its sharded content hash'''
+        recipe = models.Recipe.objects.create(
+            user=sample_user(),
+            title='Pasta Bake',
+            time_minutes=5,
+            price=5.00,
+        )
 
-        expected_path = f'upload/recipe/{uuid}.jpg'
-        self.assertEqual(file_path, expected_path)
+        recipe.image.save('MyImage.JPG', ContentFile(b'first'))
+        first = recipe.image.name
+        self.assertEqual(first, content_path(b'first', 'jpg'))
+
+        recipe.image.save('other.jpg', ContentFile(b'second'))
+        second = recipe.image.name
+        self.assertEqual(second, content_path(b'second', 'jpg'))
+        with models.image_storage.open(second) as image_file:
+            self.assertEqual(image_file.read(), b'second')
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image.name, second)
+
+        models.image_storage.delete(first)
+        models.image_storage.delete(second)
+
+    def test_access_indexes_created(self):
+        '''test that the per-user and through table indexes exist'''
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, 'core_recipe_tags'
+            )
+            recipe_constraints = connection.introspection.get_constraints(
+                cursor, 'core_recipe'
+            )
+
+        self.assertEqual(
+            constraints['core_recipe_tags_tag_recipe_idx']['columns'],
+            ['tag_id', 'recipe_id']
+        )
+        self.assertEqual(
+            recipe_constraints['core_recipe_user_id_idx']['columns'],
+            ['user_id', 'id']
+        )
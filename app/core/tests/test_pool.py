@@ -0,0 +1,164 @@
+from unittest.mock import MagicMock, patch
+
+from django.db import connections
+from django.test import SimpleTestCase, override_settings
+
+from core.db import check_connections, mark_connections_used
+from core.pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+
+    def __init__(self, number):
+        self.number = number
+        self.usable = True
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeTimer:
+    '''a clock that jumps forward every time it is read'''
+
+    def __init__(self, step):
+        self.now = 0
+        self.step = step
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+
+def make_pool(max_size=2, timeout=1, timer=None):
+    opened = []
+
+    def connect():
+        opened.append(FakeConnection(len(opened)))
+        return opened[-1]
+
+    pool = ConnectionPool(
+        connect, max_size=max_size, timeout=timeout,
+        is_usable=lambda connection: connection.usable,
+        timer=timer or FakeTimer(0),
+    )
+    return pool, opened
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def test_released_connection_is_reused(self):
+        '''test that a released connection is handed out again'''
+        pool, opened = make_pool()
+        first = pool.acquire()
+        pool.release(first)
+
+        self.assertIs(pool.acquire(), first)
+        self.assertEqual(len(opened), 1)
+        self.assertEqual(pool.stats()['reused'], 1)
+
+    def test_connections_opened_up_to_max_size(self):
+        '''test that the pool opens new connections until it is full'''
+        pool, opened = make_pool(max_size=2)
+        pool.acquire()
+        pool.acquire()
+
+        stats = pool.stats()
+        self.assertEqual(stats['created'], 2)
+        self.assertEqual(stats['in_use'], 2)
+        self.assertEqual(stats['idle'], 0)
+
+    def test_acquire_times_out_when_full(self):
+        '''test that waiting past the timeout raises PoolTimeout'''
+        pool, opened = make_pool(max_size=1, timer=FakeTimer(step=1))
+        pool.acquire()
+
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+        self.assertEqual(len(opened), 1)
+
+    def test_unusable_connection_is_replaced(self):
+        '''test that a broken idle connection is closed and replaced'''
+        pool, opened = make_pool(max_size=1)
+        first = pool.acquire()
+        pool.release(first)
+        first.usable = False
+
+        second = pool.acquire()
+
+        self.assertIsNot(second, first)
+        self.assertTrue(first.closed)
+        self.assertEqual(pool.stats()['discarded'], 1)
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_failed_connect_frees_slot(self):
+        '''test that a connect error does not leak a pool slot'''
+        pool = ConnectionPool(
+            MagicMock(side_effect=OSError), max_size=1, timeout=0
+        )
+
+        with self.assertRaises(OSError):
+            pool.acquire()
+        self.assertEqual(pool.stats()['size'], 0)
+
+    def test_close_idle(self):
+        '''test that idle connections are closed and their slots freed'''
+        pool, opened = make_pool()
+        pool.release(pool.acquire())
+        pool.close_idle()
+
+        self.assertTrue(opened[0].closed)
+        self.assertEqual(pool.stats()['size'], 0)
+
+
+class CheckConnectionsTests(SimpleTestCase):
+
+    def _wrapper(self, usable, last_used=None):
+        wrapper = MagicMock(in_atomic_block=False, last_used=last_used)
+        wrapper.is_usable.return_value = usable
+        return wrapper
+
+    @override_settings(DB_CONN_HEALTH_CHECKS=True)
+    def test_unusable_connection_closed(self):
+        '''test that a dead persistent connection is closed'''
+        dead, alive = self._wrapper(False), self._wrapper(True)
+        with patch.object(connections, 'all', return_value=[dead, alive]):
+            check_connections()
+
+        dead.close.assert_called_once_with()
+        alive.close.assert_not_called()
+
+    @override_settings(DB_CONN_HEALTH_CHECKS=True,
+                       DB_CONN_HEALTH_CHECK_IDLE=30)
+    def test_recently_used_connection_not_pinged(self):
+        '''test that only connections idle past the threshold are pinged'''
+        busy = self._wrapper(True, last_used=100)
+        idle = self._wrapper(False, last_used=60)
+        with patch.object(connections, 'all', return_value=[busy, idle]), \
+                patch('core.db.time.monotonic', return_value=110):
+            check_connections()
+
+        busy.is_usable.assert_not_called()
+        idle.close.assert_called_once_with()
+
+    def test_finished_request_marks_connections(self):
+        '''test that open connections record when they were last used'''
+        opened = self._wrapper(True)
+        closed = self._wrapper(True)
+        closed.connection = None
+        with patch.object(connections, 'all', return_value=[opened, closed]), \
+                patch('core.db.time.monotonic', return_value=42):
+            mark_connections_used()
+
+        self.assertEqual(opened.last_used, 42)
+        self.assertIsNone(closed.last_used)
+
+    @override_settings(DB_CONN_HEALTH_CHECKS=False)
+    def test_checks_disabled(self):
+        '''test that nothing is checked when health checks are off'''
+        dead = self._wrapper(False)
+        with patch.object(connections, 'all', return_value=[dead]):
+            check_connections()
+
+        dead.is_usable.assert_not_called()
@@ -0,0 +1,79 @@
+'''
+collect where the time of the current request goes
+
+the middleware in core.middleware starts a RequestTimings for each request
+and stores it in a context variable, so it follows the request into
+sync_to_async threads and the async view pool. code that wants a phase
+reported wraps it in timed(name).
+'''
+import contextvars
+import time
+from contextlib import contextmanager
+
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    '''accumulated durations of one request, in seconds'''
+    __slots__ = ('started', 'queries', 'durations')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.durations = {}
+
+    def add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def start():
+    '''begin timing a request, returns the timings and a reset token'''
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def stop(token):
+    _current.reset(token)
+
+
+def current():
+    '''return the timings of the request being handled, if any'''
+    return _current.get()
+
+
+@contextmanager
+def timed(name):
+    '''add the time spent in the block to the current request's timings'''
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+def record_query(execute, sql, params, many, context):
+    '''database execute wrapper counting queries and their time'''
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.queries += 1
+        timings.add('db', time.perf_counter() - started)
+
+
+def install_query_timer(sender, connection, **kwargs):
+    '''connection_created receiver adding record_query to new connections'''
+    # first in the list so execute_wrapper() blocks still pop their own
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
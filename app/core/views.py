@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+from core.metrics import registry
+
+
+def metrics(request):
+    '''
+    expose the process metrics in the prometheus text format
+
+    the token is required whenever one is set; without one the metrics are
+    only served while DEBUG is on.
+    '''
+    token = settings.METRICS_TOKEN
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponseForbidden()
+    elif not constant_time_compare(
+            request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer ' + token):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
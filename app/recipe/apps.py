@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class RecipeConfig(AppConfig):
     name = 'recipe'
+
+    def ready(self):
+        '''connect the data change signals'''
+        import recipe.signals  # noqa: F401
@@ -0,0 +1,74 @@
+'''
+serve the recipe read endpoints from async views under asgi
+
+django 3.1 has no async orm and runs every sync view under asgi on one
+shared thread, so each request waits for all the others. the views here
+are coroutines that hand the existing drf view to a dedicated pool of
+ASYNC_VIEW_WORKERS threads, letting that many requests touch the database
+at once while the event loop stays free to accept more.
+'''
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from rest_framework.routers import DefaultRouter
+
+from core.timing import timed
+
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_VIEW_WORKERS,
+    thread_name_prefix='async-view',
+)
+
+
+def _run(view, request, *args, **kwargs):
+    '''call a sync view and render its response on a pool thread'''
+    # request_started/finished only tidy the connections of the thread
+    # that handles the signal, so pool threads tidy their own
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            with timed('render'):
+                response = response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def as_async_view(view):
+    '''return a coroutine view that runs the sync view on the view pool'''
+    @functools.wraps(view)
+    async def async_view(request, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        context = contextvars.copy_context()
+        call = functools.partial(
+            context.run, _run, view, request, *args, **kwargs
+        )
+        return await loop.run_in_executor(_executor, call)
+
+    return async_view
+
+
+class AsyncReadRouter(DefaultRouter):
+    '''
+    router that serves the list and detail routes from async views
+
+    only applies when ASYNC_READ_VIEWS is set, since under wsgi an async
+    view just adds an event loop to every request.
+    '''
+    async_routes = ('list', 'detail')
+
+    def get_urls(self):
+        urls = super().get_urls()
+        if not settings.ASYNC_READ_VIEWS:
+            return urls
+        for url in urls:
+            name = url.name or ''
+            if name.rsplit('-', 1)[-1] in self.async_routes:
+                url.callback = as_async_view(url.callback)
+        return urls
@@ -0,0 +1,385 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import ValidationError
+
+from core.models import Ingredient, Recipe, RecipeDocument, Tag
+from recipe import documents, images, stats
+from recipe.serializers import RecipeBulkItemSerializer
+from recipe.signals import deferred_sync, recipes_changed
+
+
+# payload key, related model and through table column for each m2m
+RELATIONS = (
+    ('tags', Tag, 'tag_id'),
+    ('ingredients', Ingredient, 'ingredient_id'),
+)
+
+BATCH_SIZE = 1000
+
+
+class BulkRecipeWriter:
+    '''
+    validate and save many recipe payloads for one user together
+
+    payloads with an id update that recipe, the rest are created. every
+    lookup is done once for the whole batch and the writes are issued with
+    bulk_create/bulk_update, so the statement count depends on the batch
+    size rather than the number of recipes.
+    '''
+    invalid_pk_message = _('Invalid pk "{pk_value}" - object does not exist.')
+
+    def __init__(self, user, items):
+        self.user = user
+        self.items = items
+
+    def is_valid(self):
+        '''validate every item, collecting per-item errors'''
+        items = self.items
+        if not isinstance(items, list):
+            raise ValidationError(
+                {'non_field_errors': [_('Expected a list of recipes.')]}
+            )
+        if len(items) > settings.RECIPE_BULK_MAX_ITEMS:
+            raise ValidationError({'non_field_errors': [
+                _('At most %d recipes can be written at once.')
+                % settings.RECIPE_BULK_MAX_ITEMS
+            ]})
+
+        self.errors = [{} for _item in items]
+        self.validated = [None] * len(items)
+        creator = RecipeBulkItemSerializer()
+        updater = RecipeBulkItemSerializer(partial=True)
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                self.errors[index] = {
+                    'non_field_errors': [_('Expected a recipe object.')]
+                }
+                continue
+            serializer = updater if 'id' in item else creator
+            try:
+                self.validated[index] = serializer.run_validation(item)
+            except ValidationError as exc:
+                self.errors[index] = exc.detail
+
+        self._check_recipes()
+        for key, model, _column in RELATIONS:
+            self._check_related(key, model)
+        return not any(self.errors)
+
+    def _valid(self):
+        '''yield the index and data of items that passed validation'''
+        for index, data in enumerate(self.validated):
+            if data is not None and not self.errors[index]:
+                yield index, data
+
+    def _check_recipes(self):
+        '''load the recipes being updated, rejecting unknown ids'''
+        ids = [data['id'] for _index, data in self._valid() if 'id' in data]
+        self.existing = Recipe.objects.filter(user=self.user).in_bulk(ids)
+        seen = set()
+        for index, data in self._valid():
+            if 'id' not in data:
+                continue
+            if data['id'] not in self.existing:
+                self.errors[index]['id'] = [
+                    self.invalid_pk_message.format(pk_value=data['id'])
+                ]
+            elif data['id'] in seen:
+                self.errors[index]['id'] = [
+                    _('Recipe updated more than once in this batch.')
+                ]
+            seen.add(data['id'])
+
+    def _check_related(self, key, model):
+        '''reject tag or ingredient ids the user does not own'''
+        ids = set()
+        for _index, data in self._valid():
+            ids.update(data.get(key, ()))
+        owned = set(model.objects.filter(
+            user=self.user, id__in=ids
+        ).values_list('id', flat=True))
+        for index, data in self._valid():
+            missing = [pk for pk in data.get(key, ()) if pk not in owned]
+            if missing:
+                self.errors[index][key] = [
+                    self.invalid_pk_message.format(pk_value=pk)
+                    for pk in missing
+                ]
+
+    def save(self):
+        '''write every item in one transaction and return their results'''
+        assert not any(self.errors), 'save() called on an invalid batch'
+        scalars = [
+            {
+                field: value for field, value in data.items()
+                if field not in ('id', 'tags', 'ingredients')
+            }
+            for data in self.validated
+        ]
+        recipes = [None] * len(self.validated)
+        results = [None] * len(self.validated)
+
+        with transaction.atomic(), deferred_sync():
+            created = []
+            updated = []
+            update_fields = set()
+            # recipes, price and time added to the user's totals
+            delta = [0, 0, 0]
+            for index, data in enumerate(self.validated):
+                if 'id' in data:
+                    recipe = self.existing[data['id']]
+                    delta[1] -= stats.to_decimal(recipe.price)
+                    delta[2] -= recipe.time_minutes
+                    for field, value in scalars[index].items():
+                        setattr(recipe, field, value)
+                    update_fields.update(scalars[index])
+                    updated.append(recipe)
+                    status = 'updated'
+                else:
+                    recipe = Recipe(user=self.user, **scalars[index])
+                    created.append(recipe)
+                    delta[0] += 1
+                    status = 'created'
+                delta[1] += stats.to_decimal(recipe.price)
+                delta[2] += recipe.time_minutes
+                recipes[index] = recipe
+                results[index] = status
+
+            self._create(created)
+            if updated and update_fields:
+                Recipe.objects.bulk_update(
+                    updated, sorted(update_fields), batch_size=BATCH_SIZE
+                )
+            relinked = {}
+            for key, _model, column in RELATIONS:
+                relinked[key] = self._link(key, column, recipes)
+            # bulk writes bypass the model signals, the counters are
+            # adjusted by what the batch changed rather than recounted
+            documents.refresh(recipe.pk for recipe in recipes)
+            for key, related_ids in relinked.items():
+                if related_ids:
+                    stats.recount_links(
+                        getattr(Recipe, key).through, related_ids
+                    )
+            if any(delta):
+                stats.count_recipe(self.user.pk, *delta)
+            recipes_changed.send(sender=Recipe, user_id=self.user.pk)
+
+        return [
+            {'id': recipe.id, 'status': status}
+            for recipe, status in zip(recipes, results)
+        ]
+
+    def _create(self, recipes):
+        '''insert new recipes, setting their primary keys'''
+        if connection.features.can_return_rows_from_bulk_insert:
+            Recipe.objects.bulk_create(recipes, batch_size=BATCH_SIZE)
+        else:
+            # without RETURNING we cannot learn the new ids in bulk. a raw
+            # save keeps the receivers from counting and building documents
+            # for each recipe, save() does that for the whole batch
+            for recipe in recipes:
+                recipe.save_base(raw=True)
+
+    def _link(self, key, column, recipes):
+        '''
+        replace the m2m rows of every item that supplied key
+
+        returns the related ids that gained or lost links.
+        '''
+        through = getattr(Recipe, key).through
+        replaced = []
+        rows = []
+        for recipe, data in zip(recipes, self.validated):
+            if key not in data:
+                continue
+            if 'id' in data:
+                replaced.append(recipe.id)
+            rows.extend(
+                through(recipe_id=recipe.id, **{column: pk})
+                for pk in dict.fromkeys(data[key])
+            )
+        related_ids = {getattr(row, column) for row in rows}
+        if replaced:
+            links = through.objects.filter(recipe_id__in=replaced)
+            related_ids.update(links.values_list(column, flat=True))
+            links.delete()
+        through.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+        return related_ids
+
+
+def _check_owned(user, data):
+    '''reject recipe, tag or ingredient ids the user does not own'''
+    errors = {}
+    models = (('recipes', Recipe),) + tuple(
+        (key, model) for key, model, _column in RELATIONS
+    )
+    for key, model in models:
+        ids = list(dict.fromkeys(data.get(key, ())))
+        if not ids:
+            continue
+        owned = set(model.objects.filter(
+            user=user, id__in=ids
+        ).values_list('id', flat=True))
+        missing = [pk for pk in ids if pk not in owned]
+        if missing:
+            errors[key] = [
+                BulkRecipeWriter.invalid_pk_message.format(pk_value=pk)
+                for pk in missing
+            ]
+    if errors:
+        raise ValidationError(errors)
+
+
+def _in(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def _insert_links(through, column, user, recipe_ids, related_ids):
+    '''add every missing link between recipe_ids and related_ids'''
+    quote = connection.ops.quote_name
+    related = through._meta.get_field(column[:-len('_id')]).related_model
+    sql = (
+        'INSERT INTO {links} ({recipe}, {column}) '
+        'SELECT r.{id}, x.{id} FROM {recipes} r, {related} x '
+        'WHERE r.{user} = %s AND r.{id} IN ({recipe_ids}) '
+        'AND x.{user} = %s AND x.{id} IN ({related_ids}) '
+        'AND NOT EXISTS (SELECT 1 FROM {links} l '
+        'WHERE l.{recipe} = r.{id} AND l.{column} = x.{id})'
+    ).format(
+        links=quote(through._meta.db_table),
+        recipes=quote(Recipe._meta.db_table),
+        related=quote(related._meta.db_table),
+        recipe=quote('recipe_id'),
+        column=quote(column),
+        id=quote('id'),
+        user=quote('user_id'),
+        recipe_ids=_in(recipe_ids),
+        related_ids=_in(related_ids),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql, [user.pk, *recipe_ids, user.pk, *related_ids]
+        )
+        return cursor.rowcount
+
+
+def _delete_links(through, column, user, recipe_ids, related_ids):
+    '''remove every link between recipe_ids and related_ids'''
+    deleted, _counts = through.objects.filter(**{
+        'recipe__user': user,
+        'recipe_id__in': recipe_ids,
+        '%s__in' % column: related_ids,
+    }).delete()
+    return deleted
+
+
+def _check_links(recipe_ids, data):
+    '''reject requests that would pair too many recipes and attributes'''
+    errors = {}
+    for key, _model, _column in RELATIONS:
+        pairs = len(recipe_ids) * len(set(data.get(key, ())))
+        if pairs > settings.RECIPE_BULK_MAX_LINKS:
+            errors[key] = [
+                _('At most %d recipe links can be changed at once.')
+                % settings.RECIPE_BULK_MAX_LINKS
+            ]
+    if errors:
+        raise ValidationError(errors)
+
+
+def _relink(user, data, write):
+    recipe_ids = list(dict.fromkeys(data['recipes']))
+    _check_links(recipe_ids, data)
+    _check_owned(user, data)
+    changed = {}
+    with transaction.atomic():
+        for key, _model, column in RELATIONS:
+            related_ids = list(dict.fromkeys(data.get(key, ())))
+            through = getattr(Recipe, key).through
+            changed[key] = write(
+                through, column, user, recipe_ids, related_ids
+            ) if related_ids else 0
+            if changed[key]:
+                stats.recount_links(through, related_ids)
+        # set based writes bypass the model signals
+        if any(changed.values()):
+            documents.refresh(recipe_ids)
+            recipes_changed.send(sender=Recipe, user_id=user.pk)
+    return changed
+
+
+def assign(user, data):
+    '''
+    link every recipe in data to every tag and ingredient in data
+
+    each relation costs one INSERT ... SELECT skipping the links that
+    already exist, however many recipes there are. returns the number of
+    links added per relation.
+    '''
+    return _relink(user, data, _insert_links)
+
+
+def unassign(user, data):
+    '''
+    unlink every recipe in data from every tag and ingredient in data
+
+    returns the number of links removed per relation.
+    '''
+    return _relink(user, data, _delete_links)
+
+
+def delete_recipes(user, recipe_ids):
+    '''
+    delete many recipes of user with a fixed number of statements
+
+    deleting through the orm would load every recipe and send its model
+    signals one by one, so the links, documents and counters those
+    maintain are deleted and adjusted here in bulk instead. images are
+    released once per distinct file.
+    '''
+    _check_owned(user, {'recipes': recipe_ids})
+    with transaction.atomic():
+        # the totals and images come from the locked rows, so an
+        # overlapping delete of the same ids waits and then finds them gone
+        # instead of taking them off the counters a second time
+        rows = list(Recipe.objects.select_for_update().filter(
+            user=user, id__in=list(dict.fromkeys(recipe_ids))
+        ).order_by('id').values_list('id', 'price', 'time_minutes', 'image'))
+        if not rows:
+            return 0
+        recipe_ids, prices, times, names = zip(*rows)
+
+        unlinked = {}
+        for key, _model, column in RELATIONS:
+            through = getattr(Recipe, key).through
+            links = through.objects.filter(recipe_id__in=recipe_ids)
+            unlinked[through] = set(links.values_list(column, flat=True))
+            links.delete()
+        RecipeDocument.objects.filter(recipe_id__in=recipe_ids).delete()
+
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM %s WHERE %s = %%s AND %s IN (%s)' % (
+                    quote(Recipe._meta.db_table), quote('user_id'),
+                    quote('id'), _in(recipe_ids),
+                ),
+                [user.pk, *recipe_ids]
+            )
+
+        stats.count_recipe(
+            user.pk, -len(rows), -sum(map(stats.to_decimal, prices)),
+            -sum(times), create=False
+        )
+        for through, related_ids in unlinked.items():
+            if related_ids:
+                stats.recount_links(through, related_ids)
+        image_counts = Counter(name for name in names if name)
+        for name, count in sorted(image_counts.items()):
+            images.release(name, count)
+        recipes_changed.send(sender=Recipe, user_id=user.pk)
+    return len(rows)
@@ -0,0 +1,136 @@
+'''
+precomputed read documents of recipes
+
+each recipe has a RecipeDocument holding its RecipeDetailSerializer
+representation, so detail and list reads fetch one row per recipe instead
+of the recipe, its tags and its ingredients, and skip the serializers.
+
+the receivers in recipe.signals rebuild documents whenever a recipe, its
+links or one of its tags or ingredients changes. writes that bypass the
+model signals call refresh() themselves, and the rebuild_recipe_documents
+command backfills the rest. reads fall back to building a missing document
+on the fly, so a stale backfill is slow rather than wrong.
+
+image fields are stored as storage names; their urls depend on the request
+and are built when a document is served.
+'''
+from django.db import transaction
+
+from core.models import Recipe, RecipeDocument, image_storage
+from recipe import rows
+
+
+RELATION_NAMES = tuple(dict(rows.RELATIONS))
+
+
+def build(recipe_ids, using='default'):
+    '''return {recipe id: (user id, document)} for the recipes that exist'''
+    recipes = list(Recipe.objects.using(using).filter(
+        id__in=recipe_ids
+    ).values(
+        'id', 'user_id', 'title', 'time_minutes', 'price', 'link', 'image',
+        'image_variants',
+    ))
+    ids = [recipe['id'] for recipe in recipes]
+    related = {
+        relation: rows.related_objects(relation, column, ids, using)
+        for relation, column in rows.RELATIONS
+    } if ids else {}
+    return {
+        recipe['id']: (recipe['user_id'], {
+            'id': recipe['id'],
+            'title': recipe['title'],
+            'ingredients': related['ingredients'][recipe['id']],
+            'tags': related['tags'][recipe['id']],
+            'time_minutes': recipe['time_minutes'],
+            'price': rows.to_price(recipe['price']),
+            'link': recipe['link'],
+            'image': recipe['image'] or None,
+            'image_variants': recipe['image_variants'],
+        })
+        for recipe in recipes
+    }
+
+
+def refresh(recipe_ids, create=True, using='default'):
+    '''
+    rebuild and store the documents of recipe_ids
+
+    the recipes are locked first, in id order, so concurrent refreshes of
+    the same recipe, say from renames of two of its tags, take turns
+    instead of both inserting its document.
+
+    with create off only documents that already exist are rewritten, which
+    is what cascading deletes want: the recipes being deleted have already
+    lost theirs and must not get new ones.
+    '''
+    documents = RecipeDocument.objects.using(using)
+    recipe_ids = set(recipe_ids)
+    if not recipe_ids:
+        return 0
+    with transaction.atomic(using=using):
+        recipes = Recipe.objects.using(using).select_for_update(
+            of=('self',)
+        ).filter(id__in=recipe_ids).order_by('id')
+        if not create:
+            recipes = recipes.filter(document__isnull=False)
+        recipe_ids = list(recipes.values_list('id', flat=True))
+        if not recipe_ids:
+            return 0
+        built = build(recipe_ids, using)
+        documents.filter(recipe_id__in=recipe_ids).delete()
+        documents.bulk_create(
+            RecipeDocument(recipe_id=recipe_id, user_id=user_id, data=data)
+            for recipe_id, (user_id, data) in built.items()
+        )
+    return len(built)
+
+
+def fill_missing(rows, key='document__data'):
+    '''
+    return the document stored under key in each values() row
+
+    rows without one get a document built on the fly, which costs the
+    queries the document was there to save.
+    '''
+    missing = [row['id'] for row in rows if row[key] is None]
+    built = build(missing) if missing else {}
+    return [
+        row[key] if row[key] is not None else built[row['id']][1]
+        for row in rows
+    ]
+
+
+def _url(name, request):
+    url = image_storage.url(name)
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def detail(document, request=None, fields=None):
+    '''return RecipeDetailSerializer output for a stored document'''
+    data = dict(document)
+    if data['image']:
+        data['image'] = _url(data['image'], request)
+    data['image_variants'] = {
+        variant: _url(name, request)
+        for variant, name in data['image_variants'].items()
+    }
+    if fields is not None:
+        return {name: data[name] for name in fields}
+    return data
+
+
+def list_item(document, fields=None, expand=()):
+    '''
+    return RecipeSerializer output for a stored document
+
+    relations named in expand stay nested objects, the others are
+    reduced to their ids.
+    '''
+    data = {}
+    for name in rows.RECIPE_OUTPUT if fields is None else fields:
+        value = document[name]
+        if name in RELATION_NAMES and name not in expand:
+            value = [related['id'] for related in value]
+        data[name] = value
+    return data
@@ -0,0 +1,54 @@
+import json
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from recipe.rows import RECIPE_FIELDS, recipe_rows
+
+
+CHUNK_SIZE = 2000
+
+
+def _chunks(iterable, size):
+    '''yield lists of up to size items from iterable'''
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def iter_recipes(queryset, chunk_size=CHUNK_SIZE):
+    '''
+    yield dicts shaped like RecipeSerializer output for queryset
+
+    rows are streamed from the database with a server side cursor and the
+    tags and ingredients of each chunk are loaded with one query apiece, so
+    memory use is bounded by the chunk size.
+    '''
+    rows = queryset.prefetch_related(None).values(
+        *RECIPE_FIELDS
+    ).iterator(chunk_size=chunk_size)
+
+    for chunk in _chunks(rows, chunk_size):
+        yield from recipe_rows(chunk)
+
+
+def _dumps(data):
+    return json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))
+
+
+def as_ndjson(items):
+    '''encode items as newline delimited json'''
+    for item in items:
+        yield _dumps(item) + '\n'
+
+
+def as_json_array(items):
+    '''encode items as a json array, one element at a time'''
+    yield '['
+    separator = ''
+    for item in items:
+        yield separator + _dumps(item)
+        separator = ','
+    yield ']'
@@ -0,0 +1,75 @@
+from django.db.models import Count, Exists, OuterRef
+from rest_framework.exceptions import ValidationError
+
+from core.models import Recipe
+
+
+# query parameter prefix -> column of the m2m through table
+RELATIONS = {
+    'tags': 'tag_id',
+    'ingredients': 'ingredient_id',
+}
+
+
+def params_to_ints(name, value):
+    '''convert a comma separated string of ids to a list of ints'''
+    try:
+        return sorted({int(str_id) for str_id in value.split(',')})
+    except ValueError:
+        raise ValidationError({name: 'Expected comma separated ids.'})
+
+
+def _links(relation, ids):
+    '''return the through table rows linking recipes to any of ids'''
+    through = Recipe._meta.get_field(relation).remote_field.through
+    return through.objects.filter(**{f'{RELATIONS[relation]}__in': ids})
+
+
+def match_any(queryset, relation, ids):
+    '''keep recipes linked to at least one of ids'''
+    return queryset.filter(
+        Exists(_links(relation, ids).filter(recipe_id=OuterRef('pk')))
+    )
+
+
+def match_all(queryset, relation, ids):
+    '''keep recipes linked to every one of ids'''
+    column = RELATIONS[relation]
+    matching = _links(relation, ids).values('recipe_id').annotate(
+        matched=Count(column)
+    ).filter(matched=len(ids)).values('recipe_id')
+    return queryset.filter(pk__in=matching)
+
+
+def match_none(queryset, relation, ids):
+    '''drop recipes linked to any of ids'''
+    return queryset.filter(
+        ~Exists(_links(relation, ids).filter(recipe_id=OuterRef('pk')))
+    )
+
+
+MODES = (
+    ('', match_any),
+    ('_all', match_all),
+    ('_exclude', match_none),
+)
+
+
+def filter_recipes(queryset, params):
+    '''
+    apply the tag and ingredient filters in params to queryset
+
+    for each relation `<relation>` keeps recipes with any of the ids,
+    `<relation>_all` those with all of them and `<relation>_exclude` those
+    with none. each is a semi-join through EXISTS or a grouped IN, so every
+    recipe is returned once however many of the ids it matches.
+    '''
+    for relation in RELATIONS:
+        for suffix, apply in MODES:
+            name = relation + suffix
+            value = params.get(name)
+            if value:
+                queryset = apply(
+                    queryset, relation, params_to_ints(name, value)
+                )
+    return queryset
@@ -0,0 +1,184 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from PIL import Image, ImageOps
+
+from core.models import Recipe, StoredFile, image_storage
+# the module rather than recipes_changed, recipe.signals imports this one
+from recipe import documents, signals
+
+
+logger = logging.getLogger(__name__)
+
+# variant name -> bounding box the image is shrunk to fit
+VARIANTS = {
+    'thumbnail': (150, 150),
+    'medium': (600, 600),
+    'large': (1200, 1200),
+}
+JPEG_QUALITY = 82
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.RECIPE_IMAGE_WORKERS,
+    thread_name_prefix='recipe-image',
+)
+
+
+def variant_name(name, variant):
+    '''return the storage name of one variant of an image'''
+    base, _extension = os.path.splitext(name)
+    return f'{base}_{variant}.jpg'
+
+
+def discard_variants(variants):
+    '''delete the files of a recipe's image variants'''
+    for name in variants.values():
+        image_storage.delete(name)
+
+
+def retain(name, count=1, content=None):
+    '''
+    count count more recipes using the image stored under name
+
+    the counter row stays locked until the surrounding transaction ends,
+    so collect() cannot delete the image in between. if it was collected
+    just before, after the upload found the file and skipped writing it,
+    content is stored again.
+    '''
+    with transaction.atomic():
+        updated = StoredFile.objects.filter(name=name).update(
+            references=F('references') + count
+        )
+        if not updated:
+            try:
+                with transaction.atomic():
+                    StoredFile.objects.create(name=name, references=count)
+            except IntegrityError:
+                StoredFile.objects.filter(name=name).update(
+                    references=F('references') + count
+                )
+        if content is not None and not image_storage.exists(name):
+            image_storage.save_as(name, content)
+
+
+def release(name, count=1):
+    '''
+    count count fewer recipes using an image
+
+    once none do, collect() deletes it after the surrounding transaction
+    commits, so a rollback never leaves recipes pointing at deleted files.
+    images that were never counted, stored before content addressing, are
+    left alone. returns whether the image was left unused.
+    '''
+    with transaction.atomic():
+        stored = StoredFile.objects.select_for_update().filter(
+            name=name
+        ).first()
+        if stored is None:
+            return False
+        references = max(stored.references - count, 0)
+        StoredFile.objects.filter(name=name).update(references=references)
+    if references:
+        return False
+    transaction.on_commit(lambda: collect(name))
+    return True
+
+
+def collect(name):
+    '''
+    delete an image and its variants if no recipe uses it any more
+
+    variants are named after the content of their image, so they are
+    shared with it and deleted along with it. the counter row is locked
+    until the files are gone, a concurrent retain() waits for that and
+    then finds the row missing.
+    '''
+    with transaction.atomic():
+        stored = StoredFile.objects.select_for_update().filter(
+            name=name, references=0
+        ).first()
+        if stored is None:
+            return False
+        stored.delete()
+        image_storage.delete(name)
+        discard_variants({
+            variant: variant_name(name, variant) for variant in VARIANTS
+        })
+    return True
+
+
+def _encode(image, size):
+    '''return image shrunk to fit size as progressive jpeg bytes'''
+    image = image.copy()
+    image.thumbnail(size, Image.LANCZOS)
+    buffer = BytesIO()
+    image.save(
+        buffer, 'JPEG',
+        quality=JPEG_QUALITY, optimize=True, progressive=True
+    )
+    return buffer.getvalue()
+
+
+def process_recipe_image(recipe_id):
+    '''generate and record the resized variants of a recipe's image'''
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or not recipe.image:
+        return
+    name = recipe.image.name
+
+    variants = {}
+    image = None
+    for variant, size in VARIANTS.items():
+        variants[variant] = variant_name(name, variant)
+        # another recipe with the same image may have made it already
+        if image_storage.exists(variants[variant]):
+            continue
+        if image is None:
+            with recipe.image.open('rb') as image_file:
+                image = Image.open(image_file)
+                image = ImageOps.exif_transpose(image).convert('RGB')
+        image_storage.save_as(
+            variants[variant], ContentFile(_encode(image, size))
+        )
+
+    # the image may have been replaced while we were working
+    updated = Recipe.objects.filter(pk=recipe_id, image=name).update(
+        image_variants=variants
+    )
+    if not updated:
+        if not StoredFile.objects.filter(
+            name=name, references__gt=0
+        ).exists():
+            discard_variants(variants)
+    else:
+        documents.refresh([recipe_id])
+        signals.recipes_changed.send(sender=Recipe, user_id=recipe.user_id)
+
+
+def _run(recipe_id):
+    try:
+        process_recipe_image(recipe_id)
+    except Exception:
+        logger.exception('processing image of recipe %s failed', recipe_id)
+    finally:
+        close_old_connections()
+
+
+def schedule(recipe):
+    '''
+    process a recipe's image once the current transaction commits
+
+    the work runs on a small thread pool so uploads return as soon as the
+    original is stored, unless RECIPE_IMAGE_ASYNC is off.
+    '''
+    recipe_id = recipe.pk
+    if settings.RECIPE_IMAGE_ASYNC:
+        transaction.on_commit(lambda: _executor.submit(_run, recipe_id))
+    else:
+        transaction.on_commit(lambda: process_recipe_image(recipe_id))
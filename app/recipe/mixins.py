@@ -0,0 +1,238 @@
+import hashlib
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from core.cache import LRUCache
+from core.metrics import registry, stats_collector
+from core.timing import timed
+from recipe import versions
+
+
+# user id, data version, path, query and media type -> rendered list page
+response_cache = LRUCache(
+    max_size=settings.RESPONSE_CACHE_SIZE,
+    ttl=settings.RESPONSE_CACHE_TTL,
+    max_bytes=settings.RESPONSE_CACHE_MAX_TOTAL_BYTES,
+    sizeof=lambda cached: len(cached[0]),
+)
+registry.register(stats_collector(
+    'recipe_response_cache', 'List response cache',
+    response_cache.stats, counters=('hits', 'misses', 'evictions'),
+))
+
+
+def request_version(request):
+    '''return the user's data version, looked up once per request'''
+    version = getattr(request, '_data_version', None)
+    if version is None:
+        version = versions.get_version(request.user.pk)
+        request._data_version = version
+    return version
+
+
+def invalidate_user_responses(user_id):
+    '''drop every cached response belonging to a user'''
+    return response_cache.delete_where(lambda key, value: key[0] == user_id)
+
+
+class VersionedETagMixin:
+    '''
+    tag read responses with an etag derived from the user's data version
+
+    a request whose If-None-Match holds the current etag is answered with
+    304 before any query or serializer runs.
+    '''
+
+    def get_etag(self, request):
+        '''return the etag of this request's representation'''
+        key = '|'.join((
+            str(request.user.pk),
+            request_version(request),
+            request.get_full_path(),
+            request.accepted_media_type or '',
+        ))
+        return '"%s"' % hashlib.md5(key.encode('utf-8')).hexdigest()
+
+    def conditional(self, view, request, *args, **kwargs):
+        '''run view unless the client already holds the current version'''
+        etag = self.get_etag(request)
+        client_etags = {
+            tag[2:] if tag.startswith('W/') else tag
+            for tag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        }
+        if etag in client_etags or '*' in client_etags:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = view(request, *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK,
+                                    status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            patch_vary_headers(response, ('Accept', 'Authorization'))
+        return response
+
+
+class VersionedListMixin(VersionedETagMixin):
+    '''conditional GET for the list action'''
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+
+class VersionedRetrieveMixin(VersionedETagMixin):
+    '''conditional GET for the retrieve action'''
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
+
+
+class DocumentRetrieveMixin:
+    '''
+    retrieve from a precomputed document instead of the serializer
+
+    views return the representation from get_document(), or None to fall
+    back to the regular retrieve.
+    '''
+
+    def get_document(self):
+        '''return the representation of the requested object, or None'''
+        raise NotImplementedError
+
+    def retrieve(self, request, *args, **kwargs):
+        data = self.get_document()
+        if data is None:
+            return super().retrieve(request, *args, **kwargs)
+        return Response(data)
+
+
+class CachedListMixin:
+    '''
+    serve repeated identical list requests from an in-process cache
+
+    entries are keyed on the user's data version, so any write to their
+    recipes, tags or ingredients makes the old entries unreachable, and the
+    recipes_changed signal evicts them straight away.
+    '''
+
+    def get_cache_key(self, request):
+        '''return the key of this request's rendered response'''
+        query = tuple(sorted(
+            (name, tuple(values))
+            for name, values in request.query_params.lists()
+        ))
+        return (
+            request.user.pk,
+            request_version(request),
+            # pagination links embed the host
+            request.get_host(),
+            request.path,
+            query,
+            request.accepted_media_type,
+        )
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+
+        key = self.get_cache_key(request)
+        cached = response_cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = super().list(request, *args, **kwargs)
+
+        def store(rendered):
+            if rendered.status_code == status.HTTP_200_OK and \
+                    len(rendered.content) <= settings.RESPONSE_CACHE_MAX_BYTES:
+                response_cache.set(
+                    key, (rendered.content, rendered['Content-Type'])
+                )
+        response.add_post_render_callback(store)
+        return response
+
+
+class SparseFieldsMixin:
+    '''
+    let clients choose the fields of read responses with ?fields=a,b
+
+    the serializer drops the fields that were not asked for, and views use
+    get_requested_fields() to load only the columns and relations left.
+    '''
+    fields_param = 'fields'
+
+    def get_requested_fields(self):
+        '''return the requested fields in serializer order, or None'''
+        if self.request.method not in SAFE_METHODS:
+            return None
+        value = self.request.query_params.get(self.fields_param)
+        if not value:
+            return None
+
+        requested = {name.strip() for name in value.split(',')} - {''}
+        available = self.get_serializer_class().Meta.fields
+        unknown = requested.difference(available)
+        if unknown:
+            raise ValidationError({self.fields_param: [
+                'Unknown fields: %s.' % ', '.join(sorted(unknown))
+            ]})
+        return tuple(name for name in available if name in requested)
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_requested_fields()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        return super().get_serializer(*args, **kwargs)
+
+
+class ValuesListMixin:
+    '''
+    list from values() rows instead of model and serializer instances
+
+    views name the columns to load in list_fields and turn a page of rows
+    into its representation in get_list_rows. with SparseFieldsMixin only
+    the requested columns are loaded.
+    '''
+    list_fields = ()
+
+    def get_list_rows(self, rows):
+        '''return the representation of a page of values() rows'''
+        raise NotImplementedError
+
+    def get_list_fields(self):
+        '''return the columns to load for each row'''
+        requested = getattr(self, 'get_requested_fields', lambda: None)()
+        if requested is None:
+            return list(self.list_fields)
+        # id is always loaded, relations are looked up by it
+        return ['id'] + [
+            field for field in self.list_fields
+            if field in requested and field != 'id'
+        ]
+
+    def get_list_queryset(self):
+        '''return the values() queryset the list action pages through'''
+        # the pagination ordering reads its columns from each row
+        ordering = [
+            field.lstrip('-') for field in getattr(self, 'ordering', ())
+        ]
+        fields = self.get_list_fields()
+        fields += [field for field in ordering if field not in fields]
+        queryset = self.filter_queryset(self.get_queryset())
+        return queryset.prefetch_related(None).values(*fields)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_list_queryset()
+        page = self.paginate_queryset(queryset)
+        rows = list(queryset) if page is None else page
+        with timed('serialize'):
+            data = self.get_list_rows(rows)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
@@ -0,0 +1,190 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+def _split(field):
+    '''split an ordering term into its field name and descending flag'''
+    if field.startswith('-'):
+        return field[1:], True
+    return field, False
+
+
+def _output_field(queryset, name):
+    '''return the model or annotation field a queryset can be ordered by'''
+    annotation = queryset.query.annotations.get(name)
+    if annotation is not None:
+        return annotation.output_field
+    if name == 'pk':
+        return queryset.model._meta.pk
+    return queryset.model._meta.get_field(name)
+
+
+def _value(row, field):
+    '''read a field from a model instance or a values() dict'''
+    if isinstance(row, dict):
+        return row[field]
+    return getattr(row, field)
+
+
+class KeysetPagination(BasePagination):
+    '''
+    paginate by seeking past the last row seen rather than using OFFSET
+
+    the ordering should match an index and end in a unique column so every
+    page, however deep, is a single index range scan, and no COUNT(*) is run.
+    views may override the ordering with an `ordering` attribute.
+    '''
+    ordering = ('-id',)
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = _('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        '''return a single page of rows after the requested cursor'''
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.fields = [_split(field) for field in self.get_ordering(view)]
+
+        position, reverse = self.decode_cursor(request)
+        fields = self.fields
+        if reverse:
+            fields = [(name, not desc) for name, desc in fields]
+
+        queryset = queryset.order_by(
+            *[('-' if desc else '') + name for name, desc in fields]
+        )
+        if position is not None:
+            position = self.clean_position(position, queryset)
+            queryset = queryset.filter(self._seek(fields, position))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        has_next = has_more if not reverse else position is not None
+        has_previous = has_more if reverse else position is not None
+        self.next_position = None
+        self.previous_position = None
+        if rows and has_next:
+            self.next_position = self._position(rows[-1])
+        if rows and has_previous:
+            self.previous_position = self._position(rows[0])
+
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_ordering(self, view):
+        '''return the ordering for the view, falling back to our default'''
+        return getattr(view, 'ordering', None) or self.ordering
+
+    def get_page_size(self, request):
+        '''return the requested page size, capped at max_page_size'''
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, reverse=True)
+
+    def encode_cursor(self, position, reverse):
+        '''build a url pointing at the page on the far side of position'''
+        payload = json.dumps({'p': position, 'r': int(reverse)})
+        token = base64.urlsafe_b64encode(payload.encode('utf-8'))
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, token.decode('ascii')
+        )
+
+    def decode_cursor(self, request):
+        '''return the (position, reverse) pair held in the request cursor'''
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            payload = json.loads(
+                base64.urlsafe_b64decode(token.encode('ascii'))
+            )
+            position = payload['p']
+            reverse = bool(payload['r'])
+        except (TypeError, ValueError, KeyError, UnicodeError,
+                binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or \
+                len(position) != len(self.fields):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def clean_position(self, position, queryset):
+        '''
+        convert the values of a decoded position to their ordering fields
+
+        cursors come from the client, so anything that is not a value of
+        its field is rejected rather than reaching the database.
+        '''
+        cleaned = []
+        for (name, _desc), value in zip(self.fields, position):
+            if value is None or isinstance(value, (list, dict)):
+                raise NotFound(self.invalid_cursor_message)
+            try:
+                cleaned.append(_output_field(queryset, name).to_python(value))
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+        return cleaned
+
+    def _position(self, row):
+        '''return the ordering values of row'''
+        return [_value(row, name) for name, _desc in self.fields]
+
+    def _seek(self, fields, position):
+        '''build a filter for rows strictly after position in this order'''
+        seek = Q()
+        for index, (name, desc) in enumerate(fields):
+            term = Q(**{
+                f'{name}__{"lt" if desc else "gt"}': position[index]
+            })
+            for prior, value in zip(fields[:index], position):
+                term &= Q(**{prior[0]: value})
+            seek |= term
+        return seek
@@ -0,0 +1,17 @@
+from rest_framework.renderers import BaseRenderer
+
+from recipe.export import as_ndjson
+
+
+class NDJSONRenderer(BaseRenderer):
+    '''render a list as newline delimited json, one item per line'''
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not isinstance(data, list):
+            data = [data]
+        return ''.join(as_ndjson(data)).encode(self.charset)
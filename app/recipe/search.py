@@ -0,0 +1,76 @@
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, IntegerField, Value
+from django.db.models.expressions import RawSQL
+
+
+# ranks are scaled to integers so keyset cursors compare them exactly
+RANK_SCALE = 10 ** 9
+MAX_TERMS = 8
+TERM = re.compile(r'\w+', re.UNICODE)
+
+
+def terms(query):
+    '''split a search string into the words to match'''
+    return TERM.findall(query)[:MAX_TERMS]
+
+
+def _postgresql(queryset, words):
+    '''match titles against the gin indexed search_vector column'''
+    tsquery = ' & '.join(f'{word}:*' for word in words)
+    matches = RawSQL(
+        '"core_recipe"."search_vector" @@ '
+        "to_tsquery('pg_catalog.english', %s)",
+        (tsquery,),
+        output_field=BooleanField(),
+    )
+    rank = RawSQL(
+        '(ts_rank("core_recipe"."search_vector", '
+        "to_tsquery('pg_catalog.english', %s)) * %s)::bigint",
+        (tsquery, RANK_SCALE),
+        output_field=IntegerField(),
+    )
+    return queryset.filter(matches).annotate(rank=rank)
+
+
+def _sqlite(queryset, words):
+    '''match titles against the core_recipe_fts fts5 table'''
+    match = ' AND '.join('"%s"*' % word for word in words)
+    # bm25() is only available when the fts table is joined into the query
+    # being matched, and is lower for better matches, so negate it
+    rank = RawSQL(
+        'CAST(-bm25("core_recipe_fts") * %s AS INTEGER)',
+        (RANK_SCALE,),
+        output_field=IntegerField(),
+    )
+    return queryset.extra(
+        tables=['core_recipe_fts'],
+        where=[
+            '"core_recipe_fts"."rowid" = "core_recipe"."id"',
+            '"core_recipe_fts" MATCH %s',
+        ],
+        params=[match],
+    ).annotate(rank=rank)
+
+
+BACKENDS = {
+    'postgresql': _postgresql,
+    'sqlite': _sqlite,
+}
+
+
+def search_recipes(queryset, query):
+    '''
+    filter queryset to recipes whose title matches every word of query
+
+    the last letters of each word may be missing, so partial input matches.
+    matches are annotated with an integer rank, higher for better matches.
+    '''
+    words = terms(query)
+    if not words:
+        # still annotated, the view orders and pages searches by rank
+        return queryset.none().annotate(
+            rank=Value(0, output_field=IntegerField())
+        )
+    return BACKENDS[connection.vendor](queryset, words)
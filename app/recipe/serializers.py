@@ -1,8 +1,21 @@
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
-from core.models import Tag, Ingredient, Recipe
+from core.models import Tag, Ingredient, Recipe, image_storage
 
 
-class TagSerializer(serializers.ModelSerializer):
+class DynamicFieldsMixin:
+    '''drop every field not named in the optional fields argument'''
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class TagSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     '''serializer for tag objects'''
 
     class Meta:
@@ -11,7 +24,8 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(DynamicFieldsMixin,
+                           serializers.ModelSerializer):
     '''serializer for ingredient objects'''
 
     class Meta:
@@ -20,7 +34,7 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     '''serialize a recipe'''
     ingredients = serializers.PrimaryKeyRelatedField(
         many=True,
@@ -39,16 +53,80 @@ class RecipeSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
+class RecipeBulkItemSerializer(serializers.ModelSerializer):
+    '''validate one recipe of a bulk write without querying the database'''
+    id = serializers.IntegerField(required=False)
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False
+    )
+    tags = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False
+    )
+
+    class Meta:
+        model = Recipe
+        fields = ('id', 'title', 'ingredients', 'tags', 'time_minutes',
+                  'price', 'link')
+
+
+def _id_list(**kwargs):
+    return serializers.ListField(
+        child=serializers.IntegerField(),
+        max_length=settings.RECIPE_BULK_MAX_ITEMS,
+        **kwargs
+    )
+
+
+class RecipeBulkDeleteSerializer(serializers.Serializer):
+    '''validate the recipe ids of a bulk delete'''
+    recipes = _id_list(allow_empty=False)
+
+
+class RecipeBulkLinkSerializer(RecipeBulkDeleteSerializer):
+    '''validate the recipe and related ids of a bulk assign or unassign'''
+    tags = _id_list(required=False)
+    ingredients = _id_list(required=False)
+
+    def validate(self, data):
+        if not data.get('tags') and not data.get('ingredients'):
+            raise serializers.ValidationError(
+                _('Give tags or ingredients to link.')
+            )
+        return data
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    '''render stored image variant names as urls'''
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        urls = {}
+        for variant, name in value.items():
+            url = image_storage.url(name)
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[variant] = url
+        return urls
+
+
 class RecipeDetailSerializer(RecipeSerializer):
     '''serializer a recipe detail'''
     ingredients = IngredientSerializer(many=True, read_only=True)
     tags = TagSerializer(many=True, read_only=True)
+    image_variants = ImageVariantsField()
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ('image', 'image_variants')
+        read_only_fields = ('id', 'image')
 
 
 class RecipeImageSerializer(serializers.ModelSerializer):
     '''serializer for uploading image to recipes'''
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'image')
+        fields = ('id', 'image', 'image_variants')
         read_only_fields = ('id',)
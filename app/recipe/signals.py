@@ -0,0 +1,237 @@
+import contextvars
+from contextlib import contextmanager
+
+from django.db.models.signals import m2m_changed, post_delete, \
+    post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+
+from core.models import Ingredient, IngredientStats, Recipe, Tag, TagStats
+from recipe import documents, images, stats, versions
+from recipe.mixins import invalidate_user_responses
+
+
+# sent with user_id whenever recipe data owned by that user changes,
+# including bulk writes that bypass the model signals
+recipes_changed = Signal()
+
+# recipe ids and user ids touched inside deferred_sync(), if any
+_pending = contextvars.ContextVar('recipe_sync_pending', default=None)
+
+
+@contextmanager
+def deferred_sync():
+    '''
+    rebuild documents and bump versions once for the writes in the block
+
+    saving a recipe and setting its links sends several signals, each of
+    which would otherwise rebuild the document and bump the version on its
+    own. the block collects the recipes and users instead and syncs them
+    when it ends without an error, so it has to run inside the transaction
+    of the writes.
+    '''
+    if _pending.get() is not None:
+        yield
+        return
+    pending = (set(), set())
+    token = _pending.set(pending)
+    try:
+        yield
+    finally:
+        _pending.reset(token)
+    recipe_ids, user_ids = pending
+    documents.refresh(sorted(recipe_ids))
+    for user_id in sorted(user_ids):
+        sync_user(user_id)
+
+
+def sync_user(user_id):
+    versions.bump_version(user_id)
+    invalidate_user_responses(user_id)
+
+
+def refresh_documents(recipe_ids):
+    pending = _pending.get()
+    if pending is None:
+        documents.refresh(recipe_ids)
+    else:
+        pending[0].update(recipe_ids)
+
+
+@receiver(recipes_changed)
+def bump_data_version(sender, user_id, **kwargs):
+    pending = _pending.get()
+    if pending is None:
+        sync_user(user_id)
+    else:
+        pending[1].add(user_id)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def row_changed(sender, instance, **kwargs):
+    recipes_changed.send(sender=sender, user_id=instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def links_changed(sender, instance, action, **kwargs):
+    if action.startswith('post_'):
+        recipes_changed.send(sender=sender, user_id=instance.user_id)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_documents([instance.pk])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_links_changed(sender, instance, action, reverse, pk_set,
+                         **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            refresh_documents([instance.pk])
+    elif action == 'pre_clear':
+        # the links are gone by post_clear, which has no pk_set
+        instance._cleared_recipe_ids = list(
+            instance.recipe_set.values_list('id', flat=True)
+        )
+    elif action == 'post_clear':
+        refresh_documents(instance.__dict__.pop('_cleared_recipe_ids', ()))
+    elif action.startswith('post_'):
+        refresh_documents(pk_set)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def attribute_saved(sender, instance, created, raw=False, **kwargs):
+    # documents embed names, a new tag or ingredient has no recipes yet
+    if not created and not raw:
+        documents.refresh(
+            instance.recipe_set.values_list('id', flat=True), create=False
+        )
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def attribute_deleting(sender, instance, **kwargs):
+    instance._linked_recipe_ids = list(
+        instance.recipe_set.values_list('id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def attribute_deleted(sender, instance, **kwargs):
+    # when a whole user is deleted their recipes may be gone already,
+    # create=False keeps those from getting their documents back
+    documents.refresh(
+        instance.__dict__.pop('_linked_recipe_ids', ()), create=False
+    )
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_previous(sender, instance, raw=False, update_fields=None,
+                      **kwargs):
+    instance._previous = None
+    # the upload, in case retain() has to store it again
+    instance._upload = None
+    if not raw and instance.image and not instance.image._committed:
+        instance._upload = instance.image.file
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and not {
+        'price', 'time_minutes', 'image'
+    }.intersection(update_fields):
+        return
+    instance._previous = Recipe.objects.filter(
+        pk=instance.pk
+    ).values_list('price', 'time_minutes', 'image').first()
+
+
+@receiver(post_save, sender=Recipe)
+def count_saved_recipe(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    price = stats.to_decimal(instance.price)
+    previous = instance.__dict__.get('_previous')
+    if created or previous is None:
+        if created:
+            stats.count_recipe(
+                instance.user_id, 1, price, instance.time_minutes
+            )
+        return
+    old_price, old_time_minutes, _old_image = previous
+    if price != old_price or instance.time_minutes != old_time_minutes:
+        stats.count_recipe(
+            instance.user_id, 0, price - old_price,
+            instance.time_minutes - old_time_minutes
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def count_image(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    # count_saved_recipe has read _previous by now
+    previous = instance.__dict__.pop('_previous', None)
+    upload = instance.__dict__.pop('_upload', None)
+    if created:
+        old_image = ''
+    elif previous is None:
+        return
+    else:
+        old_image = previous[2] or ''
+    image = instance.image.name or ''
+    if image != old_image:
+        if image:
+            images.retain(image, content=upload)
+        if old_image:
+            images.release(old_image)
+
+
+@receiver(pre_delete, sender=Recipe)
+def uncount_recipe_links(sender, instance, **kwargs):
+    # the links are deleted with the recipe without m2m_changed
+    for stats_model, name in stats.COUNTERS.values():
+        stats.uncount_links(stats_model, name, instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def uncount_recipe(sender, instance, **kwargs):
+    stats.count_recipe(
+        instance.user_id, -1, -stats.to_decimal(instance.price),
+        -instance.time_minutes, create=False
+    )
+    if instance.image:
+        images.release(instance.image.name)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def count_links(sender, instance, action, reverse, pk_set, **kwargs):
+    stats_model, name = stats.COUNTERS[sender]
+    if reverse:
+        if action.startswith('post_'):
+            stats.recount(stats_model, name, instance)
+    elif action == 'post_add':
+        stats.count_links(stats_model, pk_set, instance.user_id)
+    elif action == 'pre_remove':
+        stats.uncount_links(stats_model, name, instance, pk_set)
+    elif action == 'pre_clear':
+        stats.uncount_links(stats_model, name, instance)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def track_attribute(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        stats_model = TagStats if sender is Tag else IngredientStats
+        stats_model.objects.create(
+            pk=instance.pk, user_id=instance.user_id
+        )
@@ -0,0 +1,215 @@
+'''
+per user recipe aggregates kept in counter tables
+
+RecipeStats holds each user's recipe count and the totals of their prices
+and times, TagStats and IngredientStats how many recipes use each tag and
+ingredient. the receivers in recipe.signals adjust them with F()
+expressions as recipes and links are written, so reading the stats costs
+one row per tag and ingredient however many recipes there are.
+
+a user without a RecipeStats row has not been counted yet, because their
+data predates the counters or was written by the seeder. their stats are
+computed with GROUP BY queries instead, their next recipe write stores
+them, and the rebuild_recipe_stats command fills them in for everyone.
+counters are only ever created by writes that add something; deletes only
+decrement, so cascades never recreate rows for users being deleted.
+'''
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from core.models import (
+    Ingredient, IngredientStats, Recipe, RecipeStats, Tag, TagStats
+)
+from recipe import rows
+
+
+# stats key, related model, counter model and its key for each m2m
+RELATIONS = (
+    ('tags', Tag, TagStats, 'tag'),
+    ('ingredients', Ingredient, IngredientStats, 'ingredient'),
+)
+COUNTERS = {
+    Recipe.tags.through: (TagStats, 'tag'),
+    Recipe.ingredients.through: (IngredientStats, 'ingredient'),
+}
+
+_price = Recipe._meta.get_field('price')
+
+
+def to_decimal(price):
+    '''return a price assigned to a recipe as the Decimal it is stored as'''
+    return _price.to_python(price)
+
+
+def _count(user_ids, using='default'):
+    '''
+    count the stats of user_ids from the recipes and links themselves
+
+    returns {user id: (recipes, price total, time total)} and, per
+    relation, a list of (id, name, user id, recipes).
+    '''
+    totals = {user_id: (0, 0, 0) for user_id in user_ids}
+    for row in Recipe.objects.using(using).filter(
+        user_id__in=user_ids
+    ).values('user_id').annotate(
+        recipes=Count('id'),
+        price_total=Sum('price'),
+        time_minutes_total=Sum('time_minutes'),
+    ).order_by():
+        totals[row['user_id']] = (
+            row['recipes'], row['price_total'], row['time_minutes_total']
+        )
+    related = {
+        key: list(model.objects.using(using).filter(
+            user_id__in=user_ids
+        ).annotate(recipes=Count('recipe')).values_list(
+            'id', 'name', 'user_id', 'recipes'
+        ).order_by())
+        for key, model, _stats_model, _name in RELATIONS
+    }
+    return totals, related
+
+
+def rebuild(user_ids, using='default'):
+    '''
+    recount and store the stats of user_ids
+
+    the RecipeStats rows are created if missing and locked before anything
+    is counted, so concurrent rebuilds of a user, such as two first writes
+    at once, run one after the other instead of inserting the same rows.
+    '''
+    user_ids = sorted(set(user_ids))
+    with transaction.atomic(using=using):
+        recipe_stats = RecipeStats.objects.using(using)
+        recipe_stats.bulk_create(
+            [RecipeStats(user_id=user_id) for user_id in user_ids],
+            ignore_conflicts=True,
+        )
+        counters = list(recipe_stats.select_for_update().filter(
+            user_id__in=user_ids
+        ).order_by('user_id'))
+        totals, related = _count(user_ids, using)
+        for counter in counters:
+            counter.recipes, counter.price_total, \
+                counter.time_minutes_total = totals[counter.user_id]
+        recipe_stats.bulk_update(
+            counters, ['recipes', 'price_total', 'time_minutes_total']
+        )
+        for key, _model, stats_model, name in RELATIONS:
+            stats_model.objects.using(using).filter(
+                user_id__in=user_ids
+            ).delete()
+            stats_model.objects.using(using).bulk_create(
+                stats_model(**{
+                    '%s_id' % name: related_id, 'user_id': user_id,
+                    'recipes': recipes,
+                })
+                for related_id, _name, user_id, recipes in related[key]
+            )
+    return len(user_ids)
+
+
+def count_recipe(user_id, recipes, price, time_minutes, create=True):
+    '''
+    add to the recipe totals of a user
+
+    a user who has not been counted yet is recounted from scratch, after
+    the write being counted, unless create is off.
+    '''
+    updated = RecipeStats.objects.filter(user_id=user_id).update(
+        recipes=F('recipes') + recipes,
+        price_total=F('price_total') + price,
+        time_minutes_total=F('time_minutes_total') + time_minutes,
+    )
+    if not updated and create:
+        rebuild([user_id])
+
+
+def count_links(stats_model, related_ids, user_id):
+    '''count one more recipe for each related id'''
+    related_ids = set(related_ids)
+    if not related_ids:
+        return
+    updated = stats_model.objects.filter(pk__in=related_ids).update(
+        recipes=F('recipes') + 1
+    )
+    if updated < len(related_ids):
+        rebuild([user_id])
+
+
+def uncount_links(stats_model, name, recipe, related_ids=None):
+    '''count one recipe less for the related rows still linked to recipe'''
+    counters = stats_model.objects.filter(**{'%s__recipe' % name: recipe})
+    if related_ids is not None:
+        counters = counters.filter(pk__in=related_ids)
+    counters.update(recipes=F('recipes') - 1)
+
+
+def recount(stats_model, name, instance):
+    '''count the recipes of one tag or ingredient again'''
+    stats_model.objects.update_or_create(
+        **{name: instance},
+        defaults={
+            'user_id': instance.user_id,
+            'recipes': instance.recipe_set.count(),
+        }
+    )
+
+
+def recount_links(through, related_ids):
+    '''count the recipes of many tags or ingredients again at once'''
+    stats_model, name = COUNTERS[through]
+    links = through.objects.filter(**{name: OuterRef('pk')}).order_by() \
+        .values(name).annotate(count=Count('*')).values('count')
+    stats_model.objects.filter(pk__in=related_ids).update(
+        recipes=Coalesce(Subquery(links), 0)
+    )
+
+
+def _summary(totals, related):
+    recipes, price_total, time_minutes_total = totals
+    summary = {
+        'recipes': recipes,
+        'average_price': None,
+        'average_time_minutes': None,
+    }
+    if recipes:
+        summary['average_price'] = rows.to_price(price_total / recipes)
+        summary['average_time_minutes'] = round(
+            time_minutes_total / recipes, 2
+        )
+    for key, items in related.items():
+        summary[key] = [
+            {'id': related_id, 'name': name, 'recipes': count}
+            for related_id, name, count in sorted(
+                items, key=lambda item: (-item[2], item[1], item[0])
+            )
+        ]
+    return summary
+
+
+def summary(user_id):
+    '''
+    return the recipe count, averages and recipes per tag and ingredient
+
+    read from the counters, or with GROUP BY queries for a user who has
+    not been counted yet.
+    '''
+    stats = RecipeStats.objects.filter(user_id=user_id).first()
+    if stats is None:
+        totals, related = _count([user_id])
+        return _summary(totals[user_id], {
+            key: [(related_id, name, count)
+                  for related_id, name, _user_id, count in items]
+            for key, items in related.items()
+        })
+    return _summary(
+        (stats.recipes, stats.price_total, stats.time_minutes_total),
+        {
+            key: list(stats_model.objects.filter(
+                user_id=user_id
+            ).values_list('pk', '%s__name' % name, 'recipes'))
+            for key, _model, stats_model, name in RELATIONS
+        }
+    )
@@ -43,7 +43,7 @@ class PrivateIngredientsApiTests(TestCase):
         ingredients = Ingredient.objects.all().order_by('-name')
         serializer = IngredientSerializer(ingredients, many=True)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data['results'], serializer.data)
 
     def test_ingredients_limited_to_user(self):
         '''test that ingredients for the authenticated user are returned'''
@@ -57,8 +57,27 @@ class PrivateIngredientsApiTests(TestCase):
 
         response = self.client.get(INGREDIENT_URL)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['name'], ingredient.name)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['name'], ingredient.name)
+
+    def test_autocomplete_ingredients(self):
+        '''test listing assigned ingredients starting with a prefix'''
+        egg = Ingredient.objects.create(user=self.user, name='Eggs')
+        Ingredient.objects.create(user=self.user, name='Eggplant')
+        Ingredient.objects.create(user=self.user, name='Cheese')
+        recipe = Recipe.objects.create(
+            title='Omelette', time_minutes=5, price=3, user=self.user
+        )
+        recipe.ingredients.add(egg)
+
+        response = self.client.get(INGREDIENT_URL, {'q': 'EGG'})
+        self.assertEqual([item['name'] for item in response.data],
+                         ['Eggplant', 'Eggs'])
+
+        response = self.client.get(
+            INGREDIENT_URL, {'q': 'egg', 'assigned_only': 1}
+        )
+        self.assertEqual(response.data, [{'id': egg.id, 'name': 'Eggs'}])
 
     def test_create_ingredient_successful(self):
         '''test create new ingredient'''
@@ -100,8 +119,8 @@ class PrivateIngredientsApiTests(TestCase):
 
         serializer1 = IngredientSerializer(ingredient1)
         serializer2 = IngredientSerializer(ingredient2)
-        self.assertIn(serializer1.data, response.data)
-        self.assertNotIn(serializer2.data, response.data)
+        self.assertIn(serializer1.data, response.data['results'])
+        self.assertNotIn(serializer2.data, response.data['results'])
 
     def test_retrieve_ingredients_assigned_unique(self):
         '''test filtering ingredients by assigned returns unique items'''
@@ -124,4 +143,4 @@ class PrivateIngredientsApiTests(TestCase):
 
         response = self.client.get(INGREDIENT_URL, {'assigned_only': 1})
 
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
@@ -1,15 +1,58 @@
+import asyncio
+import base64
+from contextlib import contextmanager
 import tempfile
 import os
+import json
+from unittest.mock import patch
 from PIL import Image
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.test import TestCase, TransactionTestCase, override_settings, \
+    skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
-from rest_framework.test import APIClient
-from core.models import Recipe, Tag, Ingredient
-from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APIRequestFactory, \
+    force_authenticate
+from core.asgi import get_asgi_application
+from core.models import Recipe, RecipeDocument, RecipeStats, StoredFile, \
+    Tag, Ingredient
+from recipe.serializers import RecipeSerializer, RecipeDetailSerializer, \
+    TagSerializer
+from recipe import documents, images, stats, versions
+from recipe.asyncviews import AsyncReadRouter, as_async_view
+from recipe.views import RecipeViewSet
+from recipe.mixins import response_cache
 
 RECIPES_URL = reverse('recipe:recipe-list')
+BULK_URL = reverse('recipe:recipe-bulk-write')
+BULK_ASSIGN_URL = reverse('recipe:recipe-bulk-assign')
+BULK_UNASSIGN_URL = reverse('recipe:recipe-bulk-unassign')
+BULK_DELETE_URL = reverse('recipe:recipe-bulk-delete')
+STATS_URL = reverse('recipe:recipe-stats')
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+def cursor(position, reverse=False):
+    '''build a cursor token for a hand made position'''
+    payload = json.dumps({'p': position, 'r': int(reverse)})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+@contextmanager
+def run_on_commit():
+    '''run the on_commit callbacks registered in the block'''
+    callbacks = connection.run_on_commit
+    start = len(callbacks)
+    yield
+    for _sids, func in callbacks[start:]:
+        func()
 
 
 def image_upload_url(recipe_id):
@@ -78,7 +121,7 @@ class PrivateRecipeApiTests(TestCase):
         serializer = RecipeSerializer(recipes, many=True)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data['results'], serializer.data)
 
     def test_recipes_limited_to_user(self):
         '''test retrieving recipes for user'''
@@ -94,8 +137,8 @@ class PrivateRecipeApiTests(TestCase):
         serializer = RecipeSerializer(recipes, many=True)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'], serializer.data)
 
     def test_view_recipe_detail(self):
         '''test viewing a recipe detail'''
@@ -108,6 +151,97 @@ class PrivateRecipeApiTests(TestCase):
         serializer = RecipeDetailSerializer(recipe)
         self.assertEqual(response.data, serializer.data)
 
+    @override_settings(DATA_VERSION_STORE='cache')
+    def test_list_recipes_query_count_is_constant(self):
+        '''test listing recipes does not query once per recipe'''
+        for i in range(10):
+            recipe = sample_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(sample_tag(user=self.user, name=f'Tag {i}'))
+            recipe.ingredients.add(
+                sample_ingredient(user=self.user, name=f'Ingredient {i}')
+            )
+
+        # one query for the recipes and their stored documents
+        with self.assertNumQueries(1):
+            response = self.client.get(RECIPES_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 10)
+
+    @override_settings(DATA_VERSION_STORE='cache')
+    def test_view_recipe_detail_query_count(self):
+        '''test viewing a recipe detail reads only its stored document'''
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(sample_tag(user=self.user))
+        recipe.tags.add(sample_tag(user=self.user, name='Vegan'))
+        recipe.ingredients.add(sample_ingredient(user=self.user))
+
+        with self.assertNumQueries(1):
+            response = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['tags']), 2)
+
+    def test_list_recipes_paginated_by_cursor(self):
+        '''test paging through recipes newest first without gaps'''
+        recipes = [
+            sample_recipe(user=self.user, title=f'Recipe {i}')
+            for i in range(5)
+        ]
+
+        response = self.client.get(RECIPES_URL, {'page_size': 2})
+        seen = [item['id'] for item in response.data['results']]
+        self.assertIsNone(response.data['previous'])
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            seen.extend(item['id'] for item in response.data['results'])
+
+        self.assertEqual(seen, [recipe.id for recipe in reversed(recipes)])
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(
+            [item['id'] for item in response.data['results']],
+            [recipes[2].id, recipes[1].id]
+        )
+
+    def test_list_recipes_does_not_count(self):
+        '''test paginating recipes never runs a COUNT or OFFSET query'''
+        for i in range(3):
+            sample_recipe(user=self.user, title=f'Recipe {i}')
+        response = self.client.get(RECIPES_URL, {'page_size': 1})
+
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(response.data['next'])
+
+        for query in context.captured_queries:
+            self.assertNotIn('COUNT(', query['sql'].upper())
+            self.assertNotIn('OFFSET', query['sql'].upper())
+
+    def test_list_recipes_invalid_cursor(self):
+        '''test that a malformed cursor is rejected'''
+        response = self.client.get(RECIPES_URL, {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_recipes_cursor_with_bad_values(self):
+        '''test that cursors holding values of the wrong type are rejected'''
+        sample_recipe(user=self.user, title='Chicken curry')
+
+        for position in (['abc'], [None], [{'id': 1}], [[1]]):
+            response = self.client.get(
+                RECIPES_URL, {'cursor': cursor(position)}
+            )
+            self.assertEqual(
+                response.status_code, status.HTTP_404_NOT_FOUND, position
+            )
+
+            response = self.client.get(RECIPES_URL, {
+                'search': 'chicken', 'cursor': cursor([1] + position),
+            })
+            self.assertEqual(
+                response.status_code, status.HTTP_404_NOT_FOUND, position
+            )
+
     def test_create_basic_recipe(self):
         '''test creating recipe'''
         payload = {
@@ -201,7 +335,39 @@ class PrivateRecipeApiTests(TestCase):
         tags = recipe.tags.all()
         self.assertEqual(len(tags), 0)
 
+    @override_settings(DATA_VERSION_STORE='cache')
+    def test_full_update_recipe_query_count(self):
+        '''test a put rebuilds the document once however many links move'''
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(sample_tag(user=self.user))
+        tag = sample_tag(user=self.user, name='Curry')
+        ingredient = sample_ingredient(user=self.user)
+        payload = {
+            'title': 'Tikka Curry',
+            'time_minutes': 25,
+            'price': 5.00,
+            'tags': [tag.id],
+            'ingredients': [ingredient.id],
+        }
+
+        with CaptureQueriesContext(connection) as queries:
+            with self.assertNumQueries(30):
+                res = self.client.put(detail_url(recipe.id), payload)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        rebuilds = [
+            query for query in queries.captured_queries
+            if query['sql'].startswith('DELETE FROM "core_recipedocument"')
+        ]
+        self.assertEqual(len(rebuilds), 1)
+        self.assertEqual(
+            RecipeDocument.objects.get(recipe=recipe).data['tags'],
+            [{'id': tag.id, 'name': 'Curry'}]
+        )
+
 
+# processing is scheduled on commit, which run_on_commit() triggers
+@override_settings(RECIPE_IMAGE_ASYNC=False)
 class RecipeImageUploadTests(TestCase):
 
     def setUp(self):
@@ -214,8 +380,18 @@ class RecipeImageUploadTests(TestCase):
         self.recipe = sample_recipe(user=self.user)
 
     def tearDown(self):
+        self.recipe.refresh_from_db()
+        images.discard_variants(self.recipe.image_variants)
         self.recipe.image.delete()
 
+    def _upload(self, size=(10, 10), recipe=None):
+        url = image_upload_url((recipe or self.recipe).id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            img = Image.new('RGB', size)
+            img.save(ntf, format='JPEG')
+            ntf.seek(0)
+            return self.client.post(url, {'image': ntf}, format='multipart')
+
     def test_upload_image_to_recipe(self):
         '''test uploading image to recipe'''
         url = image_upload_url(self.recipe.id)
@@ -232,6 +408,155 @@ class RecipeImageUploadTests(TestCase):
         self.assertIn('image', response.data)
         self.assertTrue(os.path.exists(self.recipe.image.path))
 
+    def test_upload_image_schedules_processing(self):
+        '''test that resizing is left to the background pipeline'''
+        with patch('recipe.images.schedule') as schedule:
+            response = self._upload()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['image_variants'], {})
+        schedule.assert_called_once()
+        self.assertEqual(schedule.call_args[0][0].id, self.recipe.id)
+
+    def test_process_image_variants(self):
+        '''test that processing lists resized variants on the recipe'''
+        self._upload(size=(2000, 1000))
+
+        images.process_recipe_image(self.recipe.id)
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(set(self.recipe.image_variants), set(images.VARIANTS))
+        thumbnail = self.recipe.image_variants['thumbnail']
+        with images.image_storage.open(thumbnail) as image_file:
+            self.assertEqual(Image.open(image_file).size, (150, 75))
+
+        response = self.client.get(detail_url(self.recipe.id))
+        self.assertEqual(
+            response.data['image'],
+            'http://testserver' + self.recipe.image.url
+        )
+        self.assertTrue(
+            response.data['image_variants']['thumbnail'].endswith(
+                thumbnail.split('/')[-1]
+            )
+        )
+
+    def test_reupload_discards_old_variants(self):
+        '''test that replacing an image removes the old variants'''
+        self._upload()
+        images.process_recipe_image(self.recipe.id)
+        self.recipe.refresh_from_db()
+        old_variants = self.recipe.image_variants
+        old_image = self.recipe.image.name
+
+        with run_on_commit():
+            response = self._upload(size=(20, 20))
+
+        self.assertEqual(response.data['image_variants'], {})
+        self.assertFalse(images.image_storage.exists(old_image))
+        for name in old_variants.values():
+            self.assertFalse(images.image_storage.exists(name))
+
+    def test_identical_uploads_share_one_file(self):
+        '''test that recipes with the same image share its file'''
+        other = sample_recipe(user=self.user)
+        self._upload()
+        self._upload(recipe=other)
+        images.process_recipe_image(self.recipe.id)
+        self.recipe.refresh_from_db()
+        other.refresh_from_db()
+        name = self.recipe.image.name
+
+        self.assertEqual(other.image.name, name)
+        self.assertRegex(
+            name, r'^upload/recipe/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$'
+        )
+        self.assertEqual(StoredFile.objects.get(name=name).references, 2)
+
+        with run_on_commit():
+            other.delete()
+        self.assertTrue(images.image_storage.exists(name))
+        self.assertEqual(StoredFile.objects.get(name=name).references, 1)
+
+        with run_on_commit():
+            self.recipe.delete()
+        self.assertFalse(images.image_storage.exists(name))
+        for variant in self.recipe.image_variants.values():
+            self.assertFalse(images.image_storage.exists(variant))
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+        self.recipe = sample_recipe(user=self.user)
+
+    def test_rolled_back_delete_keeps_image(self):
+        '''test that images are only deleted once the delete commits'''
+        self._upload()
+        self.recipe.refresh_from_db()
+        name = self.recipe.image.name
+
+        with run_on_commit():
+            try:
+                with transaction.atomic():
+                    Recipe.objects.get(pk=self.recipe.pk).delete()
+                    raise RuntimeError('roll back')
+            except RuntimeError:
+                pass
+
+        self.assertTrue(images.image_storage.exists(name))
+        self.assertEqual(StoredFile.objects.get(name=name).references, 1)
+
+    def test_image_retained_before_commit_is_kept(self):
+        '''test that an image used again before collection survives'''
+        other = sample_recipe(user=self.user)
+        self._upload()
+        self.recipe.refresh_from_db()
+        name = self.recipe.image.name
+
+        with run_on_commit():
+            self.recipe.delete()
+            self._upload(recipe=other)
+
+        self.assertTrue(images.image_storage.exists(name))
+        self.assertEqual(StoredFile.objects.get(name=name).references, 1)
+        self.recipe = other
+
+    def test_retain_stores_collected_upload_again(self):
+        '''test that retaining a just collected image writes it back'''
+        name = images.image_storage.save(
+            'upload/recipe/a.jpg', ContentFile(b'image')
+        )
+        images.retain(name)
+        images.release(name)
+        self.assertTrue(images.collect(name))
+        self.assertFalse(images.image_storage.exists(name))
+
+        images.retain(name, content=ContentFile(b'image'))
+
+        self.assertTrue(images.image_storage.exists(name))
+        self.assertEqual(StoredFile.objects.get(name=name).references, 1)
+        images.image_storage.delete(name)
+
+    def test_bulk_delete_releases_images(self):
+        '''test that bulk deletes drop the images no recipe uses'''
+        other = sample_recipe(user=self.user)
+        self._upload()
+        self._upload(recipe=other)
+        self.recipe.refresh_from_db()
+        name = self.recipe.image.name
+
+        with run_on_commit():
+            self.client.post(
+                BULK_DELETE_URL, {'recipes': [self.recipe.id]}, format='json'
+            )
+        self.assertTrue(images.image_storage.exists(name))
+        self.assertEqual(StoredFile.objects.get(name=name).references, 1)
+
+        with run_on_commit():
+            self.client.post(
+                BULK_DELETE_URL, {'recipes': [other.id]}, format='json'
+            )
+        self.assertFalse(images.image_storage.exists(name))
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+        self.recipe = sample_recipe(user=self.user)
+
     def test_upload_image_bad_request(self):
         '''test uploading an invalid image'''
         url = image_upload_url(self.recipe.id)
@@ -260,9 +585,9 @@ class RecipeImageUploadTests(TestCase):
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
 
-        self.assertIn(serializer1.data, response.data)
-        self.assertIn(serializer2.data, response.data)
-        self.assertNotIn(serializer3.data, response.data)
+        self.assertIn(serializer1.data, response.data['results'])
+        self.assertIn(serializer2.data, response.data['results'])
+        self.assertNotIn(serializer3.data, response.data['results'])
 
     def test_filter_recipes_by_ingredients(self):
         '''test returning recipes with specific ingredients'''
@@ -282,6 +607,1243 @@ class RecipeImageUploadTests(TestCase):
         serializer1 = RecipeSerializer(recipe1)
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
-        self.assertIn(serializer1.data, response.data)
-        self.assertIn(serializer2.data, response.data)
-        self.assertNotIn(serializer3.data, response.data)
+        self.assertIn(serializer1.data, response.data['results'])
+        self.assertIn(serializer2.data, response.data['results'])
+        self.assertNotIn(serializer3.data, response.data['results'])
+
+
+class RecipeFilterTests(TestCase):
+    '''test combining tag and ingredient filters on recipes'''
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.vegan = sample_tag(user=self.user, name='Vegan')
+        self.quick = sample_tag(user=self.user, name='Quick')
+        self.tofu = sample_ingredient(user=self.user, name='Tofu')
+        self.curry = sample_recipe(user=self.user, title='Tofu curry')
+        self.curry.tags.add(self.vegan, self.quick)
+        self.curry.ingredients.add(self.tofu)
+        self.salad = sample_recipe(user=self.user, title='Salad')
+        self.salad.tags.add(self.vegan)
+        self.steak = sample_recipe(user=self.user, title='Steak')
+        self.steak.tags.add(self.quick)
+
+    def _ids(self, params):
+        response = self.client.get(RECIPES_URL, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(item['id'] for item in response.data['results'])
+
+    def test_match_any_returns_each_recipe_once(self):
+        '''test recipes matching several tags are not duplicated'''
+        ids = self._ids({'tags': f'{self.vegan.id},{self.quick.id}'})
+
+        self.assertEqual(
+            ids, sorted([self.curry.id, self.salad.id, self.steak.id])
+        )
+
+    def test_match_all(self):
+        '''test keeping only recipes with every tag'''
+        ids = self._ids({'tags_all': f'{self.vegan.id},{self.quick.id}'})
+
+        self.assertEqual(ids, [self.curry.id])
+
+    def test_exclude(self):
+        '''test dropping recipes with any excluded tag'''
+        ids = self._ids({'tags_exclude': f'{self.quick.id}'})
+
+        self.assertEqual(ids, [self.salad.id])
+
+    def test_combine_tags_and_ingredients(self):
+        '''test mixing modes across tags and ingredients'''
+        ids = self._ids({
+            'tags': f'{self.vegan.id}',
+            'ingredients_exclude': f'{self.tofu.id}',
+        })
+
+        self.assertEqual(ids, [self.salad.id])
+
+    def test_invalid_ids_rejected(self):
+        '''test that non numeric ids are a bad request'''
+        response = self.client.get(RECIPES_URL, {'tags_all': 'a,b'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecipeBulkWriteTests(TestCase):
+    '''test creating and updating recipes in bulk'''
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = sample_tag(user=self.user)
+        self.ingredient = sample_ingredient(user=self.user)
+
+    def test_bulk_create_recipes(self):
+        '''test creating many recipes with their tags and ingredients'''
+        payload = [
+            {
+                'title': f'Recipe {i}',
+                'time_minutes': 10,
+                'price': '5.00',
+                'tags': [self.tag.id],
+                'ingredients': [self.ingredient.id],
+            }
+            for i in range(20)
+        ]
+
+        response = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 20)
+        ids = [result['id'] for result in response.data]
+        recipes = Recipe.objects.filter(id__in=ids, user=self.user)
+        self.assertEqual(recipes.count(), 20)
+        self.assertEqual(
+            Recipe.tags.through.objects.filter(recipe_id__in=ids).count(), 20
+        )
+        self.assertEqual(
+            Recipe.objects.get(id=ids[3]).title, 'Recipe 3'
+        )
+
+    def test_bulk_update_recipes(self):
+        '''test updating recipes replaces only the supplied fields'''
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(self.tag)
+        new_tag = sample_tag(user=self.user, name='Curry')
+        payload = [
+            {'id': recipe.id, 'title': 'Renamed', 'tags': [new_tag.id]},
+            {'title': 'New', 'time_minutes': 5, 'price': '1.00'},
+        ]
+
+        response = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data[0], {
+            'id': recipe.id, 'status': 'updated'
+        })
+        self.assertEqual(response.data[1]['status'], 'created')
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'Renamed')
+        self.assertEqual(recipe.time_minutes, 10)
+        self.assertEqual(list(recipe.tags.all()), [new_tag])
+
+    def test_bulk_write_is_all_or_nothing(self):
+        '''test that one invalid item rejects the whole batch'''
+        user2 = get_user_model().objects.create_user(
+            'other@gmail.com',
+            'testpass'
+        )
+        other_tag = sample_tag(user=user2)
+        payload = [
+            {'title': 'Fine', 'time_minutes': 5, 'price': '1.00'},
+            {'title': 'No time', 'price': '1.00'},
+            {'title': 'Stolen', 'time_minutes': 5, 'price': '1.00',
+             'tags': [other_tag.id]},
+        ]
+
+        response = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('time_minutes', response.data[1])
+        self.assertIn('tags', response.data[2])
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_update_query_count_is_constant(self):
+        '''test that the statement count does not grow per recipe'''
+        def update_all(count):
+            recipes = [sample_recipe(user=self.user) for i in range(count)]
+            payload = [
+                {'id': recipe.id, 'title': 'Updated', 'tags': [self.tag.id]}
+                for recipe in recipes
+            ]
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post(BULK_URL, payload, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(context)
+
+        self.assertEqual(update_all(2), update_all(10))
+
+    def test_bulk_create_query_count_is_constant(self):
+        '''test that creating more recipes issues no more statements'''
+        def create(count):
+            payload = [
+                {'title': 'New', 'time_minutes': 5, 'price': '1.00',
+                 'tags': [self.tag.id], 'ingredients': [self.ingredient.id]}
+                for i in range(count)
+            ]
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post(BULK_URL, payload, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            return len(context)
+
+        # without RETURNING each new recipe is inserted on its own
+        inserts = 0 if connection.features.can_return_rows_from_bulk_insert \
+            else 9
+        # the first write stores the stats of a user not counted yet
+        create(1)
+        self.assertEqual(create(1) + inserts, create(10))
+
+    def test_bulk_write_adjusts_stats(self):
+        '''test that the stored stats match a recount after a bulk write'''
+        recipe = sample_recipe(user=self.user, price='3.00')
+        recipe.tags.add(self.tag)
+        new_tag = sample_tag(user=self.user, name='Curry')
+        self.client.post(BULK_URL, [
+            {'id': recipe.id, 'price': '7.50', 'tags': [new_tag.id]},
+            {'title': 'New', 'time_minutes': 5, 'price': '1.00',
+             'ingredients': [self.ingredient.id]},
+        ], format='json')
+
+        counted = self.client.get(STATS_URL).data
+        RecipeStats.objects.all().delete()
+        self.assertEqual(counted, self.client.get(STATS_URL).data)
+        self.assertEqual(counted['recipes'], 2)
+        self.assertEqual(counted['average_price'], '4.25')
+
+
+class RecipeBulkLinkTests(TestCase):
+    '''test assigning, unassigning and deleting many recipes at once'''
+
+    def setUp(self):
+        response_cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.vegan = sample_tag(user=self.user, name='Vegan')
+        self.quick = sample_tag(user=self.user, name='Quick')
+        self.egg = sample_ingredient(user=self.user, name='Egg')
+        self.recipes = [
+            sample_recipe(user=self.user, title=f'Recipe {i}')
+            for i in range(3)
+        ]
+        self.recipes[0].tags.add(self.vegan)
+        self.ids = [recipe.id for recipe in self.recipes]
+
+    def _more_recipes(self, count):
+        return self.ids + [
+            sample_recipe(user=self.user).id for _ in range(count)
+        ]
+
+    def test_bulk_assign(self):
+        '''test linking tags and ingredients to every recipe'''
+        response = self.client.post(BULK_ASSIGN_URL, {
+            'recipes': self.ids,
+            'tags': [self.vegan.id, self.quick.id],
+            'ingredients': [self.egg.id],
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'tags': 5, 'ingredients': 3})
+        for recipe in self.recipes:
+            self.assertEqual(set(recipe.tags.all()), {self.vegan, self.quick})
+            document = RecipeDocument.objects.get(recipe=recipe).data
+            self.assertEqual({tag['name'] for tag in document['tags']},
+                             {'Vegan', 'Quick'})
+        summary = self.client.get(STATS_URL).data
+        self.assertEqual([tag['recipes'] for tag in summary['tags']], [3, 3])
+
+    def test_bulk_unassign(self):
+        '''test unlinking tags from every recipe'''
+        self.recipes[1].tags.add(self.vegan, self.quick)
+
+        response = self.client.post(BULK_UNASSIGN_URL, {
+            'recipes': self.ids, 'tags': [self.vegan.id],
+        }, format='json')
+
+        self.assertEqual(response.data, {'tags': 2, 'ingredients': 0})
+        self.assertFalse(self.vegan.recipe_set.exists())
+        self.assertEqual(list(self.recipes[1].tags.all()), [self.quick])
+        listed = self.client.get(RECIPES_URL, {'tags': self.vegan.id})
+        self.assertEqual(listed.data['results'], [])
+
+    def test_bulk_assign_statement_count_constant(self):
+        '''test that linking more recipes issues no more statements'''
+        payload = {'tags': [self.quick.id], 'ingredients': [self.egg.id]}
+        with CaptureQueriesContext(connection) as few:
+            self.client.post(BULK_ASSIGN_URL, dict(
+                payload, recipes=self.ids
+            ), format='json')
+        ids = self._more_recipes(20)
+        with CaptureQueriesContext(connection) as many:
+            self.client.post(BULK_ASSIGN_URL, dict(
+                payload, recipes=ids
+            ), format='json')
+
+        self.assertEqual(len(few), len(many))
+
+    def test_bulk_link_other_users_ids_rejected(self):
+        '''test that recipes and tags of other users are not linked'''
+        other = get_user_model().objects.create_user(
+            'other@gmail.com', 'testpass'
+        )
+        recipe = sample_recipe(user=other)
+        tag = sample_tag(user=other)
+
+        response = self.client.post(BULK_ASSIGN_URL, {
+            'recipes': self.ids + [recipe.id], 'tags': [tag.id],
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn(str(recipe.id), response.data['recipes'][0])
+        self.assertIn(str(tag.id), response.data['tags'][0])
+        self.assertFalse(tag.recipe_set.exists())
+
+    @override_settings(RECIPE_BULK_MAX_LINKS=5)
+    def test_bulk_assign_too_many_links_rejected(self):
+        '''test that the recipes x tags product is limited'''
+        response = self.client.post(BULK_ASSIGN_URL, {
+            'recipes': self.ids,
+            'tags': [self.vegan.id, self.quick.id],
+            'ingredients': [self.egg.id],
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags', response.data)
+        self.assertNotIn('ingredients', response.data)
+        self.assertFalse(self.quick.recipe_set.exists())
+
+    def test_bulk_link_needs_tags_or_ingredients(self):
+        '''test that assigning nothing is a bad request'''
+        response = self.client.post(
+            BULK_ASSIGN_URL, {'recipes': self.ids}, format='json'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_delete(self):
+        '''test deleting many recipes with their links and counters'''
+        self.client.get(RECIPES_URL)
+
+        response = self.client.post(
+            BULK_DELETE_URL, {'recipes': self.ids[:2]}, format='json'
+        )
+
+        self.assertEqual(response.data, {'deleted': 2})
+        self.assertEqual(list(Recipe.objects.values_list('id', flat=True)),
+                         self.ids[2:])
+        self.assertFalse(self.vegan.recipe_set.exists())
+        self.assertEqual(RecipeDocument.objects.count(), 1)
+        listed = self.client.get(RECIPES_URL)
+        self.assertEqual([item['id'] for item in listed.data['results']],
+                         self.ids[2:])
+        counted = self.client.get(STATS_URL).data
+        RecipeStats.objects.all().delete()
+        self.assertEqual(counted, self.client.get(STATS_URL).data)
+        self.assertEqual(counted['recipes'], 1)
+
+    def test_bulk_delete_statement_count_constant(self):
+        '''test that deleting more recipes issues no more statements'''
+        with CaptureQueriesContext(connection) as few:
+            self.client.post(
+                BULK_DELETE_URL, {'recipes': self.ids}, format='json'
+            )
+        ids = self._more_recipes(20)[3:]
+        Recipe.objects.get(id=ids[0]).tags.add(self.vegan)
+        with CaptureQueriesContext(connection) as many:
+            self.client.post(
+                BULK_DELETE_URL, {'recipes': ids}, format='json'
+            )
+
+        self.assertEqual(len(few), len(many))
+        self.assertFalse(Recipe.objects.exists())
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_bulk_delete_locks_recipes_first(self):
+        '''test that the counters are taken from locked recipe rows'''
+        with CaptureQueriesContext(connection) as context:
+            self.client.post(
+                BULK_DELETE_URL, {'recipes': self.ids}, format='json'
+            )
+
+        sql = [query['sql'] for query in context.captured_queries]
+        locks = [
+            index for index, query in enumerate(sql)
+            if 'FOR UPDATE' in query and '"core_recipe"."price"' in query
+        ]
+        deletes = [
+            index for index, query in enumerate(sql)
+            if query.startswith('DELETE FROM "core_recipe" ')
+        ]
+        self.assertEqual(len(locks), 1)
+        self.assertLess(locks[0], deletes[0])
+
+    def test_bulk_delete_other_users_recipes_rejected(self):
+        '''test that other users' recipes are left alone'''
+        other = get_user_model().objects.create_user(
+            'other@gmail.com', 'testpass'
+        )
+        recipe = sample_recipe(user=other)
+
+        response = self.client.post(
+            BULK_DELETE_URL, {'recipes': [self.ids[0], recipe.id]},
+            format='json'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Recipe.objects.count(), 4)
+
+
+class RecipeExportTests(TestCase):
+    '''test streaming every recipe of a user'''
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipes = []
+        for i in range(5):
+            recipe = sample_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(sample_tag(user=self.user, name=f'Tag {i}'))
+            recipe.ingredients.add(sample_ingredient(user=self.user))
+            self.recipes.append(recipe)
+        sample_recipe(
+            user=get_user_model().objects.create_user('other@gmail.com')
+        )
+
+    def _content(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_export_ndjson(self):
+        '''test exporting recipes as newline delimited json'''
+        response = self.client.get(EXPORT_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = self._content(response).splitlines()
+        expected = RecipeSerializer(self.recipes, many=True).data
+        self.assertEqual([json.loads(line) for line in lines],
+                         json.loads(json.dumps(expected)))
+
+    def test_export_json_array(self):
+        '''test exporting recipes as a json array'''
+        response = self.client.get(EXPORT_URL, {'format': 'json'})
+
+        self.assertEqual(response['Content-Type'], 'application/json')
+        data = json.loads(self._content(response))
+        self.assertEqual([item['id'] for item in data],
+                         [recipe.id for recipe in self.recipes])
+
+    def test_export_chunks_relations(self):
+        '''test tags and ingredients are loaded once per chunk'''
+        response = self.client.get(EXPORT_URL)
+
+        with self.assertNumQueries(3):
+            self._content(response)
+
+    def test_export_applies_filters(self):
+        '''test exporting only recipes matching the filters'''
+        tag = self.recipes[0].tags.get()
+        response = self.client.get(EXPORT_URL, {'tags': tag.id})
+
+        lines = self._content(response).splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0])['id'], self.recipes[0].id)
+
+
+class RecipeConditionalGetTests(TestCase):
+    '''test answering unchanged reads with 304 not modified'''
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(user=self.user)
+
+    @override_settings(DATA_VERSION_STORE='cache')
+    def test_matching_etag_not_modified(self):
+        '''test a repeat list with the etag skips every query'''
+        response = self.client.get(RECIPES_URL)
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    @override_settings(DATA_VERSION_STORE='database')
+    def test_database_versions_see_other_processes_writes(self):
+        '''test that versions kept in the database do not go stale'''
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # another process writes; this one's local cache never hears of it
+        versions.bump_version(self.user.id)
+        cache.clear()
+
+        response = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_process_local_cache_keeps_versions_in_database(self):
+        '''test that the version store follows the cache backend'''
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }}):
+            self.assertEqual(versions.get_store(), 'database')
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+        }}):
+            self.assertEqual(versions.get_store(), 'cache')
+        with override_settings(DATA_VERSION_STORE='cache'):
+            self.assertEqual(versions.get_store(), 'cache')
+
+    def test_other_users_etag_not_matched(self):
+        '''test that users at the same version get different etags'''
+        other = get_user_model().objects.create_user(
+            'other@gmail.com', 'testpass'
+        )
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        client = APIClient()
+        client.force_authenticate(other)
+        response = client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['results'], [])
+
+    def test_etag_differs_per_query(self):
+        '''test that filtered lists carry their own etag'''
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        response = self.client.get(
+            RECIPES_URL, {'tags': '1'}, HTTP_IF_NONE_MATCH=etag
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_write_changes_etag(self):
+        '''test that recipe, tag and m2m writes invalidate the etag'''
+        url = detail_url(self.recipe.id)
+        writes = [
+            lambda: sample_recipe(user=self.user),
+            lambda: self.recipe.tags.add(sample_tag(user=self.user)),
+            lambda: Tag.objects.filter(user=self.user).get().delete(),
+            lambda: self.client.post(BULK_URL, [
+                {'id': self.recipe.id, 'title': 'New'}
+            ], format='json'),
+        ]
+        for write in writes:
+            etag = self.client.get(url)['ETag']
+            write()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_other_users_writes_keep_etag(self):
+        '''test that another user's writes do not invalidate ours'''
+        etag = self.client.get(RECIPES_URL)['ETag']
+        sample_recipe(
+            user=get_user_model().objects.create_user('other@gmail.com')
+        )
+
+        response = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class RecipeSearchTests(TestCase):
+    '''test searching recipe titles'''
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def _titles(self, query, **params):
+        response = self.client.get(RECIPES_URL, {'search': query, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['title'] for item in response.data['results']]
+
+    def test_search_matches_prefixes(self):
+        '''test that partial words match'''
+        sample_recipe(user=self.user, title='Chicken curry')
+        sample_recipe(user=self.user, title='Chickpea salad')
+        sample_recipe(user=self.user, title='Beef stew')
+
+        self.assertEqual(
+            sorted(self._titles('chick')), ['Chicken curry', 'Chickpea salad']
+        )
+        self.assertEqual(self._titles('chicken cur'), ['Chicken curry'])
+
+    def test_search_without_words_matches_nothing(self):
+        '''test that punctuation only searches return no recipes'''
+        sample_recipe(user=self.user, title='Chicken curry')
+
+        self.assertEqual(self._titles('!!'), [])
+        self.assertEqual(self._titles('%%'), [])
+
+    def test_search_ranks_best_match_first(self):
+        '''test that closer matches come first'''
+        sample_recipe(
+            user=self.user, title='Rice served with a mild curry sauce'
+        )
+        sample_recipe(user=self.user, title='Curry')
+
+        self.assertEqual(
+            self._titles('curry'),
+            ['Curry', 'Rice served with a mild curry sauce']
+        )
+
+    def test_search_pages_by_rank(self):
+        '''test paging through ranked results without gaps'''
+        for i in range(5):
+            sample_recipe(
+                user=self.user, title='Soup ' + ' '.join(['extra'] * i)
+            )
+        response = self.client.get(
+            RECIPES_URL, {'search': 'soup', 'page_size': 2}
+        )
+        seen = [item['id'] for item in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            seen.extend(item['id'] for item in response.data['results'])
+
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+
+    def test_search_limited_to_user(self):
+        '''test that other users' recipes are not searched'''
+        user2 = get_user_model().objects.create_user('other@gmail.com')
+        sample_recipe(user=user2, title='Pancakes')
+
+        self.assertEqual(self._titles('pancakes'), [])
+
+    def test_search_renamed_recipe(self):
+        '''test that the index follows title changes'''
+        recipe = sample_recipe(user=self.user, title='Pancakes')
+        recipe.title = 'Waffles'
+        recipe.save()
+
+        self.assertEqual(self._titles('pancakes'), [])
+        self.assertEqual(self._titles('waffles'), ['Waffles'])
+
+
+class RecipeResponseCacheTests(TestCase):
+    '''test serving repeated list requests from the response cache'''
+
+    def setUp(self):
+        response_cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(user=self.user)
+        self.recipe.tags.add(sample_tag(user=self.user))
+
+    @override_settings(DATA_VERSION_STORE='cache')
+    def test_repeat_list_skips_database(self):
+        '''test an identical list request is answered from memory'''
+        first = self.client.get(RECIPES_URL, {'page_size': 5, 'tags': '1'})
+
+        with self.assertNumQueries(0):
+            second = self.client.get(
+                RECIPES_URL, {'tags': '1', 'page_size': 5}
+            )
+
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Content-Type'], 'application/json')
+        self.assertEqual(response_cache.stats()['hits'], 1)
+
+    def test_write_invalidates_cached_list(self):
+        '''test that a write is visible on the next list request'''
+        self.client.get(RECIPES_URL)
+        self.recipe.tags.clear()
+
+        response = self.client.get(RECIPES_URL)
+
+        self.assertEqual(response.data['results'][0]['tags'], [])
+        self.assertEqual(len(response_cache), 1)
+
+    def test_cache_separates_users(self):
+        '''test that users never see each other's cached lists'''
+        self.client.get(RECIPES_URL)
+        user2 = get_user_model().objects.create_user('other@gmail.com')
+        self.client.force_authenticate(user2)
+
+        response = self.client.get(RECIPES_URL)
+
+        self.assertEqual(response.data['results'], [])
+
+    @override_settings(DATA_VERSION_STORE='cache')
+    def test_tags_list_cached(self):
+        '''test that attribute lists are cached too'''
+        url = reverse('recipe:tag-list')
+        self.client.get(url, {'assigned_only': 1})
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'assigned_only': 1})
+
+        self.assertEqual(len(response.json()['results']), 1)
+
+
+class RecipeRowsListTests(TestCase):
+    '''test that lists built from rows match the serializers exactly'''
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        tags = [sample_tag(user=self.user, name=f'Tag {i}') for i in range(3)]
+        ingredient = sample_ingredient(user=self.user)
+        prices = ['0.5', '10', '999.99']
+        for i, price in enumerate(prices):
+            recipe = sample_recipe(
+                user=self.user,
+                title=f'Recipe {i}',
+                price=price,
+                link='https://example.com' if i else ''
+            )
+            recipe.tags.add(*tags[:i])
+            if i:
+                recipe.ingredients.add(ingredient)
+
+    def test_recipe_list_matches_serializer(self):
+        '''test the recipe list renders the same json'''
+        response = self.client.get(RECIPES_URL)
+
+        recipes = Recipe.objects.order_by('-id')
+        expected = RecipeSerializer(recipes, many=True).data
+        self.assertEqual(
+            json.dumps(response.json()['results']),
+            json.dumps(json.loads(json.dumps(expected)))
+        )
+
+    def test_tag_list_matches_serializer(self):
+        '''test the tag list renders the same json'''
+        response = self.client.get(reverse('recipe:tag-list'))
+
+        tags = Tag.objects.order_by('-name', '-id')
+        expected = TagSerializer(tags, many=True).data
+        self.assertEqual(
+            json.dumps(response.json()['results']),
+            json.dumps(json.loads(json.dumps(expected)))
+        )
+
+
+class RecipeSparseFieldsTests(TestCase):
+    '''test choosing the fields of recipe responses with ?fields='''
+
+    def setUp(self):
+        response_cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(user=self.user, title='Soup')
+        self.recipe.tags.add(sample_tag(user=self.user))
+        self.recipe.ingredients.add(sample_ingredient(user=self.user))
+
+    def test_list_fields(self):
+        '''test that only the requested fields are listed'''
+        response = self.client.get(RECIPES_URL, {'fields': 'price,title'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.json()['results'], [{'title': 'Soup', 'price': '5.00'}]
+        )
+
+    def test_list_fields_skip_relations(self):
+        '''test that unrequested relations and columns are not queried'''
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(RECIPES_URL, {'fields': 'title'})
+
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('core_recipe_tags', sql)
+        self.assertNotIn('core_recipe_ingredients', sql)
+        self.assertNotIn('"link"', sql)
+
+    def test_list_fields_with_relation(self):
+        '''test that a requested relation is read from the document'''
+        tag = self.recipe.tags.get()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(RECIPES_URL, {'fields': 'id,tags'})
+
+        self.assertEqual(
+            response.json()['results'],
+            [{'id': self.recipe.id, 'tags': [tag.id]}]
+        )
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('core_recipe_tags', sql)
+        self.assertIn('core_recipedocument', sql)
+
+    def test_detail_fields(self):
+        '''test that detail responses are trimmed and narrowed'''
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                detail_url(self.recipe.id), {'fields': 'title,tags'}
+            )
+
+        self.assertEqual(set(response.data), {'title', 'tags'})
+        self.assertEqual(response.data['tags'][0]['name'], 'Main Course')
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('core_recipe_ingredients', sql)
+        self.assertNotIn('"time_minutes"', sql)
+
+    def test_unknown_field_rejected(self):
+        '''test that asking for a field that does not exist fails'''
+        response = self.client.get(RECIPES_URL, {'fields': 'title,secret'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('secret', response.data['fields'][0])
+
+    def test_fields_ignored_on_write(self):
+        '''test that writes validate and return every field'''
+        response = self.client.patch(
+            detail_url(self.recipe.id) + '?fields=title', {'price': '7.00'}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('price', response.data)
+
+
+class RecipeExpandTests(TestCase):
+    '''test inlining tags and ingredients in the list with ?expand='''
+
+    def setUp(self):
+        response_cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def _sample(self, count):
+        tags = [sample_tag(user=self.user, name=f'Tag {i}') for i in range(3)]
+        ingredient = sample_ingredient(user=self.user)
+        for i in range(count):
+            recipe = sample_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(*tags[:i % 4])
+            recipe.ingredients.add(ingredient)
+
+    def test_expand_matches_detail(self):
+        '''test that expanded relations match the detail serializer'''
+        self._sample(4)
+
+        response = self.client.get(
+            RECIPES_URL, {'expand': 'tags,ingredients'}
+        )
+
+        for item in response.json()['results']:
+            detail = RecipeDetailSerializer(Recipe.objects.get(id=item['id']))
+            self.assertEqual(item['tags'], detail.data['tags'])
+            self.assertEqual(item['ingredients'], detail.data['ingredients'])
+
+    def test_expand_one_relation(self):
+        '''test that only the named relation is expanded'''
+        self._sample(2)
+
+        response = self.client.get(RECIPES_URL, {'expand': 'ingredients'})
+
+        item = response.json()['results'][0]
+        self.assertEqual(item['ingredients'][0]['name'], 'Cinnamon')
+        self.assertTrue(all(isinstance(tag, int) for tag in item['tags']))
+
+    @override_settings(DATA_VERSION_STORE='cache')
+    def test_expand_query_count_constant(self):
+        '''test that expanding costs the same queries for any page size'''
+        self._sample(10)
+
+        with self.assertNumQueries(1):
+            self.client.get(RECIPES_URL, {'expand': 'tags,ingredients'})
+
+    def test_expand_unknown_relation(self):
+        '''test that expanding anything else is rejected'''
+        response = self.client.get(RECIPES_URL, {'expand': 'user'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('user', response.data['expand'][0])
+
+
+class RecipeDocumentTests(TestCase):
+    '''test the stored read documents stay in step with the recipes'''
+
+    def setUp(self):
+        response_cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = sample_tag(user=self.user)
+        self.ingredient = sample_ingredient(user=self.user)
+        self.recipe = sample_recipe(user=self.user)
+        self.recipe.tags.add(self.tag)
+        self.recipe.ingredients.add(self.ingredient)
+
+    def _document(self, recipe=None):
+        return RecipeDocument.objects.get(recipe=recipe or self.recipe).data
+
+    def test_document_matches_detail(self):
+        '''test that the document holds the detail representation'''
+        self.recipe.title = 'Changed'
+        self.recipe.save()
+
+        self.assertEqual(
+            self._document(), RecipeDetailSerializer(self.recipe).data
+        )
+
+    def test_links_update_document(self):
+        '''test that linking from either side rebuilds the document'''
+        vegan = sample_tag(user=self.user, name='Vegan')
+        vegan.recipe_set.add(self.recipe)
+        self.assertEqual(
+            [tag['name'] for tag in self._document()['tags']],
+            ['Main Course', 'Vegan']
+        )
+
+        vegan.recipe_set.clear()
+        self.recipe.ingredients.clear()
+        document = self._document()
+        self.assertEqual([tag['id'] for tag in document['tags']],
+                         [self.tag.id])
+        self.assertEqual(document['ingredients'], [])
+
+    def test_rename_updates_document(self):
+        '''test that renaming a tag rewrites the recipes using it'''
+        self.tag.name = 'Dessert'
+        self.tag.save()
+
+        response = self.client.get(detail_url(self.recipe.id))
+
+        self.assertEqual(response.data['tags'][0]['name'], 'Dessert')
+
+    def test_delete_updates_document(self):
+        '''test that deleting an ingredient drops it from documents'''
+        self.ingredient.delete()
+
+        self.assertEqual(self._document()['ingredients'], [])
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_refresh_locks_recipes(self):
+        '''test that refreshes lock the recipes before rewriting documents'''
+        with CaptureQueriesContext(connection) as context:
+            documents.refresh([self.recipe.id])
+
+        locks = [
+            query['sql'] for query in context.captured_queries
+            if 'FOR UPDATE' in query['sql']
+        ]
+        self.assertEqual(len(locks), 1)
+        self.assertIn('core_recipe', locks[0])
+
+    def test_delete_user_removes_documents(self):
+        '''test that deleting a user removes their recipes' documents'''
+        self.user.delete()
+
+        self.assertFalse(RecipeDocument.objects.exists())
+
+    def test_bulk_write_builds_documents(self):
+        '''test that bulk writes, which skip the signals, store documents'''
+        response = self.client.post(BULK_URL, [
+            {'title': 'Bulk', 'time_minutes': 5, 'price': '1.00',
+             'tags': [self.tag.id]},
+            {'id': self.recipe.id, 'title': 'Renamed'},
+        ], format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        created = Recipe.objects.get(title='Bulk')
+        self.assertEqual(self._document(created)['tags'][0]['id'],
+                         self.tag.id)
+        self.assertEqual(self._document()['title'], 'Renamed')
+
+    def test_missing_document_is_built_on_read(self):
+        '''test that recipes without a document are still served'''
+        RecipeDocument.objects.all().delete()
+
+        detail = self.client.get(detail_url(self.recipe.id))
+        listed = self.client.get(RECIPES_URL)
+
+        self.assertEqual(detail.data, RecipeDetailSerializer(
+            self.recipe, context={'request': detail.wsgi_request}
+        ).data)
+        self.assertEqual(listed.data['results'],
+                         RecipeSerializer([self.recipe], many=True).data)
+
+    def test_other_users_document_not_found(self):
+        '''test that another user's recipe is not served from its document'''
+        other = get_user_model().objects.create_user(
+            'other@gmail.com', 'testpass'
+        )
+        recipe = sample_recipe(user=other)
+
+        response = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class RecipeStatsTests(TestCase):
+    '''test the per user recipe stats and their counters'''
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.vegan = sample_tag(user=self.user, name='Vegan')
+        self.dessert = sample_tag(user=self.user, name='Dessert')
+        self.egg = sample_ingredient(user=self.user, name='Egg')
+
+    def _create(self, **params):
+        payload = {
+            'title': 'Cake', 'time_minutes': 30, 'price': '10.00',
+            'tags': [self.vegan.id], 'ingredients': [self.egg.id],
+        }
+        payload.update(params)
+        response = self.client.post(RECIPES_URL, payload)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Recipe.objects.get(id=response.data['id'])
+
+    def _assert_counted_correctly(self):
+        '''check the counters against counting from scratch'''
+        counted = self.client.get(STATS_URL).data
+        RecipeStats.objects.filter(user=self.user).delete()
+        self.assertEqual(counted, self.client.get(STATS_URL).data)
+
+    def test_stats_empty(self):
+        '''test the stats of a user without recipes'''
+        response = self.client.get(STATS_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['recipes'], 0)
+        self.assertIsNone(response.data['average_price'])
+        self.assertEqual(
+            [tag['recipes'] for tag in response.data['tags']], [0, 0]
+        )
+
+    def test_stats_counts_recipes(self):
+        '''test recipe counts, averages and recipes per tag'''
+        self._create()
+        self._create(price='5.00', time_minutes=15,
+                     tags=[self.vegan.id, self.dessert.id])
+
+        response = self.client.get(STATS_URL)
+
+        self.assertEqual(response.data['recipes'], 2)
+        self.assertEqual(response.data['average_price'], '7.50')
+        self.assertEqual(response.data['average_time_minutes'], 22.5)
+        self.assertEqual(response.data['tags'], [
+            {'id': self.vegan.id, 'name': 'Vegan', 'recipes': 2},
+            {'id': self.dessert.id, 'name': 'Dessert', 'recipes': 1},
+        ])
+        self.assertEqual(response.data['ingredients'], [
+            {'id': self.egg.id, 'name': 'Egg', 'recipes': 2},
+        ])
+        self._assert_counted_correctly()
+
+    def test_stats_follow_writes(self):
+        '''test that updates, unlinks and deletes adjust the counters'''
+        recipe = self._create()
+        other = self._create(tags=[self.dessert.id])
+
+        self.client.patch(detail_url(recipe.id), {
+            'price': '4.00', 'tags': [self.dessert.id]
+        })
+        other.ingredients.remove(self.egg)
+        other.ingredients.remove(self.egg)
+        self.client.delete(detail_url(other.id))
+        self.dessert.recipe_set.add(sample_recipe(user=self.user))
+
+        response = self.client.get(STATS_URL)
+        self.assertEqual(response.data['recipes'], 2)
+        self.assertEqual(response.data['tags'][0]['recipes'], 2)
+        self.assertEqual(response.data['tags'][1]['recipes'], 0)
+        self.assertEqual(response.data['ingredients'][0]['recipes'], 1)
+        self._assert_counted_correctly()
+
+    def test_stats_after_bulk_write(self):
+        '''test that bulk writes, which skip the signals, are counted'''
+        recipe = self._create()
+        self.client.post(BULK_URL, [
+            {'title': 'Bulk', 'time_minutes': 5, 'price': '1.00',
+             'tags': [self.dessert.id]},
+            {'id': recipe.id, 'price': '2.00'},
+        ], format='json')
+
+        response = self.client.get(STATS_URL)
+
+        self.assertEqual(response.data['recipes'], 2)
+        self.assertEqual(response.data['average_price'], '1.50')
+        self._assert_counted_correctly()
+
+    def test_uncounted_user_is_counted_on_write(self):
+        '''test the fallback for users written before the counters'''
+        self._create()
+        RecipeStats.objects.all().delete()
+        self.assertEqual(self.client.get(STATS_URL).data['recipes'], 1)
+
+        self._create()
+
+        self.assertEqual(RecipeStats.objects.get(user=self.user).recipes, 2)
+        self._assert_counted_correctly()
+
+    def test_rebuild_over_counter_written_concurrently(self):
+        '''test rebuilding when another write created the counter first'''
+        self._create()
+        RecipeStats.objects.filter(user=self.user).update(
+            recipes=5, price_total=1
+        )
+
+        stats.rebuild([self.user.id, self.user.id])
+
+        counter = RecipeStats.objects.get(user=self.user)
+        self.assertEqual(counter.recipes, 1)
+        self.assertEqual(counter.price_total, 10)
+        self._assert_counted_correctly()
+
+    @override_settings(DATA_VERSION_STORE='cache')
+    def test_stats_query_count_constant(self):
+        '''test that reading counted stats does not scan the recipes'''
+        for _ in range(5):
+            self._create()
+
+        with self.assertNumQueries(3):
+            self.client.get(STATS_URL)
+
+    def test_delete_user_with_stats(self):
+        '''test that users with counters can still be deleted'''
+        self._create()
+
+        self.user.delete()
+
+        self.assertFalse(RecipeStats.objects.exists())
+
+
+class AsyncReadViewTests(TransactionTestCase):
+    '''test the async views used for reads under asgi'''
+
+    def setUp(self):
+        response_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com', 'testpass'
+        )
+        self.factory = APIRequestFactory()
+
+    def _request(self, path):
+        request = self.factory.get(path)
+        force_authenticate(request, user=self.user)
+        return request
+
+    def test_async_list_matches_sync(self):
+        '''test that the async list view returns the sync view's body'''
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(sample_tag(user=self.user))
+        view = RecipeViewSet.as_view({'get': 'list'})
+
+        expected = view(self._request(RECIPES_URL)).render()
+        response_cache.clear()
+        response = async_to_sync(as_async_view(view))(
+            self._request(RECIPES_URL)
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, expected.content)
+
+    def test_async_retrieve(self):
+        '''test that the async detail view returns the recipe'''
+        recipe = sample_recipe(user=self.user)
+        view = as_async_view(RecipeViewSet.as_view({'get': 'retrieve'}))
+
+        response = async_to_sync(view)(
+            self._request(detail_url(recipe.id)), pk=recipe.id
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content)['id'], recipe.id)
+
+    def test_router_wraps_read_routes_when_enabled(self):
+        '''test that only list and detail routes become async'''
+        for enabled in (True, False):
+            with override_settings(ASYNC_READ_VIEWS=enabled):
+                router = AsyncReadRouter()
+                router.register('recipes', RecipeViewSet)
+                callbacks = {url.name: url.callback for url in router.urls}
+
+            self.assertIs(
+                asyncio.iscoroutinefunction(callbacks['recipe-list']),
+                enabled
+            )
+            self.assertIs(
+                asyncio.iscoroutinefunction(callbacks['recipe-detail']),
+                enabled
+            )
+            self.assertFalse(
+                asyncio.iscoroutinefunction(callbacks['recipe-export'])
+            )
+
+    def test_export_streams_under_asgi(self):
+        '''test that the export can query while streaming under asgi'''
+        for i in range(3):
+            sample_recipe(user=self.user, title=f'Recipe {i}')
+        token = Token.objects.create(user=self.user)
+
+        async def get():
+            communicator = ApplicationCommunicator(get_asgi_application(), {
+                'type': 'http',
+                'asgi': {'version': '3.0'},
+                'http_version': '1.1',
+                'method': 'GET',
+                'scheme': 'http',
+                'path': EXPORT_URL,
+                'query_string': b'',
+                'headers': [
+                    (b'host', b'testserver'),
+                    (b'authorization', f'Token {token.key}'.encode()),
+                    (b'accept', b'application/x-ndjson'),
+                ],
+            })
+            await communicator.send_input({'type': 'http.request'})
+            start = await communicator.receive_output(5)
+            body = b''
+            while True:
+                message = await communicator.receive_output(5)
+                body += message.get('body', b'')
+                if not message.get('more_body'):
+                    return start, body
+
+        start, body = async_to_sync(get)()
+
+        self.assertEqual(start['status'], status.HTTP_200_OK)
+        self.assertEqual(
+            [json.loads(line)['title'] for line in body.splitlines()],
+            ['Recipe 0', 'Recipe 1', 'Recipe 2']
+        )
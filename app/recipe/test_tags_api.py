@@ -1,3 +1,6 @@
+import base64
+import json
+
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.test import TestCase
@@ -43,7 +46,7 @@ class PrivateTagsAPITests(TestCase):
         tags = Tag.objects.all().order_by('-name')
         serializer = TagSerializer(tags, many=True)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data['results'], serializer.data)
 
     def test_tags_limited_to_user(self):
         '''test that tags returned are for the authorized user'''
@@ -58,8 +61,100 @@ class PrivateTagsAPITests(TestCase):
         response = self.client.get(TAGS_URL)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['name'], tag.name)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['name'], tag.name)
+
+    def test_retrieve_tags_sparse_fields(self):
+        '''test listing only the requested tag fields'''
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        response = self.client.get(TAGS_URL, {'fields': 'name'})
+
+        self.assertEqual(response.data['results'], [{'name': 'Vegan'}])
+
+    def test_retrieve_tags_paginated_with_equal_names(self):
+        '''test paging through tags that share a name skips none'''
+        tags = [Tag.objects.create(user=self.user, name='Vegan')
+                for i in range(3)]
+        tags.append(Tag.objects.create(user=self.user, name='Dessert'))
+
+        response = self.client.get(TAGS_URL, {'page_size': 2})
+        seen = [item['id'] for item in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            seen.extend(item['id'] for item in response.data['results'])
+
+        expected = [tag.id for tag in reversed(tags[:3])] + [tags[3].id]
+        self.assertEqual(seen, expected)
+
+    def test_retrieve_tags_cursor_with_bad_values(self):
+        '''test that cursors holding values of the wrong type are rejected'''
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        for position in (['Vegan', 'abc'], [None, 1], [{}, 1]):
+            payload = json.dumps({'p': position, 'r': 0}).encode('utf-8')
+            response = self.client.get(TAGS_URL, {
+                'cursor': base64.urlsafe_b64encode(payload).decode('ascii'),
+            })
+
+            self.assertEqual(
+                response.status_code, status.HTTP_404_NOT_FOUND, position
+            )
+
+    def test_autocomplete_tags(self):
+        '''test listing the first tags starting with a prefix'''
+        for name in ('Vegetarian', 'Vegan', 'Dessert', 'Veggie'):
+            Tag.objects.create(user=self.user, name=name)
+        Tag.objects.create(
+            user=get_user_model().objects.create_user(
+                'other@gmail.com', 'password2'
+            ),
+            name='Vegan'
+        )
+
+        response = self.client.get(TAGS_URL, {'q': 'veg'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [tag['name'] for tag in response.data],
+            ['Vegan', 'Vegetarian', 'Veggie']
+        )
+
+    def test_autocomplete_tags_limit(self):
+        '''test that prefix matches are cut to the requested number'''
+        for i in range(12):
+            Tag.objects.create(user=self.user, name=f'Tag {i:02}')
+
+        response = self.client.get(TAGS_URL, {'q': 'tag'})
+        self.assertEqual(len(response.data), 10)
+
+        response = self.client.get(TAGS_URL, {'q': 'tag', 'limit': 3})
+        self.assertEqual([tag['name'] for tag in response.data],
+                         ['Tag 00', 'Tag 01', 'Tag 02'])
+
+        response = self.client.get(TAGS_URL, {'q': 'tag', 'limit': 500})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_autocomplete_tags_escapes_wildcards(self):
+        '''test that like wildcards in the prefix match literally'''
+        Tag.objects.create(user=self.user, name='Vegan')
+        Tag.objects.create(user=self.user, name='V_gan')
+
+        response = self.client.get(TAGS_URL, {'q': 'v_'})
+
+        self.assertEqual([tag['name'] for tag in response.data], ['V_gan'])
+
+    def test_retrieve_tags_not_modified(self):
+        '''test that unchanged tags are answered with 304'''
+        Tag.objects.create(user=self.user, name='Vegan')
+        etag = self.client.get(TAGS_URL)['ETag']
+
+        response = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Tag.objects.create(user=self.user, name='Dessert')
+        response = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
 
     def test_create_tag_successful(self):
         '''test creating a new tag'''
@@ -95,8 +190,8 @@ class PrivateTagsAPITests(TestCase):
 
         serializer1 = TagSerializer(tag1)
         serializer2 = TagSerializer(tag2)
-        self.assertIn(serializer1.data, response.data)
-        self.assertNotIn(serializer2.data, response.data)
+        self.assertIn(serializer1.data, response.data['results'])
+        self.assertNotIn(serializer2.data, response.data['results'])
 
     def test_retrieve_tags_assigned_unique(self):
         '''test filteringtags by assigned returns unique items'''
@@ -119,4 +214,4 @@ class PrivateTagsAPITests(TestCase):
 
         response = self.client.get(TAGS_URL, {'assigned_only': 1})
 
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
@@ -1,8 +1,8 @@
 from django.urls import path, include
-from rest_framework.routers import DefaultRouter
 from recipe import views
+from recipe.asyncviews import AsyncReadRouter
 
-router = DefaultRouter()
+router = AsyncReadRouter()
 router.register('tags', views.TagViewSet)
 router.register('ingredients', views.IngredientViewSet)
 router.register('recipes', views.RecipeViewSet)
@@ -0,0 +1,82 @@
+'''
+per user data versions behind etags and the list response cache
+
+a version identifies the current state of a user's recipes, tags and
+ingredients and changes on every write. it lives in the default cache when
+that is shared between processes. a process local cache such as the
+default LocMemCache would let other processes keep serving 304s and cached
+lists for data they never saw change, so the versions are then kept in
+DataVersion rows instead, costing one primary key lookup per read.
+DATA_VERSION_STORE forces either store.
+'''
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import F
+
+from core.models import DataVersion
+
+
+KEY = 'recipe-data-version:{}'
+STORES = ('cache', 'database')
+
+
+def get_store():
+    '''return where versions are kept, 'cache' or 'database\''''
+    store = settings.DATA_VERSION_STORE
+    if store is None:
+        process_local = isinstance(caches['default'], LocMemCache)
+        return 'database' if process_local else 'cache'
+    if store not in STORES:
+        raise ValueError('unknown DATA_VERSION_STORE %r' % store)
+    return store
+
+
+def get_version(user_id):
+    '''return the token identifying the current state of a user's data'''
+    if get_store() == 'database':
+        return _get_row_version(user_id)
+    key = KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def _get_row_version(user_id):
+    version = DataVersion.objects.filter(user_id=user_id).values_list(
+        'version', flat=True
+    ).first()
+    if version is None:
+        # only reads create rows, writes may run while the user is deleted
+        DataVersion.objects.bulk_create(
+            [DataVersion(user_id=user_id)], ignore_conflicts=True
+        )
+        version = 0
+    return 'v%d' % version
+
+
+def _bump(user_id):
+    if get_store() == 'database':
+        DataVersion.objects.filter(user_id=user_id).update(
+            version=F('version') + 1
+        )
+    else:
+        cache.set(KEY.format(user_id), uuid.uuid4().hex, timeout=None)
+
+
+def bump_version(user_id):
+    '''
+    mark a user's recipes, tags or ingredients as changed
+
+    the version is replaced straight away and again once the surrounding
+    transaction commits, so a read racing the write cannot leave a response
+    built from uncommitted state tagged with the final version.
+    '''
+    _bump(user_id)
+    transaction.on_commit(lambda: _bump(user_id))
@@ -1,18 +1,70 @@
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
-from core.models import Tag, Ingredient, Recipe
-from recipe import serializers
+from core.models import Tag, Ingredient, Recipe, RecipeDocument
+from user.authentication import CachedTokenAuthentication
+from recipe import (
+    bulk, documents, filters, images, rows, serializers, signals, stats
+)
+from recipe.mixins import (
+    CachedListMixin, DocumentRetrieveMixin, SparseFieldsMixin,
+    ValuesListMixin, VersionedListMixin, VersionedRetrieveMixin
+)
+from recipe.export import as_json_array, as_ndjson, iter_recipes
+from recipe.renderers import NDJSONRenderer
+from recipe.search import search_recipes
 
 
-class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
+class BaseRecipeAttrViewSet(VersionedListMixin,
+                            CachedListMixin,
+                            SparseFieldsMixin,
+                            ValuesListMixin,
+                            viewsets.GenericViewSet,
                             mixins.ListModelMixin,
                             mixins.CreateModelMixin):
     '''base viewset for user owned recipe attributes'''
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    list_fields = rows.ATTRIBUTE_FIELDS
+    # ?q= lists up to limit names starting with it, for typeahead pickers
+    prefix_param = 'q'
+    prefix_limit = 10
+    prefix_max_limit = 50
+
+    @property
+    def ordering(self):
+        '''order prefix matches by name and pages newest name first'''
+        # id breaks ties between equal names so pages never skip or repeat
+        if self.get_prefix():
+            return ('name', 'id')
+        return ('-name', '-id')
+
+    def get_prefix(self):
+        '''return the ?q= prefix to match names against, if any'''
+        if self.action != 'list':
+            return ''
+        return self.request.query_params.get(self.prefix_param, '').strip()
+
+    def get_prefix_limit(self):
+        '''return how many prefix matches to list'''
+        value = self.request.query_params.get('limit')
+        if value is None:
+            return self.prefix_limit
+        try:
+            limit = int(value)
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= self.prefix_max_limit:
+            raise ValidationError({'limit': [
+                'Ensure this is a number from 1 to %d.'
+                % self.prefix_max_limit
+            ]})
+        return limit
 
     def get_queryset(self):
         '''return objects for the current authenticated user only'''
@@ -22,10 +74,31 @@ class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
         queryset = self.queryset
         if assigned_only:
             queryset = queryset.filter(recipe__isnull=False)
+        prefix = self.get_prefix()
+        if prefix:
+            # served by the user_id, UPPER(name) prefix index on postgresql
+            queryset = queryset.filter(name__istartswith=prefix)
 
         return queryset.filter(
             user=self.request.user
-        ).order_by('-name').distinct()
+        ).order_by(*self.ordering).distinct()
+
+    def get_list_queryset(self):
+        '''cut prefix matches down to the requested number'''
+        queryset = super().get_list_queryset()
+        if self.get_prefix():
+            return queryset[:self.get_prefix_limit()]
+        return queryset
+
+    def paginate_queryset(self, queryset):
+        '''prefix matches are listed without pagination'''
+        if self.get_prefix():
+            return None
+        return super().paginate_queryset(queryset)
+
+    def get_list_rows(self, page):
+        '''render the page like the serializer would, without instances'''
+        return rows.attribute_rows(page, self.get_requested_fields())
 
     def perform_create(self, serializer):
         '''create a new object'''
@@ -44,30 +117,83 @@ class IngredientViewSet(BaseRecipeAttrViewSet):
     serializer_class = serializers.IngredientSerializer
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(VersionedListMixin,
+                    CachedListMixin,
+                    SparseFieldsMixin,
+                    ValuesListMixin,
+                    VersionedRetrieveMixin,
+                    DocumentRetrieveMixin,
+                    viewsets.ModelViewSet):
     '''manage recipe in database'''
     serializer_class = serializers.RecipeSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    # relations the list can inline as objects with ?expand=
+    expandable = tuple(dict(rows.RELATIONS))
 
-    def _params_to_ints(self, qs):
-        '''convert a list of string id's to a list of ints'''
-        return [int(str_id) for str_id in qs.split(',')]
+    @property
+    def ordering(self):
+        '''order searches by relevance and everything else newest first'''
+        if self.request.query_params.get('search'):
+            return ('-rank', '-id')
+        return ('-id',)
 
     def get_queryset(self):
         '''retrieve the recipes for the authenticated user'''
-        tags = self.request.query_params.get('tags')
-        ingredients = self.request.query_params.get('ingredients')
-        queryset = self.queryset
-        if tags:
-            tag_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
-        if ingredients:
-            ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
+        queryset = filters.filter_recipes(
+            self.queryset, self.request.query_params
+        )
+        search = self.request.query_params.get('search')
+        if search:
+            queryset = search_recipes(queryset, search)
+
+        # load every recipe's tags and ingredients in one query each rather
+        # than two extra queries per recipe when the serializer renders them,
+        # lists are read from the stored documents instead
+        return queryset.filter(user=self.request.user).prefetch_related(
+            'tags', 'ingredients'
+        )
 
-        return queryset.filter(user=self.request.user)
+    def get_expand(self):
+        '''return the relations named in ?expand='''
+        value = self.request.query_params.get('expand', '')
+        expand = {name.strip() for name in value.split(',')} - {''}
+        unknown = expand.difference(self.expandable)
+        if unknown:
+            raise ValidationError({'expand': [
+                'Cannot expand: %s.' % ', '.join(sorted(unknown))
+            ]})
+        return expand
+
+    def get_list_fields(self):
+        '''load the stored document of each recipe, see recipe.documents'''
+        return ['id', 'document__data']
+
+    def get_list_rows(self, page):
+        '''render the page like RecipeSerializer would from the documents'''
+        fields = self.get_requested_fields()
+        expand = self.get_expand()
+        return [
+            documents.list_item(document, fields, expand)
+            for document in documents.fill_missing(page)
+        ]
+
+    def get_document(self):
+        '''return the detail of the recipe from its stored document'''
+        try:
+            document = RecipeDocument.objects.filter(
+                recipe_id=self.kwargs[self.lookup_field],
+                user=self.request.user,
+            ).values_list('data', flat=True).first()
+        except ValueError:
+            # not an id, the regular retrieve answers 404
+            return None
+        if document is None:
+            return None
+        return documents.detail(
+            document, self.request, self.get_requested_fields()
+        )
 
     def get_serializer_class(self):
         '''return appropriate serializer class'''
@@ -75,11 +201,110 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return serializers.RecipeDetailSerializer
         elif self.action == 'upload_image':
             return serializers.RecipeImageSerializer
+        elif self.action == 'bulk_write':
+            return serializers.RecipeBulkItemSerializer
+        elif self.action in ('bulk_assign', 'bulk_unassign'):
+            return serializers.RecipeBulkLinkSerializer
+        elif self.action == 'bulk_delete':
+            return serializers.RecipeBulkDeleteSerializer
         return self.serializer_class
 
+    # the counters and documents updated from the model signals commit
+    # together with the recipe and its links, the document is rebuilt and
+    # the version bumped once per request
+    @transaction.atomic
     def perform_create(self, serializer):
         '''create a new recipe'''
-        serializer.save(user=self.request.user)
+        with signals.deferred_sync():
+            serializer.save(user=self.request.user)
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        '''update a recipe'''
+        with signals.deferred_sync():
+            serializer.save()
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        '''delete a recipe'''
+        with signals.deferred_sync():
+            instance.delete()
+
+    @action(methods=['GET'], detail=False, url_path='stats',
+            url_name='stats')
+    def summary(self, request):
+        '''return counts and averages over the user's recipes'''
+        return self.conditional(
+            lambda request: Response(stats.summary(request.user.pk)),
+            request
+        )
+
+    @action(methods=['POST'], detail=False, url_path='bulk')
+    def bulk_write(self, request):
+        '''create or update a list of recipes in one transaction'''
+        writer = bulk.BulkRecipeWriter(request.user, request.data)
+        if not writer.is_valid():
+            return Response(
+                writer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = writer.save()
+        created = any(result['status'] == 'created' for result in results)
+        return Response(
+            results,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+
+    @action(methods=['POST'], detail=False, url_path='bulk/assign',
+            url_name='bulk-assign')
+    def bulk_assign(self, request):
+        '''add tags and ingredients to many recipes at once'''
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(bulk.assign(request.user, serializer.validated_data))
+
+    @action(methods=['POST'], detail=False, url_path='bulk/unassign',
+            url_name='bulk-unassign')
+    def bulk_unassign(self, request):
+        '''remove tags and ingredients from many recipes at once'''
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(
+            bulk.unassign(request.user, serializer.validated_data)
+        )
+
+    @action(methods=['POST'], detail=False, url_path='bulk/delete',
+            url_name='bulk-delete')
+    def bulk_delete(self, request):
+        '''delete many recipes at once'''
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        deleted = bulk.delete_recipes(
+            request.user, serializer.validated_data['recipes']
+        )
+        return Response({'deleted': deleted})
+
+    @action(methods=['GET'], detail=False, url_path='export',
+            renderer_classes=[NDJSONRenderer, JSONRenderer])
+    def export(self, request):
+        '''stream every matching recipe as ndjson or a json array'''
+        renderer = request.accepted_renderer
+        recipes = iter_recipes(
+            self.filter_queryset(self.get_queryset()).order_by('id')
+        )
+        if renderer.format == 'ndjson':
+            content = as_ndjson(recipes)
+        else:
+            content = as_json_array(recipes)
+
+        response = StreamingHttpResponse(
+            content,
+            content_type=renderer.media_type
+        )
+        response['Content-Disposition'] = \
+            f'attachment; filename="recipes.{renderer.format}"'
+        return response
 
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
@@ -90,7 +315,9 @@ class RecipeViewSet(viewsets.ModelViewSet):
             data=request.data
         )
         if serializer.is_valid():
-            serializer.save()
+            # the old image and its variants are released once unused
+            serializer.save(image_variants={})
+            images.schedule(recipe)
             return Response(
                 serializer.data,
                 status=status.HTTP_200_OK
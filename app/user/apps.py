@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class UserConfig(AppConfig):
     name = 'user'
+
+    def ready(self):
+        '''connect the token cache invalidation signals'''
+        import user.signals  # noqa: F401
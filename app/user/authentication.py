@@ -0,0 +1,68 @@
+import copy
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+from core.cache import LRUCache
+from core.metrics import registry, stats_collector
+from recipe import versions
+
+
+token_cache = LRUCache(
+    max_size=settings.TOKEN_CACHE_SIZE,
+    ttl=settings.TOKEN_CACHE_TTL,
+)
+registry.register(stats_collector(
+    'auth_token_cache', 'Auth token cache',
+    token_cache.stats, counters=('hits', 'misses', 'evictions'),
+))
+
+
+def _detached(user):
+    '''return a copy of user so concurrent requests never share one'''
+    clone = copy.copy(user)
+    clone._state = copy.copy(user._state)
+    clone._state.fields_cache = {}
+    return clone
+
+
+def invalidate_user(user_id):
+    '''drop every cached token belonging to a user, in every process'''
+    versions.bump_version(user_id)
+    return token_cache.delete_where(
+        lambda key, entry: entry[1].pk == user_id
+    )
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    '''
+    token authentication that remembers recent key lookups in memory
+
+    each entry keeps the user's data version from before the token was
+    loaded and is only used while that version is current. deleting a
+    token or saving its user bumps the version, so every process stops
+    using the entry, including one loaded while the change was being made.
+    the version is one cache get per request where versions live in a
+    shared cache, otherwise one primary key lookup, see recipe.versions.
+    '''
+
+    def authenticate_credentials(self, key):
+        '''return the user and token for key, from the cache if possible'''
+        entry = token_cache.get(key)
+        if entry is not None:
+            version, user, token = entry
+            if versions.get_version(user.pk) != version:
+                entry = None
+        if entry is None:
+            # the version is read before the token, so an entry loaded while
+            # the token is revoked elsewhere is already out of date
+            user_id = self.get_model().objects.filter(
+                key=key
+            ).values_list('user_id', flat=True).first()
+            if user_id is None:
+                # rejected with drf's usual message
+                return super().authenticate_credentials(key)
+            version = versions.get_version(user_id)
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, (version, user, token))
+        return _detached(user), token
@@ -0,0 +1,63 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+from user import hashing
+
+
+class HashingModelBackend(ModelBackend):
+    '''
+    model backend that checks passwords on the password hashing pool
+
+    behaves like ModelBackend, including hashing a dummy password for
+    unknown users so response times don't reveal which emails exist.
+    '''
+
+    def get_login_user(self, username):
+        '''return the user logging in as username, or None'''
+        user_model = get_user_model()
+        try:
+            return user_model._default_manager.get_by_natural_key(username)
+        except user_model.DoesNotExist:
+            return None
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(get_user_model().USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        user = self.get_login_user(username)
+        if user is None:
+            hashing.make_password(password)
+            return None
+
+        matches, outdated = hashing.check_password(password, user.password)
+        if not matches or not self.user_can_authenticate(user):
+            return None
+        if outdated:
+            user.password = hashing.make_password(password)
+            user.save(update_fields=['password'])
+        return user
+
+    async def aauthenticate(self, username, password):
+        '''
+        authenticate from a coroutine
+
+        the user is loaded on the sync thread, the hashing is awaited so
+        no thread is held while the check waits for and runs on the pool.
+        '''
+        user = await sync_to_async(self.get_login_user)(username)
+        if user is None:
+            await hashing.amake_password(password)
+            return None
+
+        matches, outdated = await hashing.acheck_password(
+            password, user.password
+        )
+        if not matches or not self.user_can_authenticate(user):
+            return None
+        if outdated:
+            user.password = await hashing.amake_password(password)
+            await sync_to_async(user.save)(update_fields=['password'])
+        return user
@@ -0,0 +1,60 @@
+'''
+password hashing on a small dedicated thread pool
+
+hashing a password is deliberately slow. running it on a bounded pool caps
+how much cpu a burst of logins can take from the rest of the api, and once
+LOGIN_HASH_MAX_PENDING checks are queued further logins are refused
+immediately rather than tying up request workers.
+'''
+import asyncio
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+from core.executor import BoundedExecutor
+from core.metrics import registry, stats_collector
+
+
+executor = BoundedExecutor(
+    max_workers=settings.LOGIN_HASH_WORKERS,
+    max_pending=settings.LOGIN_HASH_MAX_PENDING,
+    thread_name_prefix='password-hash',
+)
+registry.register(stats_collector(
+    'login_hash_executor', 'Password hashing pool',
+    executor.stats, counters=('completed', 'rejected'),
+))
+
+
+def _check(password, encoded):
+    outdated = []
+    matches = hashers.check_password(password, encoded, outdated.append)
+    return matches, bool(outdated)
+
+
+def check_password(password, encoded):
+    '''
+    return (matches, needs rehash) for password against the encoded hash
+
+    raises Saturated when the pool is full.
+    '''
+    return executor.run(_check, password, encoded)
+
+
+def make_password(password):
+    '''hash password on the pool, raises Saturated when it is full'''
+    return executor.run(hashers.make_password, password)
+
+
+async def acheck_password(password, encoded):
+    '''check_password for coroutines, nothing waits on a thread meanwhile'''
+    return await asyncio.wrap_future(
+        executor.submit(_check, password, encoded)
+    )
+
+
+async def amake_password(password):
+    '''make_password for coroutines'''
+    return await asyncio.wrap_future(
+        executor.submit(hashers.make_password, password)
+    )
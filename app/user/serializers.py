@@ -29,6 +29,11 @@ class UserSerializer(serializers.ModelSerializer):
 
 class AuthTokenSerializer(serializers.Serializer):
     '''serializer for the user authentication object'''
+    default_error_messages = {
+        'authentication': _(
+            'Unable to authenticate with provided credentials'
+        ),
+    }
     email = serializers.CharField()
     password = serializers.CharField(
         style={'input_type': 'password'},
@@ -46,8 +51,7 @@ class AuthTokenSerializer(serializers.Serializer):
             password=password
         )
         if not user:
-            msg = _('Unable to authenticate with provided credentials')
-            raise serializers.ValidationError(msg, code='authentication')
+            self.fail('authentication')
 
         attrs['user'] = user
         return attrs
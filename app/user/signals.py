@@ -0,0 +1,23 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from user.authentication import invalidate_user
+
+
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    '''stop accepting a token as soon as it is deleted'''
+    invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=get_user_model())
+def evict_saved_user(sender, instance, **kwargs):
+    '''
+    forget a user's tokens whenever the user changes
+
+    covers deactivation and password changes, and keeps request.user from
+    serving stale profile fields.
+    '''
+    invalidate_user(instance.pk)
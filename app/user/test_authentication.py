@@ -0,0 +1,122 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from user.authentication import token_cache
+from recipe import versions
+
+ME_URL = reverse('user:me')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    '''test authenticating requests through the token cache'''
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass123',
+            name='name'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    @override_settings(DATA_VERSION_STORE='cache')
+    def test_repeat_requests_skip_token_query(self):
+        '''test that a cached token is not looked up again'''
+        self.client.get(ME_URL)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(ME_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(token_cache.stats()['hits'], 1)
+        self.assertEqual(token_cache.stats()['misses'], 1)
+
+    def test_deleted_token_rejected(self):
+        '''test that deleting a token evicts it from the cache'''
+        self.client.get(ME_URL)
+        self.token.delete()
+
+        response = self.client.get(ME_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_rejected(self):
+        '''test that deactivating a user evicts their tokens'''
+        self.client.get(ME_URL)
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.get(ME_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_evicts_user(self):
+        '''test that changing a password drops the cached user'''
+        self.client.get(ME_URL)
+        self.user.set_password('newpass123')
+        self.user.save()
+
+        self.assertEqual(len(token_cache), 0)
+
+    def test_cached_user_not_shared(self):
+        '''test that updates through one request do not leak to others'''
+        self.client.get(ME_URL)
+        self.client.patch(ME_URL, {'name': 'new name'})
+
+        response = self.client.get(ME_URL)
+
+        self.assertEqual(response.data['name'], 'new name')
+
+    @override_settings(DATA_VERSION_STORE='database')
+    def test_repeat_requests_check_version_row(self):
+        '''test that a cached token costs one version lookup'''
+        self.client.get(ME_URL)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(ME_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(token_cache.stats()['hits'], 1)
+
+    def test_stale_entry_of_other_process_rejected(self):
+        '''test that a token deleted elsewhere is refused from the cache'''
+        self.client.get(ME_URL)
+        # what another process still holds after this one deletes the token
+        stale = token_cache.get(self.token.key)
+        self.token.delete()
+        token_cache.set(self.token.key, stale)
+
+        response = self.client.get(ME_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_entry_loaded_during_revocation_not_used(self):
+        '''test that a lookup racing a deactivation is not trusted later'''
+        load = TokenAuthentication.authenticate_credentials
+
+        def deactivated_after_load(authentication, key):
+            loaded = load(authentication, key)
+            # another process deactivates the user before the entry is kept
+            get_user_model().objects.filter(pk=self.user.pk).update(
+                is_active=False
+            )
+            versions.bump_version(self.user.pk)
+            return loaded
+
+        with patch.object(TokenAuthentication, 'authenticate_credentials',
+                          deactivated_after_load):
+            first = self.client.get(ME_URL)
+
+        response = self.client.get(ME_URL)
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -1,9 +1,18 @@
+import asyncio
+import threading
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync, sync_to_async
 from django.test import TestCase
-from django.contrib.auth import get_user_model
+from django.contrib.auth import get_user_model, hashers
 from django.urls import reverse
-from rest_framework.test import APIClient
+from rest_framework.test import APIClient, APIRequestFactory
 from rest_framework import status
 
+from core.executor import Saturated
+from user import hashing
+from user.views import CreateTokenView
+
 CREATE_USER_URL = reverse('user:create')
 TOKEN_URL = reverse('user:token')
 ME_URL = reverse('user:me')
@@ -84,6 +93,61 @@ class PublicUserApiTests(TestCase):
         self.assertNotIn('token', response.data)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_create_token_hashes_on_pool(self):
+        '''test that the password check runs on the hashing pool'''
+        payload = {'email': 'test@gmail.com', 'password': 'test123'}
+        create_user(**payload)
+        completed = hashing.executor.stats()['completed']
+        response = self.client.post(TOKEN_URL, payload)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(hashing.executor.stats()['completed'], completed + 1)
+
+    def test_create_token_rejected_when_hashing_saturated(self):
+        '''test that logins get 429 while the hashing pool is full'''
+        payload = {'email': 'test@gmail.com', 'password': 'test123'}
+        create_user(**payload)
+        with patch.object(hashing.executor, 'submit', side_effect=Saturated):
+            response = self.client.post(TOKEN_URL, payload)
+
+        self.assertEqual(
+            response.status_code, status.HTTP_429_TOO_MANY_REQUESTS
+        )
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertNotIn('token', response.data)
+
+    def test_create_token_frees_sync_thread_while_hashing(self):
+        '''test that sync work goes on while a login waits for its hash'''
+        payload = {'email': 'test@gmail.com', 'password': 'test123'}
+        create_user(**payload)
+        request = APIRequestFactory().post(TOKEN_URL, payload, format='json')
+        hashing_started = threading.Event()
+        release = threading.Event()
+        check_password = hashers.check_password
+
+        def slow_check(*args, **kwargs):
+            hashing_started.set()
+            release.wait(5)
+            return check_password(*args, **kwargs)
+
+        async def login_and_wait():
+            login = asyncio.ensure_future(CreateTokenView.as_view()(request))
+            loop = asyncio.get_event_loop()
+            self.assertTrue(
+                await loop.run_in_executor(None, hashing_started.wait, 5)
+            )
+            # runs on the sync thread, which the login is not holding
+            other = await sync_to_async(get_user_model().objects.count)()
+            release.set()
+            return other, await login
+
+        with patch.object(hashers, 'check_password', slow_check):
+            other, response = async_to_sync(login_and_wait)()
+
+        self.assertEqual(other, 1)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('token', response.data)
+
     def test_create_token_missing_fields(self):
         '''test that email and password are required'''
         response = self.client.post(TOKEN_URL,
@@ -1,8 +1,15 @@
 # from django.shortcuts import render
-from rest_framework import generics, authentication, permissions
+from asgiref.sync import sync_to_async
+from rest_framework import generics, permissions
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import Throttled, ValidationError
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
 
+from core.executor import Saturated
+from user.authentication import CachedTokenAuthentication
+from user.backends import HashingModelBackend
 from user.serializers import UserSerializer, AuthTokenSerializer
 
 
@@ -12,15 +19,84 @@ class CreateUserView(generics.CreateAPIView):
 
 
 class CreateTokenView(ObtainAuthToken):
-    '''create new auth token for user'''
+    '''
+    create new auth token for user
+
+    served as a coroutine view. the user and token are read on django's
+    sync thread but the password check is awaited on the hashing pool, so
+    under asgi a burst of logins does not hold up the sync views queued
+    behind them on that thread.
+    '''
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    # the request is set up on the event loop, where looking up the
+    # caller's own token would query the database
+    authentication_classes = ()
+    backend = HashingModelBackend()
+    # seconds clients are asked to wait when the hashing pool is full
+    retry_after = 1
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        '''return a coroutine view, see adispatch()'''
+        async def view(request, *args, **kwargs):
+            return await cls(**initkwargs).adispatch(request, *args, **kwargs)
+
+        view.cls = cls
+        view.initkwargs = initkwargs
+        view.csrf_exempt = True
+        return view
+
+    async def adispatch(self, request, *args, **kwargs):
+        '''dispatch() awaiting the post handler'''
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            self.initial(request, *args, **kwargs)
+            method = request.method.lower()
+            if method == 'post':
+                response = await self.post(request, *args, **kwargs)
+            elif method in self.http_method_names and hasattr(self, method):
+                response = getattr(self, method)(request, *args, **kwargs)
+            else:
+                response = self.http_method_not_allowed(request)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(
+            request, response, *args, **kwargs
+        )
+        return self.response
+
+    async def post(self, request, *args, **kwargs):
+        '''log in, or answer 429 while too many logins are in flight'''
+        serializer = self.get_serializer(data=request.data)
+        credentials = serializer.to_internal_value(request.data)
+        try:
+            user = await self.backend.aauthenticate(
+                credentials['email'], credentials['password']
+            )
+        except Saturated:
+            raise Throttled(wait=self.retry_after)
+        if user is None:
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [
+                serializer.error_messages['authentication']
+            ]}, code='authentication')
+
+        token, _created = await sync_to_async(Token.objects.get_or_create)(
+            user=user
+        )
+        return Response({'token': token.key})
 
 
 class ManageUserView(generics.RetrieveUpdateAPIView):
     '''manage the authenticated user'''
     serializer_class = UserSerializer
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
     def get_object(self):